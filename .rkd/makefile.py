@@ -12,6 +12,12 @@ TASKS = [
          ]),
 
     Task(':test', [':py:unittest'], description='Run unit tests'),
+    Task(':benchmark', [':sh', '-c', '''
+        python -m rkd_harbor.benchmark --sizes 10,100,1000 --baseline .rkd/benchmark-baseline.json
+    '''], description='Run performance benchmarks, fail when slower than the baseline'),
+    Task(':benchmark:update-baseline', [':sh', '-c', '''
+        python -m rkd_harbor.benchmark --sizes 10,100,1000 --baseline .rkd/benchmark-baseline.json --update-baseline
+    '''], description='Run performance benchmarks and save results as the new baseline'),
     Task(':docs', [':sh', '-c', ''' set -x
         cd docs
         rm -rf build
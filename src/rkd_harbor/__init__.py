@@ -1,113 +1,68 @@
 import os
-from rkd.api.syntax import TaskDeclaration
 from rkd.api.syntax import TaskAliasDeclaration
 from rkd import main as rkd_main
-from rkd.standardlib.env import GetEnvTask
-from rkd.standardlib.env import SetEnvTask
-from rkd.standardlib.jinja import RenderDirectoryTask
-from rkd.standardlib.jinja import FileRendererTask
-from rkd_cooperative.tasks import CooperativeSyncTask
-from rkd_cooperative.tasks import CooperativeInstallTask
-from rkd_cooperative.tasks import CooperativeSnippetWizardTask
-from rkd_cooperative.tasks import CooperativeSnippetInstallTask
 from rkd import RiotKitDoApplication
-from .tasks.diagnostic import ListContainersTask
-from .tasks.running import StartTask
-from .tasks.running import UpgradeTask
-from .tasks.running import StopTask
-from .tasks.running import StopAndRemoveTask
-from .tasks.running import RestartTask
-from .tasks.running import PullTask
-from .tasks.service import LogsTask
-from .tasks.service import AnalyzeServiceTask
-from .tasks.service import InspectContainerTask
-from .tasks.service import ExecTask
-from .tasks.service import ServiceRemoveTask
-from .tasks.service import GetContainerNameTask
-from .tasks.service import ServiceUpTask
-from .tasks.service import ServiceStopTask
-from .tasks.service import WaitForServiceTask
-from .tasks.listing import ListDefinedServices
-from .tasks.deployment.apply import DeploymentTask
-from .tasks.deployment.ssh import SSHTask
-from .tasks.deployment.syncfiles import UpdateFilesTask
-from .tasks.deployment.apply import CreateExampleDeploymentFileTask
-from .tasks.deployment.vagrant import ManageVagrantTask
-from .tasks.deployment.vault import EditVaultTask
-from .tasks.deployment.vault import EncryptVaultTask
-from .tasks.deployment.vault import EnvEncryptTask
-from .tasks.diagnostic import DumpComposeArguments
-from .tasks.diagnostic import DumpComposeConfigTask
-from .tasks.gateway import ReloadGatewayTask
-from .tasks.gateway import ShowSSLStatusTask
-from .tasks.gateway import ForceReloadSSLTask
-from .tasks.configsmanagement import ListConfigsTask
-from .tasks.configsmanagement import EnableConfigTask
-from .tasks.configsmanagement import DisableConfigTask
-from .tasks.maintenance import MaintenanceOnTask
-from .tasks.maintenance import MaintenanceOffTask
-from .tasks.repositories import FetchRepositoryTask
-from .tasks.repositories import SetPermissionsForWritableDirectoriesTask
-from .tasks.repositories import ListRepositoriesTask
-from .tasks.repositories import FetchAllRepositories
-from .tasks.structure import CreateHarborStructureTask
+from .registry import LazyTaskDeclaration
 
 
 def imports():
     return [
-        TaskDeclaration(ListContainersTask()),
-        TaskDeclaration(StartTask()),
-        TaskDeclaration(UpgradeTask()),
-        TaskDeclaration(StopTask()),
-        TaskDeclaration(StopAndRemoveTask()),
-        TaskDeclaration(ListDefinedServices()),
-        TaskDeclaration(ServiceUpTask()),
-        TaskDeclaration(ServiceStopTask()),
-        TaskDeclaration(WaitForServiceTask()),
-        TaskDeclaration(ServiceRemoveTask()),
-        TaskDeclaration(GetContainerNameTask()),
-        TaskDeclaration(ExecTask()),
-        TaskDeclaration(LogsTask()),
-        TaskDeclaration(AnalyzeServiceTask()),
-        TaskDeclaration(InspectContainerTask()),
-        TaskDeclaration(PullTask()),
-        TaskDeclaration(RestartTask()),
-        TaskDeclaration(ListConfigsTask()),
-        TaskDeclaration(EnableConfigTask()),
-        TaskDeclaration(DisableConfigTask()),
-        TaskDeclaration(DumpComposeArguments()),
-        TaskDeclaration(DumpComposeConfigTask()),
+        LazyTaskDeclaration(':harbor:diagnostic:compose:ps', 'rkd_harbor.tasks.diagnostic.ListContainersTask'),
+        LazyTaskDeclaration(':harbor:start', 'rkd_harbor.tasks.running.StartTask'),
+        LazyTaskDeclaration(':harbor:plan', 'rkd_harbor.tasks.running.PlanTask'),
+        LazyTaskDeclaration(':harbor:upgrade', 'rkd_harbor.tasks.running.UpgradeTask'),
+        LazyTaskDeclaration(':harbor:stop', 'rkd_harbor.tasks.running.StopTask'),
+        LazyTaskDeclaration(':harbor:remove', 'rkd_harbor.tasks.running.StopAndRemoveTask'),
+        LazyTaskDeclaration(':harbor:service:list', 'rkd_harbor.tasks.listing.ListDefinedServices'),
+        LazyTaskDeclaration(':harbor:service:up', 'rkd_harbor.tasks.service.ServiceUpTask'),
+        LazyTaskDeclaration(':harbor:service:stop', 'rkd_harbor.tasks.service.ServiceStopTask'),
+        LazyTaskDeclaration(':harbor:service:wait-for', 'rkd_harbor.tasks.service.WaitForServiceTask'),
+        LazyTaskDeclaration(':harbor:service:rm', 'rkd_harbor.tasks.service.ServiceRemoveTask'),
+        LazyTaskDeclaration(':harbor:service:get-container-name', 'rkd_harbor.tasks.service.GetContainerNameTask'),
+        LazyTaskDeclaration(':harbor:service:exec', 'rkd_harbor.tasks.service.ExecTask'),
+        LazyTaskDeclaration(':harbor:service:logs', 'rkd_harbor.tasks.service.LogsTask'),
+        LazyTaskDeclaration(':harbor:service:report', 'rkd_harbor.tasks.service.AnalyzeServiceTask'),
+        LazyTaskDeclaration(':harbor:service:inspect', 'rkd_harbor.tasks.service.InspectContainerTask'),
+        LazyTaskDeclaration(':harbor:pull', 'rkd_harbor.tasks.running.PullTask'),
+        LazyTaskDeclaration(':harbor:restart', 'rkd_harbor.tasks.running.RestartTask'),
+        LazyTaskDeclaration(':harbor:config:list', 'rkd_harbor.tasks.configsmanagement.ListConfigsTask'),
+        LazyTaskDeclaration(':harbor:config:enable', 'rkd_harbor.tasks.configsmanagement.EnableConfigTask'),
+        LazyTaskDeclaration(':harbor:config:disable', 'rkd_harbor.tasks.configsmanagement.DisableConfigTask'),
+        LazyTaskDeclaration(':harbor:diagnostic:dump-compose-args', 'rkd_harbor.tasks.diagnostic.DumpComposeArguments'),
+        LazyTaskDeclaration(':harbor:diagnostic:compose:config', 'rkd_harbor.tasks.diagnostic.DumpComposeConfigTask'),
 
         # production-related
-        TaskDeclaration(ReloadGatewayTask()),
-        TaskDeclaration(ShowSSLStatusTask()),
-        TaskDeclaration(ForceReloadSSLTask()),
-        TaskDeclaration(MaintenanceOnTask()),
-        TaskDeclaration(MaintenanceOffTask()),
-        TaskDeclaration(DeploymentTask()),
-        TaskDeclaration(SSHTask()),
-        TaskDeclaration(UpdateFilesTask()),
-        TaskDeclaration(CreateExampleDeploymentFileTask()),
-        TaskDeclaration(ManageVagrantTask()),
-        TaskDeclaration(EditVaultTask()),
-        TaskDeclaration(EncryptVaultTask()),
-        TaskDeclaration(EnvEncryptTask()),
+        LazyTaskDeclaration(':harbor:gateway:reload', 'rkd_harbor.tasks.gateway.ReloadGatewayTask'),
+        LazyTaskDeclaration(':harbor:gateway:ssl:status', 'rkd_harbor.tasks.gateway.ShowSSLStatusTask'),
+        LazyTaskDeclaration(':harbor:gateway:ssl:regenerate', 'rkd_harbor.tasks.gateway.ForceReloadSSLTask'),
+        LazyTaskDeclaration(':harbor:maintenance:on', 'rkd_harbor.tasks.maintenance.MaintenanceOnTask'),
+        LazyTaskDeclaration(':harbor:maintenance:off', 'rkd_harbor.tasks.maintenance.MaintenanceOffTask'),
+        LazyTaskDeclaration(':harbor:deployment:apply', 'rkd_harbor.tasks.deployment.apply.DeploymentTask'),
+        LazyTaskDeclaration(':harbor:deployment:ssh', 'rkd_harbor.tasks.deployment.ssh.SSHTask'),
+        LazyTaskDeclaration(':harbor:deployment:files:update', 'rkd_harbor.tasks.deployment.syncfiles.UpdateFilesTask'),
+        LazyTaskDeclaration(':harbor:deployment:create-example',
+                            'rkd_harbor.tasks.deployment.apply.CreateExampleDeploymentFileTask'),
+        LazyTaskDeclaration(':harbor:deployment:vagrant', 'rkd_harbor.tasks.deployment.vagrant.ManageVagrantTask'),
+        LazyTaskDeclaration(':harbor:vault:edit', 'rkd_harbor.tasks.deployment.vault.EditVaultTask'),
+        LazyTaskDeclaration(':harbor:vault:encrypt', 'rkd_harbor.tasks.deployment.vault.EncryptVaultTask'),
+        LazyTaskDeclaration(':harbor:env:encrypt', 'rkd_harbor.tasks.deployment.vault.EnvEncryptTask'),
 
         # git
-        TaskDeclaration(FetchRepositoryTask()),
-        TaskDeclaration(FetchAllRepositories()),
-        TaskDeclaration(SetPermissionsForWritableDirectoriesTask()),
-        TaskDeclaration(ListRepositoriesTask()),
+        LazyTaskDeclaration(':harbor:git:apps:update', 'rkd_harbor.tasks.repositories.FetchRepositoryTask'),
+        LazyTaskDeclaration(':harbor:git:apps:update-all', 'rkd_harbor.tasks.repositories.FetchAllRepositories'),
+        LazyTaskDeclaration(':harbor:git:apps:set-permissions',
+                            'rkd_harbor.tasks.repositories.SetPermissionsForWritableDirectoriesTask'),
+        LazyTaskDeclaration(':harbor:git:apps:list', 'rkd_harbor.tasks.repositories.ListRepositoriesTask'),
 
-        TaskDeclaration(CooperativeSyncTask()),
-        TaskDeclaration(CooperativeInstallTask()),
-        TaskDeclaration(CreateHarborStructureTask()),
-        TaskDeclaration(CooperativeSnippetWizardTask()),
-        TaskDeclaration(CooperativeSnippetInstallTask()),
-        TaskDeclaration(GetEnvTask()),
-        TaskDeclaration(SetEnvTask()),
-        TaskDeclaration(FileRendererTask()),
-        TaskDeclaration(RenderDirectoryTask()),
+        LazyTaskDeclaration(':cooperative:sync', 'rkd_cooperative.tasks.CooperativeSyncTask'),
+        LazyTaskDeclaration(':cooperative:install', 'rkd_cooperative.tasks.CooperativeInstallTask'),
+        LazyTaskDeclaration(':harbor:create:project', 'rkd_harbor.tasks.structure.CreateHarborStructureTask'),
+        LazyTaskDeclaration(':snippet:wizard', 'rkd_cooperative.tasks.CooperativeSnippetWizardTask'),
+        LazyTaskDeclaration(':snippet:install', 'rkd_cooperative.tasks.CooperativeSnippetInstallTask'),
+        LazyTaskDeclaration(':env:get', 'rkd.standardlib.env.GetEnvTask'),
+        LazyTaskDeclaration(':env:set', 'rkd.standardlib.env.SetEnvTask'),
+        LazyTaskDeclaration(':j2:render', 'rkd.standardlib.jinja.FileRendererTask'),
+        LazyTaskDeclaration(':j2:directory-to-directory', 'rkd.standardlib.jinja.RenderDirectoryTask'),
 
         # templates
         TaskAliasDeclaration(':harbor:templates:render',
@@ -0,0 +1,435 @@
+"""
+Performance benchmarks
+
+Measures hot paths of Harbor on generated projects with different number of services. Docker and docker-compose
+are replaced with stand-in scripts - "docker ps" answers with a prepared list of containers, so no docker daemon
+is needed.
+
+Usage:
+    python -m rkd_harbor.benchmark --sizes 10,100,1000 --output results.json --baseline baseline.json
+
+Exits with a non-zero code, when any measurement is slower than the baseline (multiplied by --tolerance).
+Timings are compared relatively to a calibration workload that is measured in the same run, so a baseline recorded
+on a different machine or Python version is scaled to the machine that runs the benchmark.
+The startup measurement (lazily registered tasks against importing all of them) is only reported, not compared.
+On CI it is executed as "rkd :benchmark" against .rkd/benchmark-baseline.json
+(refresh: "rkd :benchmark:update-baseline").
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import platform
+import subprocess
+from time import time
+from datetime import datetime
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from typing import Dict
+from typing import List
+from dotenv import dotenv_values
+from rkd.api.contract import ExecutionContext
+from rkd.api.inputoutput import BufferedSystemIO
+from rkd.api.syntax import TaskDeclaration
+from rkd.api.testing import FunctionalTestingCase
+from .cached_loader import CachedLoader
+from .service import ServiceLocator
+from .service import group_by_priority
+from .tasks.base import COMPOSE_CACHE_PATH
+from .tasks.listing import ListDefinedServices
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_TOLERANCE = 1.5
+MINIMAL_DIFFERENCE = 0.005  # seconds, smaller differences are within a measurement error
+SERVICES_PER_FILE = 10
+PROJECT_NAME = 'bench'
+HARBOR_SOURCES_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+DOCKER_STAND_IN = '''#!/bin/bash
+# docker stand-in used by benchmarks
+case "$1" in
+    ps) cat "%s" ;;
+    inspect) echo "[]" ;;
+    image) echo "[]" ;;
+esac
+'''
+
+COMPOSE_STAND_IN = '''#!/bin/bash
+# docker-compose stand-in used by benchmarks
+[[ "$1" == "version" ]] && echo "1.29.2"
+exit 0
+'''
+
+# "eager" resolves every task - that is what each CLI invocation did, before tasks were registered lazily
+STARTUP_SCRIPT = '''
+import sys
+from rkd_harbor import imports
+from rkd_harbor.registry import LazyTaskDeclaration
+
+for declaration in imports():
+    if isinstance(declaration, LazyTaskDeclaration) \\
+            and (sys.argv[1] == 'eager' or declaration.to_full_name() == ':harbor:service:list'):
+        declaration.get_task_to_execute()
+'''
+
+
+class SyntheticProject(object):
+    """Generates a Harbor project with given number of services, profiles, repositories and running containers"""
+
+    path: str
+    services_count: int
+
+    def __init__(self, path: str, services_count: int):
+        self.path = path
+        self.services_count = services_count
+
+    def create(self):
+        for directory in ['apps/conf', 'apps/conf.dev', 'apps/profile', 'apps/repos-enabled', 'apps/www-data',
+                          'hooks.d', 'bin', '.rkd']:
+            os.makedirs(self.path + '/' + directory, exist_ok=True)
+
+        self._write('.env', 'COMPOSE_PROJECT_NAME=%s\nDOMAIN_SUFFIX=.localhost\nDOCKER_BACKEND=cli\n' % PROJECT_NAME +
+                    'COMPOSE_CONFIG_LOADER=native\nAPP_USER=%s\nAPP_GROUP_ID=%i\n' % (self._get_user(), os.getgid()))
+        self._write('docker-compose.yml', "version: '3.4'\nservices: {}\n")
+
+        for file_num, offset in enumerate(range(0, self.services_count, SERVICES_PER_FILE)):
+            names = range(offset, min(offset + SERVICES_PER_FILE, self.services_count))
+            self._write('apps/conf/apps.group%i.yml' % file_num, self._create_compose_file(names))
+            self._write('apps/repos-enabled/repository%i.sh' % file_num, self._create_repository_config(file_num))
+
+        self._write('apps/profile/frontend.profile.py', 'name.startswith("web_")')
+        self._write('apps/profile/labelled.profile.py', 'service.get("labels", {}).get("org.riotkit.team") == "a"')
+        self._write('apps/profile/frontend_declarative.profile.yml', 'include:\n    - name: "web_*"\n')
+        self._write('apps/profile/labelled_declarative.profile.yml',
+                    'include:\n    - labels: {"org.riotkit.team": "a"}\n')
+        self._write('containers.txt', ''.join(['%s_%s_%i|Up 5 minutes\n' % (PROJECT_NAME, name, num)
+                                               for name, replicas in self.get_service_names().items()
+                                               for num in range(1, replicas + 1)]))
+
+        self._write('bin/docker', DOCKER_STAND_IN % (self.path + '/containers.txt'), executable=True)
+        self._write('bin/docker-compose', COMPOSE_STAND_IN, executable=True)
+
+    def get_service_names(self) -> Dict[str, int]:
+        """Names of generated services with number of replicas"""
+
+        return {self._get_service_name(num): 1 + num % 3 for num in range(0, self.services_count)}
+
+    def get_environment(self) -> Dict[str, str]:
+        """Process environment, in which docker is replaced with the stand-in"""
+
+        env = dict(os.environ)
+        env.update(dotenv_values(self.path + '/.env'))
+        env['PATH'] = self.path + '/bin:' + env.get('PATH', '')
+        env['APPS_PATH'] = self.path + '/apps'
+
+        # measure the same Harbor version, as the one that runs benchmarks
+        env['PYTHONPATH'] = HARBOR_SOURCES_PATH + ':' + env.get('PYTHONPATH', '')
+
+        return env
+
+    def _create_compose_file(self, numbers) -> str:
+        services = {}
+
+        for num in numbers:
+            name = self._get_service_name(num)
+            labels = {
+                'org.riotkit.priority': str(100 + num % 7),
+                'org.riotkit.replicas': str(1 + num % 3),
+                'org.riotkit.team': 'a' if num % 2 else 'b'
+            }
+
+            services[name] = {
+                'image': 'example/%s:1.%i' % (name, num % 10),
+                'environment': {'VIRTUAL_HOST': '%s.localhost,www.%s.localhost' % (name, name)},
+                # both syntax styles of labels are used in real projects
+                'labels': labels if num % 2 else ['%s=%s' % (key, value) for key, value in labels.items()],
+                'ports': ['%i:80' % (10000 + num)]
+            }
+
+        return json.dumps({'version': '3.4', 'services': services}, indent=4)
+
+    @staticmethod
+    def _create_repository_config(num: int) -> str:
+        return ('export GIT_PROTO=https\nexport GIT_SERVER=example.org\nexport GIT_ORG_NAME=benchmark\n' +
+                'export GIT_PROJECT_NAME=repository%i\nexport GIT_PROJECT_DIR=repository%i\n' +
+                'export WRITABLE_DIRS="cache"\n') % (num, num)
+
+    @staticmethod
+    def _get_service_name(num: int) -> str:
+        return ('web_%i' if num % 4 else 'worker_%i') % num
+
+    @staticmethod
+    def _get_user() -> str:
+        return os.getenv('USER') or os.getenv('LOGNAME') or str(os.getuid())
+
+    def _write(self, relative_path: str, content: str, executable: bool = False):
+        with open(self.path + '/' + relative_path, 'w') as f:
+            f.write(content)
+
+        if executable:
+            os.chmod(self.path + '/' + relative_path, 0o755)
+
+
+class Benchmark(object):
+    """Measures Harbor operations on a synthetic project
+
+    Each measurement is repeated, the best and the median time are recorded.
+    """
+
+    project: SyntheticProject
+    repeats: int
+
+    def __init__(self, project: SyntheticProject, repeats: int = 5):
+        self.project = project
+        self.repeats = repeats
+
+    def run(self) -> Dict[str, Dict[str, float]]:
+        with self._inside_project():
+            task, ctx = self._create_task()
+
+            return {
+                'cli_service_list': self.measure(self._run_cli_service_list),
+                'load_services_cold': self.measure(lambda: self._load_services(task, ctx, persistent_cache=False)),
+                'load_services_cached': self.measure(lambda: self._load_services(task, ctx, persistent_cache=True)),
+                'find_matching_services': self.measure(
+                    lambda: self._find_matching_services(task, ctx, ['frontend', 'labelled'])),
+                'find_matching_services_declarative': self.measure(
+                    lambda: self._find_matching_services(task, ctx, ['frontend_declarative', 'labelled_declarative'])),
+                'describe_services': self.measure(lambda: self._describe_services(task, ctx)),
+                'get_created_containers': self.measure(lambda: self._get_created_containers(task, ctx)),
+                'list_services_task': self.measure(lambda: self._run_list_services_task(task, ctx))
+            }
+
+    def measure(self, callback: callable) -> Dict[str, float]:
+        timings = []
+
+        for _ in range(self.repeats):
+            started_at = time()
+            callback()
+            timings.append(time() - started_at)
+
+        return summarize_timings(timings)
+
+    def _run_cli_service_list(self):
+        try:
+            subprocess.check_output([sys.executable, '-m', 'rkd_harbor', ':harbor:service:list'],
+                                    cwd=self.project.path, env=self.project.get_environment(), stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            raise Exception('":harbor:service:list" failed: %s' % e.output.decode('utf-8', errors='replace')) from e
+
+    @staticmethod
+    def _load_services(task: ListDefinedServices, ctx: ExecutionContext, persistent_cache: bool):
+        CachedLoader.clear()
+
+        if not persistent_cache and os.path.isfile(COMPOSE_CACHE_PATH):
+            os.unlink(COMPOSE_CACHE_PATH)
+
+        task.get_services_as_raw_dict(ctx)
+
+    @staticmethod
+    def _find_matching_services(task: ListDefinedServices, ctx: ExecutionContext, profiles: List[str]):
+        services = task.services(ctx)
+
+        for profile in profiles:
+            task.profile_loader(ctx).load_profile(profile).find_matching_services(services)
+
+    @staticmethod
+    def _describe_services(task: ListDefinedServices, ctx: ExecutionContext):
+        """Creates declarations of all services, sorts them and reads fields as listing and planning does"""
+
+        declarations = ServiceLocator(task.get_services_as_raw_dict(ctx)).get_all()
+        declarations.sort(key=lambda declaration: declaration.get_priority_number())
+
+        for group in group_by_priority(declarations):
+            for service in group:
+                for _ in range(3):
+                    service.get_desired_replicas_count()
+                    service.get_domains()
+                    service.get_ports()
+                    service.is_using_maintenance_mode()
+                    service.get_declared_version()
+
+    @staticmethod
+    def _get_created_containers(task: ListDefinedServices, ctx: ExecutionContext):
+        driver = task.containers(ctx)
+        driver.invalidate_snapshot()
+        driver.get_created_containers(only_running=False)
+
+    @staticmethod
+    def _run_list_services_task(task: ListDefinedServices, ctx: ExecutionContext):
+        CachedLoader.clear()
+        task.run(ctx)
+
+    def _create_task(self) -> tuple:
+        task = FunctionalTestingCase.satisfy_task_dependencies(ListDefinedServices(), BufferedSystemIO())
+        ctx = ExecutionContext(TaskDeclaration(task), args={'--profile': '', '--group-by': 'none'},
+                               env=self.project.get_environment())
+
+        task.is_dev_env = True
+        task._execution_context = ctx
+
+        return task, ctx
+
+    @contextmanager
+    def _inside_project(self):
+        previous_cwd = os.getcwd()
+        previous_env = dict(os.environ)
+
+        os.chdir(self.project.path)
+        os.environ.update(self.project.get_environment())
+        CachedLoader.clear()
+
+        try:
+            yield
+        finally:
+            CachedLoader.clear()
+            os.chdir(previous_cwd)
+            os.environ.clear()
+            os.environ.update(previous_env)
+
+
+def summarize_timings(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+
+    return {'best': timings[0], 'median': timings[len(timings) // 2]}
+
+
+def measure_startup(repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """Time of a fresh interpreter resolving ":harbor:service:list" (lazy) and resolving all tasks (eager)
+
+    Both variants are measured alternately, so the machine load affects them equally.
+    """
+
+    timings = {'lazy': [], 'eager': []}
+    env = dict(os.environ, PYTHONPATH=HARBOR_SOURCES_PATH + ':' + os.getenv('PYTHONPATH', ''))
+
+    for _ in range(repeats):
+        for mode in timings.keys():
+            started_at = time()
+            subprocess.check_call([sys.executable, '-c', STARTUP_SCRIPT, mode], env=env)
+            timings[mode].append(time() - started_at)
+
+    return {mode: summarize_timings(values) for mode, values in timings.items()}
+
+
+def calibrate(repeats: int = 5) -> float:
+    """Best time of a fixed workload (serialization and sorting of compose-like data) - a unit of machine speed"""
+
+    services = {'service_%i' % num: {'image': 'example/service:1.%i' % num, 'labels': {'priority': str(num % 7)}}
+                for num in range(2000)}
+    timings = []
+
+    for _ in range(repeats):
+        started_at = time()
+
+        for _ in range(10):
+            parsed = json.loads(json.dumps(services))
+            sorted(parsed.items(), key=lambda item: (item[1]['labels']['priority'], item[0]))
+
+        timings.append(time() - started_at)
+
+    return min(timings)
+
+
+def run_benchmarks(sizes: List[int], repeats: int = 5) -> dict:
+    """Generates a project for each size and measures it. Results are keyed by number of services"""
+
+    results = {}
+
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix='harbor-benchmark-')
+
+        try:
+            project = SyntheticProject(directory, size)
+            project.create()
+            results[str(size)] = Benchmark(project, repeats).run()
+        finally:
+            shutil.rmtree(directory)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'repeats': repeats,
+        'calibration': calibrate(repeats),
+        'startup': measure_startup(repeats),
+        'results': results
+    }
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Lists measurements which best time is slower than the baseline's best time multiplied by tolerance
+
+    Baseline timings are scaled by the ratio of calibration times, when both results contain it.
+    """
+
+    regressions = []
+    scale = 1.0
+
+    if current.get('calibration') and baseline.get('calibration'):
+        scale = current['calibration'] / baseline['calibration']
+
+    for size, measurements in current['results'].items():
+        for name, timing in measurements.items():
+            expected = baseline.get('results', {}).get(size, {}).get(name)
+
+            if expected is None:
+                continue
+
+            expected_best = expected['best'] * scale
+
+            if timing['best'] > expected_best * tolerance and timing['best'] - expected_best > MINIMAL_DIFFERENCE:
+                regressions.append('%s services, %s: %.4fs (baseline: %.4fs, +%.0f%%)' % (
+                    size, name, timing['best'], expected_best, 100 * (timing['best'] - expected_best) / expected_best))
+
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = ArgumentParser(description='Measures Harbor performance on synthetic projects')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma separated numbers of services to generate projects with')
+    parser.add_argument('--repeats', type=int, default=5, help='How many times each measurement is repeated')
+    parser.add_argument('--output', default='', help='Path to a JSON file where to write results')
+    parser.add_argument('--baseline', default='', help='JSON file with results to compare with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown factor against the baseline (default: %.1f)' % DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks([int(size) for size in args.sizes.split(',')], args.repeats)
+
+    for size, measurements in results['results'].items():
+        for name, timing in measurements.items():
+            print('%6s services  %-24s best: %.4fs  median: %.4fs' % (size, name, timing['best'], timing['median']))
+
+    startup = results['startup']
+    print('Startup of ":harbor:service:list": %.4fs, with all tasks imported: %.4fs (%.0f%% less)' % (
+        startup['lazy']['best'], startup['eager']['best'],
+        100 * (startup['eager']['best'] - startup['lazy']['best']) / startup['eager']['best']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+
+        return 0
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print('SLOWER THAN BASELINE: %s' % regression)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,13 @@
+import os
+import re
+import json
+import yaml
+from hashlib import sha256
+from typing import List
+from typing import Optional
+from .merger import YamlLoader
+
+ENV_REFERENCE_PATTERN = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
 
 
 class CachedLoader(object):
@@ -17,3 +27,188 @@ class CachedLoader(object):
     @classmethod
     def clear(cls):
         cls.items = {}
+
+
+class PersistentComposeCache(object):
+    """Keeps merged docker-compose definition on disk between Harbor invocations
+
+    Cached definition is valid as long as the list of YAML files, their modification times and sizes,
+    values of environment variables referenced in those YAML files, and files referenced by "env_file" and "extends"
+    did not change.
+    """
+
+    path: str
+    project_dir: Optional[str]
+
+    def __init__(self, path: str, project_dir: Optional[str] = None):
+        self.path = path
+        self.project_dir = project_dir  # docker-compose --project-directory, current working directory by default
+
+    def load(self, files: List[str], extra: dict, loader: callable) -> dict:
+        """Returns cached definition, or calls the loader and stores its result when cache is outdated
+
+        Args:
+            files: List of YAML files that are building the definition
+            extra: Any other JSON-serializable values that have impact on the result (eg. project name)
+            loader: Callback that produces a fresh definition
+        """
+
+        fingerprint = self.create_fingerprint(files, extra)
+
+        if fingerprint is None:
+            return loader()
+
+        cached = self._read()
+
+        if cached and cached.get('fingerprint') == fingerprint and self._variables_are_same(cached['variables']) \
+                and self.stat_files(cached.get('referenced_files', {}).keys()) == cached.get('referenced_files'):
+            return cached['definition']
+
+        # taken before loading, so a file modified during loading invalidates the cache next time
+        referenced_files = self.collect_referenced_files(files, self.project_dir or os.getcwd())
+        referenced_stats = self.stat_files(referenced_files) if referenced_files is not None else None
+        definition = loader()
+
+        # paths built from variables cannot be resolved there, such definitions are not cached
+        if referenced_stats is None:
+            self.clear()
+            return definition
+
+        self._write({
+            'fingerprint': fingerprint,
+            'variables': self.collect_referenced_variables(files),
+            'referenced_files': referenced_stats,
+            'definition': definition
+        })
+
+        return definition
+
+    @staticmethod
+    def create_fingerprint(files: List[str], extra: dict) -> Optional[str]:
+        """Creates a checksum of files list, files modification times and sizes"""
+
+        stats = []
+
+        for path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+
+            stats.append([path, stat.st_mtime_ns, stat.st_size])
+
+        return sha256(json.dumps([stats, extra], sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def collect_referenced_files(files: List[str], project_dir: str) -> Optional[List[str]]:
+        """Finds files referenced by "env_file" and "extends" (also in extended files). None when cannot be resolved
+
+        As in docker-compose: paths in the files passed with "-f" are relative to the project directory,
+        paths in extended files are relative to the extended file
+        """
+
+        referenced = []
+        queue = [(path, project_dir) for path in files if path.endswith(('.yml', '.yaml'))]
+        visited = set()
+
+        while queue:
+            path, base_dir = queue.pop(0)
+
+            if path in visited:
+                continue
+
+            visited.add(path)
+
+            try:
+                with open(path, 'r') as f:
+                    content = yaml.load(f, YamlLoader) or {}
+
+            except (OSError, yaml.YAMLError):
+                return None
+
+            services = content.get('services') if isinstance(content, dict) else None
+
+            for service in (services or {}).values():
+                service = service if isinstance(service, dict) else {}
+                env_files = service.get('env_file') or []
+                extends = service.get('extends') if isinstance(service.get('extends'), dict) else {}
+
+                for reference in (env_files if isinstance(env_files, list) else [env_files]) + \
+                        ([extends['file']] if extends.get('file') else []):
+
+                    if '$' in str(reference):
+                        return None
+
+                    resolved = os.path.normpath(os.path.join(base_dir, str(reference)))
+                    referenced.append(resolved)
+
+                    if resolved.endswith(('.yml', '.yaml')):
+                        queue.append((resolved, os.path.dirname(resolved)))
+
+        return sorted(set(referenced))
+
+    @staticmethod
+    def stat_files(paths) -> dict:
+        """Modification times and sizes of files (None for not existing files)"""
+
+        stats = {}
+
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stats[path] = [stat.st_mtime_ns, stat.st_size]
+
+            except OSError:
+                stats[path] = None
+
+        return stats
+
+    @staticmethod
+    def collect_referenced_variables(files: List[str]) -> dict:
+        """Finds all ${VARIABLES} used in YAML files, and takes their current values"""
+
+        variables = {}
+
+        for path in files:
+            with open(path, 'r') as f:
+                for name in ENV_REFERENCE_PATTERN.findall(f.read()):
+                    variables[name] = os.getenv(name)
+
+        return variables
+
+    @staticmethod
+    def _variables_are_same(variables: dict) -> bool:
+        for name, value in variables.items():
+            if os.getenv(name) != value:
+                return False
+
+        return True
+
+    def clear(self):
+        if os.path.isfile(self.path):
+            os.unlink(self.path)
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, content: dict):
+        """Writes the cache file atomically. Cache is optional, so any write errors are ignored"""
+
+        tmp_path = '%s.%i.tmp' % (self.path, os.getpid())
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with open(tmp_path, 'w') as f:
+                json.dump(content, f)
+
+            os.replace(tmp_path, self.path)
+
+        except (OSError, TypeError, ValueError):
+            if os.path.isfile(tmp_path):
+                os.unlink(tmp_path)
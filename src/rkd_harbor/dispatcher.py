@@ -0,0 +1,192 @@
+"""
+Nested tasks dispatching
+
+Harbor tasks are often composed of other Harbor tasks (eg. :harbor:start calls :harbor:service:up for each service).
+Instead of spawning a new RKD process for each nested call, the Harbor tasks are executed in the same Python process,
+sharing loaded docker-compose definition, services and containers state (CachedLoader).
+
+Tasks that are not Harbor tasks, or Harbor tasks requiring isolation are still executed in a subprocess.
+"""
+
+import threading
+from io import StringIO
+from typing import Dict
+from typing import List
+from typing import Optional
+from subprocess import CalledProcessError
+from rkd.api.contract import ExecutionContext
+from rkd.api.contract import TaskInterface
+from rkd.api.inputoutput import IO
+from rkd.api.inputoutput import output_formatted_exception
+from rkd.api.syntax import TaskDeclaration
+from rkd.argparsing import CommandlineParsingHelper
+from rkd.argparsing import TaskArguments
+from .interface import HarborTaskInterface
+
+SHELL_SPECIAL_CHARACTERS = ['"', "'", '$', '`', '|', '&', ';', '<', '>', '(', ')', '*', '?', '\\', ' ', '\n']
+STDERR_TO_STDOUT = '2>&1'
+IGNORED_GLOBAL_ARGS = ['--no-ui']
+
+_declarations: Optional[Dict[str, TaskDeclaration]] = None
+
+
+def get_harbor_task_declarations() -> Dict[str, TaskDeclaration]:
+    """Task declarations indexed by full name (loaded once per process). Tasks are created on first use"""
+
+    global _declarations
+
+    if _declarations is None:
+        from . import imports
+
+        _declarations = {}
+
+        for declaration in imports():
+            if isinstance(declaration, TaskDeclaration):
+                _declarations[declaration.to_full_name()] = declaration
+
+    return _declarations
+
+
+class InProcessDispatcher(object):
+    """Executes tasks given in RKD commandline syntax, Harbor tasks in-process, other tasks in a subprocess"""
+
+    scope: HarborTaskInterface
+    ctx: ExecutionContext
+
+    def __init__(self, scope: HarborTaskInterface, ctx: ExecutionContext):
+        self.scope = scope
+        self.ctx = ctx
+
+    def dispatch(self, args: list, subprocess_fallback: callable, capture: bool = False) -> Optional[str]:
+        """Executes tasks one-by-one, stops on first failure raising CalledProcessError (same as RKD subprocess)
+
+        Args:
+            args: RKD commandline arguments, eg. [':harbor:service:up', 'website', '--strategy=rolling']
+            subprocess_fallback: Callback(args, capture) that executes tasks in a subprocess
+            capture: Return the output instead of printing
+        """
+
+        args = [str(arg).strip() for arg in args if str(arg).strip()]
+
+        if not self.can_dispatch_in_process(args):
+            return subprocess_fallback(args, capture)
+
+        outputs = []
+        redirection = [STDERR_TO_STDOUT] if STDERR_TO_STDOUT in args else []
+
+        for task_args in CommandlineParsingHelper.create_grouped_arguments(self._strip_global_args(args)):
+            if self._find_declaration(task_args.name()) is None:
+                outputs.append(subprocess_fallback([task_args.name()] + task_args.args() + redirection, capture))
+                continue
+
+            outputs.append(self._execute(task_args, capture))
+
+        return ''.join([output or '' for output in outputs]) if capture else None
+
+    def can_dispatch_in_process(self, args: List[str]) -> bool:
+        # sys.stdout is replaced when capturing the output, that can't be done safely from multiple threads
+        if threading.current_thread() is not threading.main_thread():
+            return False
+
+        for arg in args:
+            if arg == STDERR_TO_STDOUT:
+                continue
+
+            # shell syntax (quoting, variables, redirections) needs a real shell
+            if any(character in arg for character in SHELL_SPECIAL_CHARACTERS):
+                return False
+
+        # global switches (eg. --imports) may change the set of available tasks
+        for arg in self._get_global_args(args):
+            if arg not in IGNORED_GLOBAL_ARGS:
+                return False
+
+        return CommandlineParsingHelper.has_any_task(args)
+
+    @staticmethod
+    def _find_declaration(name: str) -> Optional[TaskDeclaration]:
+        declaration = get_harbor_task_declarations().get(name)
+
+        if declaration is None:
+            return None
+
+        task = declaration.get_task_to_execute()
+
+        if not isinstance(task, HarborTaskInterface) or not task.can_be_dispatched_in_process():
+            return None
+
+        return declaration
+
+    def _execute(self, task_args: TaskArguments, capture: bool) -> Optional[str]:
+        declaration = self._find_declaration(task_args.name())
+        commandline = ' '.join([task_args.name()] + task_args.args())
+        task: TaskInterface = declaration.get_task_to_execute().__class__()
+        declaration = TaskDeclaration(task)
+
+        try:
+            parsed_args, defined_args = CommandlineParsingHelper.parse(declaration, task_args.args())
+        except SystemExit as e:
+            raise CalledProcessError(e.code if isinstance(e.code, int) else 2, commandline)
+
+        io = self._create_io(parsed_args)
+        task.internal_inject_dependencies(io, self.scope._ctx, self.scope._executor, self.scope.temp)
+        self.scope.io().debug('Executing "%s" in-process' % commandline)
+
+        stream = StringIO()
+        result = False
+
+        try:
+            if capture:
+                with io.capture_descriptors(stream=stream, enable_standard_out=False):
+                    result = task.execute(self._create_context(declaration, parsed_args, defined_args))
+            else:
+                result = task.execute(self._create_context(declaration, parsed_args, defined_args))
+
+        except Exception as e:
+            output_formatted_exception(e, task.get_full_name(), io)
+            raise CalledProcessError(1, commandline, output=stream.getvalue().encode('utf-8')) from e
+
+        if result is not True:
+            raise CalledProcessError(1, commandline, output=stream.getvalue().encode('utf-8'))
+
+        return stream.getvalue() if capture else None
+
+    def _create_io(self, parsed_args: dict) -> IO:
+        parent_io = self.scope.io()
+
+        if not parsed_args.get('log_level') and not parsed_args.get('silent'):
+            return parent_io
+
+        io = IO()
+        io.set_log_level(parsed_args['log_level'] if parsed_args.get('log_level') else parent_io.get_log_level())
+
+        if parsed_args.get('silent'):
+            io.silent = True
+        else:
+            io.inherit_silent(parent_io)
+
+        return io
+
+    def _create_context(self, declaration: TaskDeclaration, parsed_args: dict, defined_args: dict) -> ExecutionContext:
+        return ExecutionContext(
+            declaration=declaration,
+            parent=None,
+            args=parsed_args,
+            env=dict(self.ctx.env),
+            defined_args=defined_args
+        )
+
+    @staticmethod
+    def _get_global_args(args: List[str]) -> List[str]:
+        global_args = []
+
+        for arg in args:
+            if arg.startswith(':') or arg.startswith('@'):
+                break
+
+            global_args.append(arg)
+
+        return global_args
+
+    def _strip_global_args(self, args: List[str]) -> List[str]:
+        return [arg for arg in args[len(self._get_global_args(args)):] if arg != STDERR_TO_STDOUT]
@@ -0,0 +1,275 @@
+"""
+Docker Engine API client
+
+Talks to the docker daemon directly through a unix socket. One HTTP/1.1 keep-alive connection is reused
+for all requests, so there is no "docker" CLI process spawned per each query. The client can be shared between
+threads - requests on the persistent connection are serialized.
+"""
+
+import socket
+import threading
+from json import dumps as json_dumps
+from json import loads as json_loads
+from struct import unpack_from
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from urllib.parse import quote
+from urllib.parse import urlencode
+from http.client import HTTPConnection
+from http.client import HTTPException
+from .exception import DockerApiException
+
+DEFAULT_SOCKET_PATH = '/var/run/docker.sock'
+STREAM_HEADER_SIZE = 8
+
+
+class UnixSocketHTTPConnection(HTTPConnection):
+    """HTTP connection over a unix socket instead of TCP"""
+
+    socket_path: str
+
+    def __init__(self, socket_path: str, timeout: int = 60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+
+        self.sock = sock
+
+
+class DockerEngineClient(object):
+    """Minimal Docker Engine API client, covering only operations used by Harbor"""
+
+    socket_path: str
+    requests_count: int
+    _connection: Optional[UnixSocketHTTPConnection]
+    _lock: threading.RLock
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: int = 60):
+        self.socket_path = socket_path
+        self.requests_count = 0
+        self._timeout = timeout
+        self._connection = None
+        self._lock = threading.RLock()  # one request-response exchange at a time on the persistent connection
+
+    def list_containers(self, all_containers: bool = True, label: Optional[str] = None) -> List[dict]:
+        """Equivalent of "docker ps [-a] [--filter label=...]" """
+
+        query = {'all': int(all_containers)}
+
+        if label:
+            query['filters'] = json_dumps({'label': [label]})
+
+        return json_loads(self.request('GET', '/containers/json', query))
+
+    def inspect_container(self, name: str) -> dict:
+        """Equivalent of "docker inspect" """
+
+        return json_loads(self.request('GET', '/containers/%s/json' % quote(name)))
+
+    def inspect_image(self, name: str) -> dict:
+        """Equivalent of "docker image inspect" """
+
+        return json_loads(self.request('GET', '/images/%s/json' % quote(name)))
+
+    def get_logs(self, name: str) -> str:
+        """Equivalent of "docker logs 2>&1" - stdout and stderr are returned together"""
+
+        body = self.request('GET', '/containers/%s/logs' % quote(name), {'stdout': 1, 'stderr': 1})
+        demultiplexed = demultiplex_stream(body)
+
+        return (demultiplexed if demultiplexed is not None else body).decode('utf-8', errors='replace')
+
+    def remove_container(self, name: str, force: bool = True):
+        """Equivalent of "docker rm -f" """
+
+        self.request('DELETE', '/containers/%s' % quote(name), {'force': int(force)})
+
+    def stream_events(self, filters: Dict[str, List[str]]) -> 'DockerEventStream':
+        """Subscribes to "docker events" """
+
+        return DockerEventStream(*self._open_stream('/events', {'filters': json_dumps(filters)}))
+
+    def follow_logs(self, name: str, since: Optional[int] = None) -> 'DockerLogStream':
+        """Equivalent of "docker logs --follow [--since] 2>&1" """
+
+        is_tty = bool(self.inspect_container(name).get('Config', {}).get('Tty'))
+        query = {'follow': 1, 'stdout': 1, 'stderr': 1}
+
+        if since is not None:
+            query['since'] = since
+
+        return DockerLogStream(*self._open_stream('/containers/%s/logs' % quote(name), query), is_tty=is_tty)
+
+    def _open_stream(self, path: str, query: dict) -> tuple:
+        """Opens an endless response on a separate connection (the persistent connection stays free for other calls)"""
+
+        connection = UnixSocketHTTPConnection(self.socket_path, timeout=None)
+
+        try:
+            connection.request('GET', path + '?' + urlencode(query))
+            response = connection.getresponse()
+
+        except (ConnectionError, HTTPException, OSError) as e:
+            connection.close()
+            raise DockerApiException('GET', path, 0, str(e)) from e
+
+        if response.status >= 400:
+            body = response.read()
+            connection.close()
+            raise DockerApiException('GET', path, response.status, self._extract_error_message(body))
+
+        with self._lock:
+            self.requests_count += 1
+
+        return connection, response
+
+    def request(self, method: str, path: str, query: Optional[dict] = None) -> bytes:
+        """Sends a request using a persistent connection. Reconnects once, when the connection was closed by peer"""
+
+        url = path + ('?' + urlencode(query) if query else '')
+
+        with self._lock:
+            for attempt in [1, 2]:
+                connection = self._get_connection()
+
+                try:
+                    connection.request(method, url)
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+
+                except (ConnectionError, HTTPException, socket.timeout) as e:
+                    self.close()
+
+                    if attempt == 2 or isinstance(e, socket.timeout):
+                        raise DockerApiException(method, path, 0, str(e)) from e
+
+            self.requests_count += 1
+
+        if response.status >= 400:
+            raise DockerApiException(method, path, response.status, self._extract_error_message(body))
+
+        return body
+
+    def close(self):
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def _get_connection(self) -> UnixSocketHTTPConnection:
+        if not self._connection:
+            self._connection = UnixSocketHTTPConnection(self.socket_path, timeout=self._timeout)
+
+        return self._connection
+
+    @staticmethod
+    def _extract_error_message(body: bytes) -> str:
+        try:
+            return json_loads(body)['message']
+        except (ValueError, KeyError, TypeError):
+            return body.decode('utf-8', errors='replace')
+
+
+class StreamingResponse(object):
+    """Endless response read in parts. Iteration ends when the stream is closed"""
+
+    def __init__(self, connection: HTTPConnection, response):
+        self._connection = connection
+        self._response = response
+
+    def close(self):
+        try:
+            self._connection.sock.shutdown(socket.SHUT_RDWR) if self._connection.sock else None
+        except OSError:
+            pass
+
+        self._connection.close()
+
+
+class DockerEventStream(StreamingResponse):
+    """Stream of docker events (one JSON document per line)"""
+
+    def __iter__(self) -> Iterator[dict]:
+        try:
+            for line in self._response:
+                if line.strip():
+                    yield json_loads(line)
+
+        except (OSError, ValueError, HTTPException, AttributeError):
+            return
+
+
+class DockerLogStream(StreamingResponse):
+    """Followed container output, yields chunks of bytes (stdout and stderr together)"""
+
+    def __init__(self, connection: HTTPConnection, response, is_tty: bool):
+        super().__init__(connection, response)
+        self._is_tty = is_tty
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            while True:
+                if self._is_tty:
+                    chunk = self._response.read1(65536)
+                else:
+                    chunk = self._read_frame()
+
+                if not chunk:
+                    return
+
+                yield chunk
+
+        except (OSError, ValueError, HTTPException, AttributeError):
+            return
+
+    def _read_frame(self) -> bytes:
+        """Reads one frame of multiplexed stdout/stderr stream"""
+
+        while True:
+            header = self._response.read(STREAM_HEADER_SIZE)
+
+            if len(header) < STREAM_HEADER_SIZE:
+                return b''
+
+            size = unpack_from('>L', header, 4)[0]
+
+            if size:
+                return self._response.read(size)
+
+
+def demultiplex_stream(body: bytes) -> Optional[bytes]:
+    """Joins frames of a multiplexed stdout/stderr stream (used by containers without TTY)
+
+    Each frame is prefixed with 8 bytes header: [STREAM_TYPE, 0, 0, 0, SIZE1, SIZE2, SIZE3, SIZE4]
+
+    Returns:
+        Joined payload, or None when the body is not a multiplexed stream (container allocated a TTY)
+    """
+
+    output = []
+    position = 0
+
+    while position < len(body):
+        if len(body) - position < STREAM_HEADER_SIZE:
+            return None
+
+        stream_type, zero1, zero2, zero3, size = unpack_from('>BBBBL', body, position)
+
+        if stream_type not in (0, 1, 2) or zero1 or zero2 or zero3:
+            return None
+
+        position += STREAM_HEADER_SIZE
+        output.append(body[position:position + size])
+        position += size
+
+    if position != len(body):
+        return None
+
+    return b''.join(output)
@@ -0,0 +1,266 @@
+"""
+Docker backends - ways of querying the docker daemon
+
+    cli: Spawns "docker" binary (works with any DOCKER_HOST, including remote TCP hosts)
+    api: Talks to the Docker Engine API through a unix socket using one persistent connection
+"""
+
+import os
+import stat
+import subprocess
+from abc import ABC
+from abc import abstractmethod
+from json import loads as json_loads
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from .interface import HarborTaskInterface
+from .docker_api import DockerEngineClient
+from .docker_api import DEFAULT_SOCKET_PATH
+from .exception import DockerApiException
+
+
+class DockerBackend(ABC):
+    @abstractmethod
+    def list_containers(self, all_containers: bool, label: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Lists containers as pairs of (name, status), where status is eg. "Up 5 minutes" or "Exited (0) ...",
+        optionally only containers having a label (eg. "com.docker.compose.project=env_simple")
+        """
+
+        pass
+
+    @abstractmethod
+    def inspect(self, names: List[str]) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def inspect_image(self, image: str) -> Optional[dict]:
+        """Returns inspection of a locally present image, None when the image is not pulled/built"""
+
+        pass
+
+    def get_image_id(self, image: str) -> Optional[str]:
+        """Returns ID (sha256:...) of a locally present image, None when the image is not pulled/built"""
+
+        return (self.inspect_image(image) or {}).get('Id')
+
+    @abstractmethod
+    def logs(self, name: str) -> str:
+        """Returns stdout and stderr of a container"""
+
+        pass
+
+    @abstractmethod
+    def remove(self, names: List[str]):
+        """Removes containers by force"""
+
+        pass
+
+    @abstractmethod
+    def follow_logs(self, name: str, since: Optional[int] = None):
+        """Follows container output (stdout and stderr). Returns an iterable of bytes chunks, that has a close() method
+
+        Args:
+            name: Container name
+            since: Unix timestamp - skip older logs
+        """
+
+        pass
+
+    @abstractmethod
+    def events(self, filters: Dict[str, List[str]]):
+        """Subscribes to docker events. Returns an iterable of events (dicts), that has a close() method
+
+        Args:
+            filters: Same filters as "docker events --filter" takes, eg. {'container': ['name'], 'event': ['die']}
+        """
+
+        pass
+
+
+class CliLogStream(object):
+    """Output of "docker logs --follow" process, read in chunks as soon as anything is written"""
+
+    def __init__(self, process: subprocess.Popen):
+        self._process = process
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self._process.stdout.read1(65536)
+
+            if not chunk:
+                return
+
+            yield chunk
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.terminate()
+
+        self._process.wait()
+        self._process.stdout.close()
+
+
+class CliEventStream(object):
+    """Docker events read line-by-line from "docker events" process"""
+
+    def __init__(self, process: subprocess.Popen):
+        self._process = process
+
+    def __iter__(self) -> Iterator[dict]:
+        for line in self._process.stdout:
+            try:
+                yield json_loads(line)
+            except ValueError:
+                continue
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.terminate()
+
+        self._process.wait()
+        self._process.stdout.close()
+
+
+class DockerCliBackend(DockerBackend):
+    scope: HarborTaskInterface
+
+    def __init__(self, scope: HarborTaskInterface):
+        self.scope = scope
+
+    def list_containers(self, all_containers: bool, label: Optional[str] = None) -> List[Tuple[str, str]]:
+        out = self.scope.sh('docker ps %s %s --format="{{ .Names }}|{{ .Status }}"' % (
+            '-a' if all_containers else '',
+            '--filter "label=%s"' % label if label else ''
+        ), capture=True)
+        containers = []
+
+        for line in out.strip().split("\n"):
+            try:
+                name, status = line.split('|')
+            except ValueError:
+                continue
+
+            containers.append((name, status))
+
+        return containers
+
+    def inspect(self, names: List[str]) -> List[dict]:
+        out = self.scope.sh('docker inspect %s' % ' '.join(names), capture=True)
+        as_json = json_loads(out)
+
+        if not as_json:
+            raise Exception('Cannot inspect container, unknown docker inspect output: %s' % out)
+
+        return as_json
+
+    def inspect_image(self, image: str) -> Optional[dict]:
+        try:
+            inspected = json_loads(self.scope.sh('docker image inspect "%s" 2>/dev/null' % image, capture=True))
+
+        except subprocess.CalledProcessError:
+            return None
+
+        return inspected[0] if inspected else None
+
+    def logs(self, name: str) -> str:
+        return self.scope.sh('docker logs "%s" 2>&1' % name, capture=True)
+
+    def remove(self, names: List[str]):
+        self.scope.sh('docker rm -f %s' % ' '.join(['"%s"' % name for name in names]))
+
+    def follow_logs(self, name: str, since: Optional[int] = None) -> CliLogStream:
+        args = ['docker', 'logs', '--follow'] + (['--since', str(since)] if since is not None else []) + [name]
+
+        return CliLogStream(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+
+    def events(self, filters: Dict[str, List[str]]) -> CliEventStream:
+        args = ['docker', 'events', '--format', '{{json .}}']
+
+        for name, values in filters.items():
+            for value in values:
+                args += ['--filter', '%s=%s' % (name, value)]
+
+        return CliEventStream(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL))
+
+
+class DockerApiBackend(DockerBackend):
+    client: DockerEngineClient
+
+    def __init__(self, client: DockerEngineClient):
+        self.client = client
+
+    def list_containers(self, all_containers: bool, label: Optional[str] = None) -> List[Tuple[str, str]]:
+        containers = []
+
+        for container in self.client.list_containers(all_containers=all_containers, label=label):
+            for name in container.get('Names') or []:
+                containers.append((name.lstrip('/'), container.get('Status', '')))
+
+        return containers
+
+    def inspect(self, names: List[str]) -> List[dict]:
+        return [self.client.inspect_container(name) for name in names]
+
+    def inspect_image(self, image: str) -> Optional[dict]:
+        try:
+            return self.client.inspect_image(image)
+
+        except DockerApiException as e:
+            if e.status == 404:
+                return None
+
+            raise e
+
+    def logs(self, name: str) -> str:
+        return self.client.get_logs(name)
+
+    def remove(self, names: List[str]):
+        for name in names:
+            self.client.remove_container(name, force=True)
+
+    def follow_logs(self, name: str, since: Optional[int] = None):
+        return self.client.follow_logs(name, since)
+
+    def events(self, filters: Dict[str, List[str]]):
+        return self.client.stream_events(filters)
+
+
+def find_docker_socket(docker_host: str) -> str:
+    """Returns path to the docker socket, or empty string if daemon is not accessible through a local socket"""
+
+    if not docker_host:
+        return DEFAULT_SOCKET_PATH
+
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+
+    return ''
+
+
+def create_docker_backend(scope: HarborTaskInterface, backend_type: str, docker_host: str) -> DockerBackend:
+    """Selects the backend. "auto" prefers the API, when the docker daemon is available through a local socket
+
+    Args:
+        scope: Task
+        backend_type: auto, api or cli
+        docker_host: Value of DOCKER_HOST environment variable
+    """
+
+    if backend_type == 'cli':
+        return DockerCliBackend(scope)
+
+    socket_path = find_docker_socket(docker_host)
+
+    if backend_type == 'api':
+        return DockerApiBackend(DockerEngineClient(socket_path or DEFAULT_SOCKET_PATH))
+
+    try:
+        if socket_path and stat.S_ISSOCK(os.stat(socket_path).st_mode) and os.access(socket_path, os.R_OK | os.W_OK):
+            return DockerApiBackend(DockerEngineClient(socket_path))
+    except OSError:
+        pass
+
+    return DockerCliBackend(scope)
@@ -7,21 +7,41 @@ Interacts directly with Docker and Docker-Compose. In the future it will be poss
 """
 
 import os
-import re
+import glob
+import yaml
 import subprocess
+import threading
+from hashlib import sha256
 from time import time
+from time import sleep
 from contextlib import contextmanager
 from typing import Optional
 from typing import Dict
 from typing import List
 from collections import OrderedDict
-from json import loads as json_loads
 from rkd.api.contract import ExecutionContext
 from .interface import HarborTaskInterface
+from .merger import YamlLoader
 from .service import ServiceDeclaration
+from .service import CONFIG_HASH_LABEL
+from .service import COMPOSE_PROJECT_LABEL
+from .plan import DeploymentPlanner
+from .pull import ImagePullScheduler
+from .pull import PullResult
+from .docker_backend import DockerBackend
+from .docker_backend import create_docker_backend
+from .health import HealthWaiter
+from .timings import timed_call
+from .timings import span
+from .logs import LogMatcher
+from .logs import wait_for_match
 from .exception import ServiceNotReadyException
 from .exception import ServiceNotCreatedException
 
+READ_ONLY_COMPOSE_COMMANDS = ['config', 'ps', 'exec', 'logs', 'images', 'top', 'port', 'pull']
+CONTAINER_CREATING_COMPOSE_COMMANDS = ['up', 'create', 'run', 'scale']
+CONFIG_HASH_OVERRIDE_PATH = './.rkd/cache/config-hash.%s.override.yml'  # named after the content checksum
+
 
 class InspectedContainer(object):
     """Running or stopped container model retrieved from docker inspection"""
@@ -65,6 +85,15 @@ class InspectedContainer(object):
         except KeyError:
             return None
 
+    def get_image_id(self) -> Optional[str]:
+        return self.inspection.get('Image')
+
+    def get_labels(self) -> Dict[str, str]:
+        try:
+            return self.inspection['Config']['Labels'] or {}
+        except KeyError:
+            return {}
+
     def get_start_time(self) -> str:
         return self.inspection['State']['StartedAt'][0:19]
 
@@ -105,31 +134,32 @@ class ComposeDriver(object):
 
     # lazy
     _compose_args: str = None
+    _config_hash_override: Optional[str] = None
+    _docker: Optional[DockerBackend] = None
+
+    # snapshot of containers state, built once and dropped on each operation that changes containers
+    _snapshot: Optional[Dict[str, Dict[int, bool]]]
+    _snapshot_lock: threading.RLock  # snapshot is filled and dropped also from worker threads
+    snapshot_hits: int
+    snapshot_misses: int
 
     def __init__(self, scope: HarborTaskInterface, ctx: ExecutionContext, project_name: str):
         self.scope = scope
         self.project_name = project_name
         self.ctx = ctx
+        self._snapshot = None
+        self._snapshot_lock = threading.RLock()
+        self.snapshot_hits = 0
+        self.snapshot_misses = 0
 
     def get_last_container_name_for_service(self, service_name: str) -> str:
         """Gets full container name of last deployed service (last instance name)
         """
 
+        instances = self._get_snapshot().get(service_name, {})
+        instance_numbers = [num for num, is_up in instances.items() if is_up]
         service_name = self.project_name + '_' + service_name + '_'
 
-        try:
-            ps = self.scope.sh('docker ps --format=\'{{ .Names }}\' | grep "%s"' % service_name, capture=True).split("\n")
-        except subprocess.CalledProcessError:
-            ps = ''
-
-        instance_numbers = []
-
-        for instance in ps:
-            matches = re.findall(service_name + '([0-9]+)', instance)
-
-            if matches:
-                instance_numbers.append(int(matches[0]))
-
         if not instance_numbers:
             raise ServiceNotCreatedException(service_name)
 
@@ -138,25 +168,14 @@ class ComposeDriver(object):
     def inspect_container(self, container_name: str):
         """Inspects a running/stopped container"""
 
-        out = self.scope.sh('docker inspect %s' % container_name, capture=True)
-        as_json = json_loads(out)
-
-        if not as_json:
-            raise Exception('Cannot inspect container, unknown docker inspect output: %s' % out)
-
-        return InspectedContainer(container_name, as_json[0])
+        return InspectedContainer(container_name, self.docker().inspect([container_name])[0])
 
     def inspect_containers(self, names: list):
         """Inspect multiple containers by name at once (does same as inspect_container()
         but has better performance for multiple containers at once)
         """
 
-        out = self.scope.sh('docker inspect %s' % ' '.join(names), capture=True)
-        as_json = json_loads(out)
-
-        if not as_json:
-            raise Exception('Cannot inspect container, unknown docker inspect output: %s' % out)
-
+        as_json = self.docker().inspect(names)
         containers = []
         num = 0
 
@@ -166,32 +185,108 @@ class ComposeDriver(object):
 
         return containers
 
+    #
+    # Containers state snapshot
+    #
+    def _get_snapshot(self) -> Dict[str, Dict[int, bool]]:
+        """Containers of current project indexed by service name and replica number (value: is running)
+
+        Only containers labelled by docker-compose as belonging to the project are considered - a name prefix alone
+        would also match containers of other projects, eg. "env_simple_" prefix matches "env_simple_old" project
+        """
+
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+
+            if snapshot is not None:
+                self.snapshot_hits += 1
+                return snapshot
+
+            self.snapshot_misses += 1
+            prefix = self.project_name + '_'
+            project_label = '%s=%s' % (COMPOSE_PROJECT_LABEL, self.project_name)
+            indexed = {}
+
+            for name, status in self.docker().list_containers(all_containers=True, label=project_label):
+                if not name.startswith(prefix):
+                    continue
+
+                try:
+                    service_name, service_num = name[len(prefix):].rsplit('_', 1)
+                    service_num = int(service_num)
+                except ValueError:
+                    continue
+
+                if service_name not in indexed:
+                    indexed[service_name] = {}
+
+                indexed[service_name][service_num] = status.upper().startswith('UP')
+
+            self._snapshot = indexed
+
+            return indexed
+
+    def invalidate_snapshot(self):
+        """Forgets containers state. To call after any operation that creates, removes, starts or stops containers"""
+
+        with self._snapshot_lock:
+            self._snapshot = None
+
+    def get_snapshot_statistics(self) -> Dict[str, int]:
+        """How many times containers state was served from memory (docker calls saved) and fetched from docker"""
+
+        return {'saved_calls': self.snapshot_hits, 'docker_calls': self.snapshot_misses}
+
     @contextmanager
     def service_discovery_stopped(self):
         """Stops a service discovery for a moment"""
 
-        try:
-            self.scope.io().info('Suspending service discovery')
-            self.compose(['stop', 'gateway_proxy_gen'])
-            yield
-        finally:
-            self.scope.io().info('Starting service discovery')
-            self.compose(['up', '-d', '--no-recreate', 'gateway_proxy_gen'])
+        with span('service discovery pause'):
+            try:
+                self.scope.io().info('Suspending service discovery')
+                self.compose(['stop', 'gateway_proxy_gen'])
+                yield
+            finally:
+                self.scope.io().info('Starting service discovery')
+                self.compose(['up', '-d', '--no-recreate', 'gateway_proxy_gen'])
 
     #
     # Methods to spawn processes in shell
     #
+    def docker(self) -> DockerBackend:
+        """Docker daemon client - Docker Engine API through a unix socket when possible, docker CLI otherwise"""
+
+        if not self._docker:
+            self._docker = create_docker_backend(self.scope, self.ctx.get_env('DOCKER_BACKEND'),
+                                                 self.ctx.get_env('DOCKER_HOST'))
+
+            self.scope.io().debug('Docker backend: %s' % self._docker.__class__.__name__)
+
+        return self._docker
+
     def compose(self, arguments: list, capture: bool = False) -> Optional[str]:
         """Makes a call to docker-compose with all prepared arguments that should be"""
 
+        compose_args = self.get_compose_args()
+
+        # containers are labelled with a hash of their definition, to be able to tell if they are up-to-date
+        if arguments and arguments[0] in CONTAINER_CREATING_COMPOSE_COMMANDS:
+            compose_args += ' -f %s ' % self.get_config_hash_override()
+
         cmd = 'IS_DEBUG_ENVIRONMENT=%s docker-compose %s %s' % (
             self.scope.is_dev_env,
-            self.get_compose_args(),
+            compose_args,
             ' '.join(arguments)
         )
         self.scope.io().debug('Calling compose: %s' % cmd)
 
-        return self.scope.sh(cmd, capture=capture)
+        if arguments and arguments[0] in READ_ONLY_COMPOSE_COMMANDS:
+            return self.scope.sh(cmd, capture=capture)
+
+        try:
+            return self.scope.sh(cmd, capture=capture)
+        finally:
+            self.invalidate_snapshot()
 
     def exec_in_container(self, service_name: str, command: str, instance_num: int = None, capture: bool = True) -> str:
         """Executes a command in given container"""
@@ -218,7 +313,7 @@ class ComposeDriver(object):
         if interactive:
             opts.append('-i')
 
-        return subprocess.call(['docker', 'exec'] + opts + [container_name, shell, '-c', command])
+        return timed_call(['docker', 'exec'] + opts + [container_name, shell, '-c', command])
 
     #
     # Basics - compose arguments present in all commands
@@ -234,6 +329,69 @@ class ComposeDriver(object):
 
         return self._compose_args
 
+    def get_config_hash_override(self) -> str:
+        """Writes a docker-compose override file, that adds a CONFIG_HASH_LABEL to each service
+
+        The override covers all services, so docker-compose sees the same configuration of dependencies
+        regardless of which service is brought up. The file is named after its content and is never modified,
+        so concurrent Harbor processes (eg. :harbor:start --parallel) cannot read a partially written file.
+        Override files of previous definitions are removed, when a new one is written.
+        """
+
+        if not self._config_hash_override:
+            services = self.scope.services(self.ctx).get_all()
+            content = yaml.dump({
+                'version': self._get_compose_version(),
+                'services': {
+                    service.get_name(): {'labels': {CONFIG_HASH_LABEL: service.get_config_hash()}}
+                    for service in services
+                }
+            })
+
+            path = CONFIG_HASH_OVERRIDE_PATH % sha256(content.encode('utf-8')).hexdigest()[0:16]
+
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = '%s.%i.tmp' % (path, os.getpid())
+
+                with open(tmp_path, 'w') as f:
+                    f.write(content)
+
+                os.replace(tmp_path, path)
+                self._remove_stale_config_hash_overrides(path)
+
+            self._config_hash_override = path
+
+        return self._config_hash_override
+
+    @staticmethod
+    def _remove_stale_config_hash_overrides(current_path: str):
+        for path in glob.glob(CONFIG_HASH_OVERRIDE_PATH % '*'):
+            if os.path.abspath(path) == os.path.abspath(current_path):
+                continue
+
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _get_compose_version(self) -> str:
+        """Override files are required to have same version as the main file"""
+
+        for path in self.get_compose_files():
+            with open(path, 'rb') as f:
+                version = (yaml.load(f, YamlLoader) or {}).get('version')
+
+            if version:
+                return str(version)
+
+        return '3.4'
+
+    def get_compose_files(self) -> List[str]:
+        """Lists YAML files that are merged into one docker-compose definition"""
+
+        return build_compose_files_list(self.ctx.get_env('APPS_PATH'), is_dev=self.scope.is_dev_env)
+
     def create_compose_arguments(self, src_root: str, is_dev: bool) -> str:
         """Internal method: Builds list of docker-compose arguments
         """
@@ -298,73 +456,120 @@ class ComposeDriver(object):
             Logs in text format
         """
 
-        args = ''
+        container_name = self.find_container_name(service, instance_num)
 
-        if follow:
-            args += ' --follow '
+        if not raw and not follow:
+            return self.docker().logs(container_name)
 
-        command = 'docker logs %s "%s" 2>&1' % (args, self.find_container_name(service, instance_num))
+        command = 'docker logs %s "%s" 2>&1' % ('--follow' if follow else '', container_name)
 
         if raw:
-            subprocess.call(command, shell=True)
+            timed_call(command, shell=True)
             return ''
 
         return self.scope.sh(command, capture=True)
 
     def wait_for_log_message(self, text: str, service: ServiceDeclaration, instance_num: int = None,
-                             timeout: int = 300) -> bool:
+                             timeout: int = 300, regex: bool = False, since: Optional[int] = None) -> bool:
 
         """Waits for a text to appear in docker log
 
+        The log is followed as a stream, only new output is scanned. When the output ends (eg. container was restarted)
+        then it is followed again from the moment it ended.
+
         Args:
             text: Text to wait for
             service: Service declaration
             instance_num: Replica number
             timeout: Timeout in seconds
+            regex: Treat text as a regular expression
+            since: Unix timestamp - look only at logs written after that time (by default: whole log is searched)
 
         Raises:
             ServiceNotReadyException
         """
 
+        container_name = self.find_container_name(service, instance_num)
+        matcher = LogMatcher(text, regex=regex)
         timeout_at = time() + timeout
 
         while time() < timeout_at:
-            logs = self.get_logs(service, instance_num)
-
-            if text in logs:
+            if wait_for_match(self.docker(), container_name, matcher, timeout_at, since=since):
                 return True
 
+            since = int(time())
+            sleep(min(1, max(timeout_at - time(), 0)))
+
         raise ServiceNotReadyException(service.get_name(), text, instance_num)
 
+    def wait_for_health(self, container_names: List[str], timeout: int) -> Dict[str, str]:
+        """Waits until containers are healthy, reacting on docker events. See HealthWaiter for possible results
+
+        Args:
+            container_names: Full container names
+            timeout: Timeout in seconds (shared by all containers)
+
+        Returns:
+            Result per container name
+        """
+
+        return HealthWaiter(self.docker(), self.inspect_containers, self.scope.io()).wait(container_names, timeout)
+
     def rm(self, service: ServiceDeclaration, extra_args: str = '', capture: bool = False):
         self.compose(['rm', '--stop', '--force', service.get_name(), extra_args], capture=capture)
 
-    def kill_older_replica_than(self, service: ServiceDeclaration, project_name: str,
-                                existing_containers: Dict[int, bool],
-                                already_killed: int = 0):
-        """Kill first old replica on the list"""
+    def rm_undeclared(self, service_name: str):
+        """Removes containers of a service that is no longer present in docker-compose definition"""
 
-        instance_index = (already_killed * -1) - 1
-        previous_instance_num = list(existing_containers.items())[instance_index][0]
-        service_full_name = project_name + '_' + service.get_name() + '_' + str(previous_instance_num)
+        self.docker().remove(self.find_all_container_names_for_service(ServiceDeclaration(service_name, {})))
+        self.invalidate_snapshot()
 
-        self.scope.io().debug('Instances: ' + str(list(existing_containers.items())))
-        self.scope.io().debug('Previous instance selector: %i' % instance_index)
+    def kill_older_replicas(self, service: ServiceDeclaration, existing_containers: Dict[int, bool],
+                            already_replaced: int, count: int) -> List[int]:
+        """Kills oldest replicas in one call, leaving newest (already replaced and just created) replicas untouched
 
-        self.scope.io().info('Replica "%s" was spawned, killing older instance' % service_full_name)
-        self.scope.io().info('Killing replica num=%i' % previous_instance_num)
-        self.scope.sh('docker rm -f "%s"' % service_full_name)
+        Args:
+            service: Service declaration
+            existing_containers: Replicas sorted by instance number (eg. result of scale_up())
+            already_replaced: Number of replicas replaced in previous batches
+            count: How many replicas to kill
+
+        Returns:
+            Killed instance numbers
+        """
+
+        instance_numbers = list(existing_containers.keys())
+        older_instances = instance_numbers[0:max(len(instance_numbers) - already_replaced - count, 0)]
+        to_kill = older_instances[0:count]
+
+        if not to_kill:
+            return []
+
+        self.scope.io().info('Killing replicas num=%s' % ', '.join(map(str, to_kill)))
+        self.docker().remove([self.create_container_name(service, num) for num in to_kill])
+        self.invalidate_snapshot()
+
+        return to_kill
 
     def scale_one_up(self, service: ServiceDeclaration) -> Dict[int, bool]:
         """Scale up and return last instance name (docker container name)"""
 
+        return self.scale_up(service, 1)
+
+    def scale_up(self, service: ServiceDeclaration, surge: int) -> Dict[int, bool]:
+        """Scale up by given number of replicas above the desired state, in one docker-compose call
+
+        Returns:
+            All replicas of the service, sorted by instance number (newest are last)
+        """
+
         desired_replicas = service.get_desired_replicas_count()
-        self.scope.io().info('Scaling up to %i' % (desired_replicas + 1))
+        self.scope.io().info('Scaling up to %i' % (desired_replicas + surge))
 
         try:
             self.compose(
                 ['up', '-d', '--no-deps',
-                 '--scale %s=%i' % (service.get_name(), desired_replicas + 1), service.get_name(), '2>&1'],
+                 '--scale %s=%i' % (service.get_name(), desired_replicas + surge), service.get_name(), '2>&1'],
                 capture=True
             )
         except subprocess.CalledProcessError as e:
@@ -400,42 +605,31 @@ class ComposeDriver(object):
     def ps(self, params: list):
         self.compose(['ps'] + params)
 
-    def pull(self, services_names: list):
-        self.compose(['pull'] + services_names)
+    def pull_images(self, services: List[ServiceDeclaration], workers: int = 4, retries: int = 2,
+                    backoff: float = 2.0) -> List[PullResult]:
+        """Pulls images of given services, up to "workers" images at once. Failed pulls are retried with a backoff
 
-    def get_created_containers(self, only_running: bool) -> Dict[str, Dict[int, bool]]:
-        """Gets all running services"""
-
-        # @todo: Cover with a test
-
-        instances = self.scope.sh('docker ps -a --format="{{ .Names }}|{{ .Status }}"', capture=True).strip().split("\n")
-        counted = {}
-
-        for instance in instances:
-            try:
-                name, status = instance.split('|')
-            except ValueError:
-                continue
+        Images pinned to a digest, that are already present are skipped.
+        """
 
-            if not name.startswith(self.project_name + '_'):
-                continue
+        return ImagePullScheduler(self, workers=workers, retries=retries, backoff=backoff).pull(services)
 
-            service_name = name[len(self.project_name + '_'):-2]
-            is_up = status.upper().startswith('UP')
-            service_num = name.split('_')[-1]
+    def is_service_up_to_date(self, service: ServiceDeclaration) -> bool:
+        """Checks if all desired replicas are running, created from current definition and from current local image"""
 
-            if service_name not in counted:
-                counted[service_name] = OrderedDict()
+        instances = self.get_created_containers(only_running=False).get(service.get_name(), {})
 
-            if only_running and not is_up:
-                continue
+        return DeploymentPlanner(self).plan_service(service, instances) is None
 
-            counted[service_name][int(service_num)] = is_up
+    def get_created_containers(self, only_running: bool) -> Dict[str, Dict[int, bool]]:
+        """Gets all running services"""
 
         counted_and_sorted = {}
 
-        for service in counted:
-            counted_and_sorted[service] = OrderedDict(sorted(counted[service].items()))
+        for service_name, instances in self._get_snapshot().items():
+            counted_and_sorted[service_name] = OrderedDict(
+                sorted([(num, is_up) for num, is_up in instances.items() if is_up or not only_running])
+            )
 
         return counted_and_sorted
 
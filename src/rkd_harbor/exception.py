@@ -7,6 +7,11 @@ class ProfileNotFoundException(TaskException):
         super().__init__('"%s" profile not found' % path)
 
 
+class ProfileInvalidException(TaskException):
+    def __init__(self, profile: str, reason: str):
+        super().__init__('"%s" profile is not valid: %s' % (profile, reason))
+
+
 class ServiceNotFoundInYaml(TaskException):
     def __init__(self, name: str):
         super().__init__('Service "%s" not found in any of loaded docker-compose YAMLs' % name)
@@ -43,3 +48,33 @@ class DeploymentException(TaskException):
 class MissingDeploymentConfigurationError(TaskException):
     def __init__(self):
         super().__init__('Deployment not configured - missing deployment.yml or deployment.yaml file')
+
+
+class ComposeMergeNotSupportedException(TaskException):
+    def __init__(self, service_name: str, key: str):
+        super().__init__('Service "%s" uses "%s", which is not supported by Harbor\'s compose merger' % (
+            service_name, key
+        ))
+
+
+class ComposeInterpolationException(TaskException):
+    def __init__(self, expression: str, error: str = ''):
+        super().__init__('Cannot interpolate "%s" in docker-compose YAML. %s' % (expression, error))
+
+
+class DockerApiException(TaskException):
+    status: int
+
+    def __init__(self, method: str, path: str, status: int, message: str):
+        self.status = status
+        super().__init__('Docker API call %s %s failed (status=%i): %s' % (method, path, status, message))
+
+
+class RepositoryConfigNotStaticException(TaskException):
+    def __init__(self, path: str, line_number: int, line: str):
+        super().__init__('"%s" line %i cannot be evaluated without a shell: %s' % (path, line_number, line.strip()))
+
+
+class HookFailedException(TaskException):
+    def __init__(self, hook_name: str, failed: list):
+        super().__init__('Hook "%s" failed: %s' % (hook_name, ', '.join(failed)))
@@ -1,5 +1,11 @@
 # license: MIT (C) tardyp
 import ast
+from hashlib import sha256
+from types import CodeType
+from typing import Dict
+from typing import Iterable
+
+_compiled_expressions: Dict[str, CodeType] = {}
 
 
 def safe_eval(expr, variables):
@@ -9,6 +15,27 @@ def safe_eval(expr, variables):
     Python literal structures: strings, numbers, tuples, lists, dicts, booleans,
     and None. safe operators are allowed (and, or, ==, !=, not, +, -, ^, %, in, is)
     """
+
+    return eval(compile_safe_expression(expr, variables.keys()), variables)
+
+
+def compile_safe_expression(expr: str, variable_names: Iterable[str]) -> CodeType:
+    """
+    Validates the expression (same rules as in safe_eval()) and compiles it into a code object.
+    Compiled expressions are kept in memory by hash of the source and allowed variable names,
+    so the same profile is parsed only once.
+    """
+
+    variable_names = sorted(variable_names)
+    checksum = sha256((expr + '\0' + ','.join(variable_names)).encode('utf-8')).hexdigest()
+
+    if checksum not in _compiled_expressions:
+        _compiled_expressions[checksum] = _validate_and_compile(expr, variable_names)
+
+    return _compiled_expressions[checksum]
+
+
+def _validate_and_compile(expr: str, variable_names: list) -> CodeType:
     _safe_names = {'None': None, 'True': True, 'False': False}
     _safe_nodes = [
         'Add', 'And', 'BinOp', 'BitAnd', 'BitOr', 'BitXor', 'BoolOp',
@@ -23,10 +50,10 @@ def safe_eval(expr, variables):
     for subnode in ast.walk(node):
         subnode_name = type(subnode).__name__
         if isinstance(subnode, ast.Name):
-            if subnode.id not in _safe_names and subnode.id not in variables:
+            if subnode.id not in _safe_names and subnode.id not in variable_names:
                 raise ValueError("Unsafe expression {}. contains {}".format(expr, subnode.id))
         if subnode_name not in _safe_nodes:
             raise ValueError("Unsafe expression {}. contains {}".format(expr, subnode_name))
 
-    return eval(expr, variables)
+    return compile(node, '<expression>', 'eval')
 
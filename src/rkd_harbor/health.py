@@ -0,0 +1,151 @@
+"""
+Waiting for containers to become healthy
+
+Reacts on docker events (health_status, start, die) instead of polling, so the readiness is noticed as soon as
+docker reports it. Multiple containers are watched using one shared events stream.
+"""
+
+from time import time
+from queue import Queue
+from queue import Empty
+from threading import Thread
+from typing import Dict
+from typing import List
+from rkd.api.inputoutput import IO
+from .docker_backend import DockerBackend
+
+WATCHED_EVENTS = ['health_status', 'start', 'die']
+RECHECK_INTERVAL = 5  # re-inspect pending containers in case when any event was missed or events are not available
+
+HEALTHY = 'healthy'
+NO_HEALTH_CHECK = 'no-healthcheck'
+DIED = 'died'
+TIMEOUT = 'timeout'
+
+
+class HealthWaiter(object):
+    """Waits until given containers are healthy
+
+    Results per container:
+        healthy: Health check passed
+        no-healthcheck: Container does not define a health check, so it was not awaited
+        died: Container exited, and it will not be restarted by docker (no restart policy)
+        timeout: Did not became healthy in given time
+    """
+
+    docker: DockerBackend
+    inspect: callable
+    io: IO
+
+    def __init__(self, docker: DockerBackend, inspect: callable, io: IO):
+        """
+        Args:
+            docker: Docker backend, used to subscribe for events
+            inspect: Callback(names) returning a list of InspectedContainer
+            io: Output
+        """
+
+        self.docker = docker
+        self.inspect = inspect
+        self.io = io
+
+    def wait(self, names: List[str], timeout: int) -> Dict[str, str]:
+        results = {}
+        timeout_at = time() + timeout
+        events = Queue()
+
+        # subscribe before inspecting, so no state change could be missed between inspection and subscription
+        stream = self._subscribe(names, events)
+
+        try:
+            pending = self._check_current_state(names, results)
+
+            while pending:
+                remaining = timeout_at - time()
+
+                if remaining <= 0:
+                    break
+
+                try:
+                    event = events.get(timeout=min(remaining, RECHECK_INTERVAL))
+                except Empty:
+                    pending = self._check_current_state(pending, results)
+                    continue
+
+                pending = self._process_event(event, pending, results)
+
+        finally:
+            if stream is not None:
+                stream.close()
+
+        for name in names:
+            results.setdefault(name, TIMEOUT)
+
+        return results
+
+    def _subscribe(self, names: List[str], events: Queue):
+        try:
+            stream = self.docker.events({'type': ['container'], 'container': names, 'event': WATCHED_EVENTS})
+
+        except Exception as e:
+            self.io.debug('Cannot subscribe to docker events, falling back to polling: %s' % str(e))
+            return None
+
+        def read():
+            for event in stream:
+                events.put(event)
+
+        Thread(target=read, daemon=True).start()
+
+        return stream
+
+    def _check_current_state(self, names: List[str], results: Dict[str, str]) -> List[str]:
+        """Inspects containers and returns names of containers that are still not ready"""
+
+        pending = []
+
+        for container in self.inspect(names):
+            if not container.has_health_check():
+                results[container.get_name()] = NO_HEALTH_CHECK
+                continue
+
+            if container.get_health_status() == HEALTHY:
+                results[container.get_name()] = HEALTHY
+                continue
+
+            if self._is_dead(container):
+                results[container.get_name()] = DIED
+                continue
+
+            pending.append(container.get_name())
+
+        return pending
+
+    def _process_event(self, event: dict, pending: List[str], results: Dict[str, str]) -> List[str]:
+        name = event.get('Actor', {}).get('Attributes', {}).get('name', '')
+        action = str(event.get('Action') or event.get('status') or '')
+
+        if name not in pending:
+            return pending
+
+        self.io.debug('Docker event: %s - %s' % (name, action))
+
+        if action == 'health_status: healthy':
+            results[name] = HEALTHY
+            return [pending_name for pending_name in pending if pending_name != name]
+
+        # container may be restarted by docker, or already was restarted
+        if action == 'die':
+            return [pending_name for pending_name in pending if pending_name != name] + \
+                self._check_current_state([name], results)
+
+        return pending
+
+    @staticmethod
+    def _is_dead(container) -> bool:
+        inspection = container.to_dict()
+        state = inspection.get('State', {})
+        restart_policy = inspection.get('HostConfig', {}).get('RestartPolicy', {}).get('Name', '')
+
+        return state.get('Status') in ['exited', 'dead'] and restart_policy in ['', 'no'] \
+            and not state.get('Restarting', False)
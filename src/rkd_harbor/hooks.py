@@ -0,0 +1,198 @@
+"""
+Hook scripts execution
+
+Scripts in hooks.d/<hook-name>/ are executed in lexical order of their names. A subdirectory forms a parallel group -
+all scripts inside are started at once, at the position of the directory name in the lexical order, and the next
+stage begins when all of them are finished.
+
+    hooks.d/pre-upgrade/10-maintenance-on.sh
+    hooks.d/pre-upgrade/20-prepare/backup-database.sh     (parallel)
+    hooks.d/pre-upgrade/20-prepare/warm-up-cache.sh       (parallel)
+    hooks.d/pre-upgrade/30-check.sh
+
+Scripts are executed directly (not through a shell), scripts without a shebang are interpreted by "bash".
+A script that cannot be executed at all (eg. is missing the executable bit) is reported as failed.
+"""
+
+import os
+import errno
+import signal
+import subprocess
+from time import time
+from threading import Thread
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from typing import Optional
+from rkd.api.inputoutput import IO
+from .timings import CommandTiming
+from .timings import CommandTimings
+from .timings import HOOK
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+
+_output_lock = Lock()
+
+
+class HookResult(object):
+    path: str
+    status: str
+    exit_code: Optional[int]
+    duration: float
+    parallel: bool
+
+    def __init__(self, path: str, parallel: bool = False):
+        self.path = path
+        self.status = FAILED
+        self.exit_code = None
+        self.duration = 0.0
+        self.parallel = parallel
+
+    def is_successful(self) -> bool:
+        return self.status == SUCCEEDED
+
+    def __repr__(self):
+        return 'HookResult<%s %s>' % (self.status, self.path)
+
+
+def is_hidden(name: str) -> bool:
+    return name.split('.')[0] == ''
+
+
+def collect_hook_stages(hooks_dir: str) -> List[List[str]]:
+    """Lists scripts grouped into stages. Stage containing more than one script is executed in parallel"""
+
+    stages = []
+
+    for entry in sorted(os.scandir(hooks_dir), key=lambda item: item.name):
+        entry: os.DirEntry
+
+        if is_hidden(entry.name):
+            continue
+
+        if entry.is_dir():
+            group = [script.path for script in sorted(os.scandir(entry.path), key=lambda item: item.name)
+                     if not is_hidden(script.name) and script.is_file()]
+
+            if group:
+                stages.append(group)
+
+            continue
+
+        stages.append([entry.path])
+
+    return stages
+
+
+class HookRunner(object):
+    """Executes hook scripts stage by stage, stops after a stage that contains a failed script
+
+    Args:
+        io: Output of the scripts is written there
+        timeout: Maximum time in seconds for a single script, 0 means no limit
+        env: Environment variables passed to the scripts
+    """
+
+    def __init__(self, io: IO, timeout: int = 0, env: Optional[dict] = None):
+        self.io = io
+        self.timeout = timeout
+        self.env = env
+
+    def run(self, stages: List[List[str]], on_start: callable = None) -> List[HookResult]:
+        results = []
+
+        for stage in stages:
+            if on_start:
+                on_start(stage)
+
+            if len(stage) == 1:
+                stage_results = [self.run_script(stage[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+                    stage_results = list(executor.map(lambda path: self.run_script(path, parallel=True), stage))
+
+            results += stage_results
+
+            if not all([result.is_successful() for result in stage_results]):
+                break
+
+        return results
+
+    def run_script(self, path: str, parallel: bool = False) -> HookResult:
+        """Output of a script executed in parallel is printed as a block, when the script finishes"""
+
+        result = HookResult(path, parallel)
+        started_at = time()
+        output = []
+
+        try:
+            process = self._spawn(path)
+
+        except OSError as e:
+            output.append('Cannot execute "%s": %s\n' % (path, e.strerror or str(e)))
+            self._record(result, started_at, output)
+            self._write(output)
+
+            return result
+
+        reader = Thread(target=self._read_output, args=(process, output, not parallel), daemon=True)
+        reader.start()
+
+        try:
+            result.exit_code = process.wait(timeout=self.timeout if self.timeout > 0 else None)
+            result.status = SUCCEEDED if result.exit_code == 0 else FAILED
+
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            result.status = TIMED_OUT
+
+        reader.join()
+        result.duration = time() - started_at
+        self._record(result, started_at, output)
+
+        if parallel:
+            self._write(output)
+
+        return result
+
+    def _write(self, output: list):
+        with _output_lock:
+            self.io.out(''.join(output))
+
+    @staticmethod
+    def _record(result: HookResult, started_at: float, output: list):
+        timing = CommandTiming(result.path, HOOK)
+        timing.started_at = started_at
+        timing.duration = result.duration
+        timing.exit_code = result.exit_code if result.status != TIMED_OUT else -1
+        timing.captured_bytes = sum([len(line.encode('utf-8')) for line in output])
+
+        CommandTimings.add(timing)
+
+    def _spawn(self, path: str) -> subprocess.Popen:
+        # a separate process group allows to kill also processes started by the script, when the timeout is reached
+        kwargs = {'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT, 'env': self.env,
+                  'start_new_session': self.timeout > 0}
+
+        try:
+            return subprocess.Popen([path], **kwargs)
+
+        except OSError as e:
+            if e.errno != errno.ENOEXEC:
+                raise
+
+            return subprocess.Popen(['bash', path], **kwargs)
+
+    def _read_output(self, process: subprocess.Popen, output: list, stream: bool):
+        for line in iter(process.stdout.readline, b''):
+            decoded = line.decode('utf-8', errors='replace')
+
+            output.append(decoded)
+
+            if stream:
+                self._write([decoded])
+
+        process.stdout.close()
@@ -1,7 +1,15 @@
 
 from abc import ABC
+from abc import abstractmethod
+from rkd.api.contract import ExecutionContext
 from rkd.api.contract import TaskInterface
 
 
 class HarborTaskInterface(TaskInterface, ABC):
     is_dev_env: bool
+
+    @abstractmethod
+    def services(self, ctx: ExecutionContext):
+        """Returns ServiceLocator with all declared services"""
+
+        pass
@@ -0,0 +1,81 @@
+"""
+Searching in containers output
+
+The output is followed as a stream and only new chunks are scanned, there is no re-downloading of the whole history.
+"""
+
+import re
+from codecs import getincrementaldecoder
+from time import time
+from queue import Queue
+from queue import Empty
+from threading import Thread
+from typing import Optional
+from .docker_backend import DockerBackend
+
+REGEX_BOUNDARY_SIZE = 4096
+
+
+class LogMatcher(object):
+    """Finds a text or a regular expression in chunks of output
+
+    Only the tail of previous chunk is kept (rolling boundary buffer), so a text split between two chunks is found.
+    For plain text the tail has length of the text, for regular expressions it is limited to REGEX_BOUNDARY_SIZE chars.
+    """
+
+    def __init__(self, pattern: str, regex: bool = False, boundary_size: int = REGEX_BOUNDARY_SIZE):
+        self._pattern = pattern
+        self._compiled = re.compile(pattern) if regex else None
+        self._boundary_size = boundary_size if regex else max(len(pattern) - 1, 0)
+        self._tail = ''
+
+    def feed(self, chunk: str) -> bool:
+        window = self._tail + chunk
+        self._tail = window[-self._boundary_size:] if self._boundary_size else ''
+
+        if self._compiled:
+            return self._compiled.search(window) is not None
+
+        return self._pattern in window
+
+
+def wait_for_match(docker: DockerBackend, container_name: str, matcher: LogMatcher, timeout_at: float,
+                   since: Optional[int] = None) -> bool:
+    """Follows the container output until the matcher matches, the timeout is reached or the output ends
+
+    Returns:
+        True if matched, False on timeout or when the output has ended (eg. container stopped)
+    """
+
+    chunks = Queue()
+    stream = docker.follow_logs(container_name, since)
+    decoder = getincrementaldecoder('utf-8')(errors='replace')
+
+    def read():
+        for chunk in stream:
+            chunks.put(chunk)
+
+        chunks.put(None)
+
+    Thread(target=read, daemon=True).start()
+
+    try:
+        while True:
+            remaining = timeout_at - time()
+
+            if remaining <= 0:
+                return False
+
+            try:
+                chunk = chunks.get(timeout=remaining)
+            except Empty:
+                return False
+
+            if chunk is None:
+                return False
+
+            if matcher.feed(decoder.decode(chunk)):
+                return True
+
+    finally:
+        stream.close()
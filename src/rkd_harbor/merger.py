@@ -0,0 +1,277 @@
+"""
+In-process merging of docker-compose YAML files
+
+Produces the same dictionary as "docker-compose config" does (in the scope used by Harbor), but without spawning
+a docker-compose process. Features that are not implemented are reported by raising an exception, so the caller
+can fall back to docker-compose itself.
+"""
+
+import os
+import re
+import yaml
+from typing import Dict
+from typing import List
+from typing import Optional
+from .exception import ComposeMergeNotSupportedException
+from .exception import ComposeInterpolationException
+
+try:
+    YamlLoader = yaml.CSafeLoader
+except AttributeError:
+    YamlLoader = yaml.SafeLoader
+
+INTERPOLATION_PATTERN = re.compile(
+    r'\$(?:(?P<escaped>\$)|(?P<named>[_a-zA-Z][_a-zA-Z0-9]*)|{(?P<braced>[^}]*)})'
+)
+SIMPLE_PORT_PATTERN = re.compile(r'^(?P<published>[0-9]+):(?P<target>[0-9]+)$')
+BRACED_PATTERN = re.compile(r'^(?P<name>[_a-zA-Z][_a-zA-Z0-9]*)(?:(?P<operator>:?[-?])(?P<argument>.*))?$', re.DOTALL)
+
+MAPPING_MERGED_KEYS = ['environment', 'labels', 'extra_hosts', 'sysctls', 'ulimits', 'build', 'logging',
+                       'healthcheck', 'deploy']
+PATH_MERGED_KEYS = ['volumes', 'devices']
+CONCATENATED_KEYS = ['ports', 'expose', 'external_links', 'dns', 'dns_search', 'tmpfs']
+NAME_MERGED_KEYS = {  # list or mapping syntax, value of a list entry when converted to a mapping
+    'depends_on': {'condition': 'service_started'},
+    'networks': None
+}
+TOP_LEVEL_MAPPINGS = ['services', 'volumes', 'networks', 'secrets', 'configs']
+NOT_SUPPORTED_KEYS = ['extends', 'env_file']
+
+
+class ComposeMerger(object):
+    """Merges multiple docker-compose YAML files into one definition, following docker-compose override rules
+
+    Rules:
+        - environment, labels (and other mappings): merged by key, later files takes precedence
+        - volumes, devices: merged by path inside container
+        - ports, expose, dns (and other multi-value options): concatenated
+        - depends_on, networks: merged by service/network name
+        - links: merged by alias
+        - everything else: replaced by later files
+    """
+
+    _project_dir: str
+    _variables: Dict[str, str]
+
+    def __init__(self, project_dir: str, variables: Dict[str, str]):
+        self._project_dir = project_dir
+        self._variables = variables
+
+    def merge_files(self, files: List[str]) -> dict:
+        documents = []
+
+        for path in files:
+            with open(path, 'rb') as f:
+                documents.append(yaml.load(f, Loader=YamlLoader) or {})
+
+        return self.merge(documents)
+
+    def merge(self, documents: List[dict]) -> dict:
+        merged = {}
+
+        for document in documents:
+            document = self.interpolate(document)
+
+            for key, value in document.items():
+                if key == 'services':
+                    self._merge_services(merged.setdefault('services', {}), value or {})
+
+                elif key in TOP_LEVEL_MAPPINGS:
+                    for name, definition in (value or {}).items():
+                        merged.setdefault(key, {})[name] = definition if definition is not None else {}
+
+                else:
+                    merged[key] = value
+
+        return merged
+
+    def interpolate(self, value):
+        """Replaces ${VARIABLES} in all string values (recursively)"""
+
+        if isinstance(value, str):
+            return INTERPOLATION_PATTERN.sub(self._replace_variable, value)
+
+        if isinstance(value, dict):
+            return {key: self.interpolate(item) for key, item in value.items()}
+
+        if isinstance(value, list):
+            return [self.interpolate(item) for item in value]
+
+        return value
+
+    def _replace_variable(self, match) -> str:
+        if match.group('escaped') is not None:
+            return '$'
+
+        if match.group('named') is not None:
+            return self._variables.get(match.group('named')) or ''
+
+        braced = BRACED_PATTERN.match(match.group('braced'))
+
+        if not braced:
+            raise ComposeInterpolationException(match.group(0))
+
+        name = braced.group('name')
+        operator = braced.group('operator')
+        argument = braced.group('argument')
+        value = self._variables.get(name)
+        is_missing = value is None or (value == '' and operator is not None and operator.startswith(':'))
+
+        if not operator or not is_missing:
+            return value or ''
+
+        if operator.endswith('-'):
+            return argument
+
+        raise ComposeInterpolationException(match.group(0), argument)
+
+    def _merge_services(self, services: dict, overrides: dict):
+        for name, definition in overrides.items():
+            definition = self._normalize_service(name, definition or {})
+
+            if name not in services:
+                services[name] = definition
+                continue
+
+            services[name] = self._merge_service(services[name], definition)
+
+    def _merge_service(self, base: dict, override: dict) -> dict:
+        merged = dict(base)
+
+        for key, value in override.items():
+            if key not in merged:
+                merged[key] = value
+
+            elif key in MAPPING_MERGED_KEYS and isinstance(value, dict) and isinstance(merged[key], dict):
+                merged[key] = {**merged[key], **value}
+
+            elif key in PATH_MERGED_KEYS:
+                by_path = {self._get_mount_target(entry): entry for entry in merged[key]}
+                by_path.update({self._get_mount_target(entry): entry for entry in value})
+                merged[key] = list(by_path.values())
+
+            elif key in CONCATENATED_KEYS:
+                merged[key] = merged[key] + [entry for entry in value if entry not in merged[key]]
+
+            elif key in NAME_MERGED_KEYS:
+                merged[key] = self._merge_by_name(merged[key], value, NAME_MERGED_KEYS[key])
+
+            elif key == 'links':
+                by_alias = {self._get_link_alias(entry): entry for entry in merged[key]}
+                by_alias.update({self._get_link_alias(entry): entry for entry in value})
+                merged[key] = list(by_alias.values())
+
+            else:
+                merged[key] = value
+
+        return merged
+
+    def _normalize_service(self, name: str, definition: dict) -> dict:
+        for key in NOT_SUPPORTED_KEYS:
+            if key in definition:
+                raise ComposeMergeNotSupportedException(name, key)
+
+        normalized = dict(definition)
+
+        if 'environment' in normalized:
+            normalized['environment'] = self._normalize_mapping(normalized['environment'], resolve_empty=True)
+
+        if 'labels' in normalized:
+            normalized['labels'] = {
+                key: value if value is not None else ''
+                for key, value in self._normalize_mapping(normalized['labels']).items()
+            }
+
+        for key in PATH_MERGED_KEYS:
+            if key in normalized:
+                normalized[key] = [self._resolve_host_path(entry) for entry in normalized[key] or []]
+
+        for key in CONCATENATED_KEYS:
+            if key in normalized and not isinstance(normalized[key], list):
+                normalized[key] = [normalized[key]]
+
+        if 'ports' in normalized:
+            normalized['ports'] = [self._normalize_port(entry) for entry in normalized['ports']]
+
+        return normalized
+
+    @staticmethod
+    def _merge_by_name(base, override, list_entry_value):
+        """Merges list-style (names) or mapping-style (name: options) definitions. Lists stay lists when both are lists"""
+
+        if isinstance(base, list) and isinstance(override, list):
+            return base + [name for name in override if name not in base]
+
+        def as_mapping(value) -> dict:
+            if isinstance(value, dict):
+                return value
+
+            return {name: dict(list_entry_value) if isinstance(list_entry_value, dict) else list_entry_value
+                    for name in value or []}
+
+        return {**as_mapping(base), **as_mapping(override)}
+
+    @staticmethod
+    def _get_link_alias(entry) -> str:
+        """Name under which a linked service is available: "db:database" -> database, "db" -> db"""
+
+        return str(entry).split(':')[-1]
+
+    @staticmethod
+    def _normalize_port(entry):
+        """Converts "8000:80" into a long syntax, same as docker-compose does"""
+
+        match = SIMPLE_PORT_PATTERN.match(str(entry))
+
+        if not match:
+            return entry
+
+        return {'published': int(match.group('published')), 'target': int(match.group('target'))}
+
+    def _normalize_mapping(self, value, resolve_empty: bool = False) -> dict:
+        """Converts list-style (KEY=VALUE) and dict-style entries into a dict of strings"""
+
+        if isinstance(value, list):
+            as_dict = {}
+
+            for entry in value:
+                parts = str(entry).split('=', 1)
+                as_dict[parts[0]] = parts[1] if len(parts) == 2 else None
+
+            value = as_dict
+
+        normalized = {}
+
+        for key, item in (value or {}).items():
+            if item is None and resolve_empty:
+                item = self._variables.get(key)
+
+            normalized[str(key)] = str(item) if item is not None else None
+
+        return normalized
+
+    def _resolve_host_path(self, entry):
+        if not isinstance(entry, str):
+            return entry
+
+        parts = entry.split(':')
+
+        if len(parts) > 1 and len(parts[1]) > 1:
+            parts[1] = parts[1].rstrip('/')
+
+        if len(parts) > 1 and parts[0].startswith('.'):
+            parts[0] = os.path.normpath(os.path.join(self._project_dir, parts[0]))
+
+        elif len(parts) > 1 and parts[0].startswith('~'):
+            parts[0] = os.path.expanduser(parts[0])
+
+        return ':'.join(parts)
+
+    @staticmethod
+    def _get_mount_target(entry) -> Optional[str]:
+        if isinstance(entry, dict):
+            return entry.get('target')
+
+        parts = str(entry).split(':')
+
+        return (parts[1] if len(parts) > 1 else parts[0]).rstrip('/')
@@ -0,0 +1,175 @@
+"""
+Deployment plan - differences between declared services and the actual state of containers
+
+The state is collected once (one containers listing, one inspection of all containers, one image lookup per image),
+then compared with ServiceDeclaration of each service.
+"""
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from .service import ServiceDeclaration
+from .service import CONFIG_HASH_LABEL
+
+ACTION_CREATE = 'create'
+ACTION_RECREATE = 'recreate'
+ACTION_SCALE = 'scale'
+ACTION_START = 'start'
+ACTION_REMOVE = 'remove'
+
+# rough estimations, in seconds, per replica
+ESTIMATED_DURATIONS = {
+    ACTION_CREATE: 5,
+    ACTION_RECREATE: 5,
+    ACTION_SCALE: 5,
+    ACTION_START: 2,
+    ACTION_REMOVE: 1
+}
+ESTIMATED_ROLLING_REPLICA_DURATION = 15  # new replica needs to pass the health check before an old one is removed
+
+
+class PlannedAction(object):
+    """Single step required to converge a service to its declared state"""
+
+    service_name: str
+    action: str
+    reason: str
+    replicas: int
+    estimated_duration: int
+
+    def __init__(self, service_name: str, action: str, reason: str, replicas: int, estimated_duration: int):
+        self.service_name = service_name
+        self.action = action
+        self.reason = reason
+        self.replicas = replicas
+        self.estimated_duration = estimated_duration
+
+    def __repr__(self):
+        return 'PlannedAction<%s %s: %s>' % (self.action, self.service_name, self.reason)
+
+
+class DeploymentPlanner(object):
+    """Compares declared services with the containers state
+
+    Args:
+        driver: ComposeDriver
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._inspected: Dict[str, object] = {}
+        self._image_ids: Dict[str, Optional[str]] = {}
+
+    def create_plan(self, services: List[ServiceDeclaration], declared_names: Optional[List[str]] = None) \
+            -> List[PlannedAction]:
+        """Lists actions required to converge given services
+
+        Args:
+            services: Services to converge
+            declared_names: All declared services - containers of other services are planned to be removed
+                            (by default containers are not planned to be removed)
+        """
+
+        created = self.driver.get_created_containers(only_running=False)
+        self._inspect_all(services, created)
+
+        actions = []
+
+        for service in services:
+            action = self.plan_service(service, created.get(service.get_name(), {}))
+
+            if action:
+                actions.append(action)
+
+        if declared_names is not None:
+            for service_name, instances in created.items():
+                if service_name not in declared_names:
+                    actions.append(PlannedAction(service_name, ACTION_REMOVE, 'service is no longer declared',
+                                                 len(instances), ESTIMATED_DURATIONS[ACTION_REMOVE] * len(instances)))
+
+        return actions
+
+    def plan_service(self, service: ServiceDeclaration, instances: Dict[int, bool]) -> Optional[PlannedAction]:
+        """Decides what needs to be done with a service. None means, that the service is up-to-date"""
+
+        desired = service.get_desired_replicas_count()
+
+        if not instances:
+            return self._create_action(service, ACTION_CREATE, 'not created', desired)
+
+        reason = self._find_outdated_reason(service, instances)
+
+        if reason:
+            return self._create_action(service, ACTION_RECREATE, reason, desired)
+
+        if len(instances) != desired:
+            return self._create_action(service, ACTION_SCALE, 'scale from %i to %i replicas' % (len(instances), desired),
+                                       abs(desired - len(instances)))
+
+        stopped = len([is_up for is_up in instances.values() if not is_up])
+
+        if stopped:
+            return self._create_action(service, ACTION_START, '%i of %i replicas not running' % (stopped, desired),
+                                       stopped)
+
+        return None
+
+    def _find_outdated_reason(self, service: ServiceDeclaration, instances: Dict[int, bool]) -> Optional[str]:
+        image = self._get_local_image_name(service)
+        image_id = self._get_image_id(image)
+
+        if not image_id:
+            return 'image "%s" is not present locally' % image
+
+        config_hash = service.get_config_hash()
+        names = [self.driver.create_container_name(service, num) for num in instances.keys()]
+        self._inspect([name for name in names if name not in self._inspected])
+
+        for name in names:
+            container = self._inspected[name]
+
+            if container.get_labels().get(CONFIG_HASH_LABEL) != config_hash:
+                return 'definition changed'
+
+            if container.get_image_id() != image_id:
+                return 'image "%s" changed' % image
+
+        return None
+
+    def _get_local_image_name(self, service: ServiceDeclaration) -> str:
+        """Image the containers are created from. docker-compose tags images built without "image" as project_service"""
+
+        if 'build' in service.get_definition() and 'image' not in service.get_definition():
+            return '%s_%s' % (self.driver.project_name, service.get_name())
+
+        return service.get_image()
+
+    def _create_action(self, service: ServiceDeclaration, action: str, reason: str, replicas: int) -> PlannedAction:
+        per_replica = ESTIMATED_DURATIONS[action]
+
+        if action == ACTION_RECREATE and service.get_update_strategy() == 'rolling':
+            per_replica = ESTIMATED_ROLLING_REPLICA_DURATION
+
+        return PlannedAction(service.get_name(), action, reason, replicas, per_replica * replicas)
+
+    def _inspect_all(self, services: List[ServiceDeclaration], created: Dict[str, Dict[int, bool]]):
+        """Inspects containers of all given services in one call"""
+
+        names = []
+
+        for service in services:
+            for num in created.get(service.get_name(), {}).keys():
+                names.append(self.driver.create_container_name(service, num))
+
+        self._inspect(names)
+
+    def _inspect(self, names: List[str]):
+        if names:
+            for container in self.driver.inspect_containers(names):
+                self._inspected[container.get_name()] = container
+
+    def _get_image_id(self, image: str) -> Optional[str]:
+        if image not in self._image_ids:
+            self._image_ids[image] = self.driver.docker().get_image_id(image)
+
+        return self._image_ids[image]
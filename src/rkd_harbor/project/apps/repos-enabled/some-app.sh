@@ -5,6 +5,12 @@ export GIT_PROJECT_DIR=riotkit-do
 export GIT_ORG_NAME=riotkit-org
 export WRITABLE_DIRS=".rkd"
 
+# optional: shallow/partial clone of big repositories
+#export GIT_BRANCH=master
+#export GIT_DEPTH=1
+#export GIT_FILTER=blob:none
+#export GIT_SPARSE_PATHS="src docs"
+
 #
 # Install the assets
 #
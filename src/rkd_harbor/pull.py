@@ -0,0 +1,145 @@
+"""
+Pulling images of services
+
+Each image is pulled separately (services sharing the same image are pulled once), with a limited number of
+concurrent pulls. Images pinned to a digest (image@sha256:...) that are already present locally are not pulled
+at all, as the content under a digest cannot change.
+"""
+
+from time import time
+from time import sleep
+from subprocess import CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Optional
+from .service import ServiceDeclaration
+
+PULLED = 'pulled'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# errors that will not disappear after a retry
+PERMANENT_ERRORS = ['manifest unknown', 'not found', 'unauthorized', 'denied', 'invalid reference format']
+
+
+class PullResult(object):
+    image: str
+    services: List[str]
+    status: str
+    reason: str
+    size: Optional[int]
+    duration: float
+    attempts: int
+
+    def __init__(self, image: str, services: List[str]):
+        self.image = image
+        self.services = services
+        self.status = FAILED
+        self.reason = ''
+        self.size = None
+        self.duration = 0.0
+        self.attempts = 0
+
+    def is_successful(self) -> bool:
+        return self.status != FAILED
+
+    def __repr__(self):
+        return 'PullResult<%s %s: %s>' % (self.status, self.image, self.reason)
+
+
+class ImagePullScheduler(object):
+    """Pulls images of given services using a pool of workers
+
+    Args:
+        driver: ComposeDriver
+        workers: Maximum number of concurrent pulls
+        retries: How many times a failed pull is repeated
+        backoff: Seconds to wait before first retry, doubled with each next retry
+    """
+
+    def __init__(self, driver, workers: int = 4, retries: int = 2, backoff: float = 2.0):
+        self.driver = driver
+        self.workers = max(workers, 1)
+        self.retries = retries
+        self.backoff = backoff
+
+    def pull(self, services: List[ServiceDeclaration]) -> List[PullResult]:
+        images = self._group_by_image(services)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda image: self.pull_image(image, images[image]), images.keys()))
+
+    def pull_image(self, image: str, services: List[str]) -> PullResult:
+        result = PullResult(image, services)
+        started_at = time()
+
+        if is_digest_pinned(image) and self.driver.docker().get_image_id(image):
+            result.status = SKIPPED
+            result.reason = 'pinned to a digest, already present'
+            return result
+
+        while True:
+            result.attempts += 1
+
+            try:
+                self.driver.scope.sh('docker pull --quiet "%s" 2>&1' % image, capture=True)
+                result.status = PULLED
+                break
+
+            except CalledProcessError as e:
+                result.reason = (e.output.decode('utf-8', errors='replace')
+                                 if isinstance(e.output, bytes) else str(e.output or e)).strip()
+
+                if result.attempts > self.retries or self._is_permanent_error(result.reason):
+                    break
+
+                sleep(self.backoff * (2 ** (result.attempts - 1)))
+
+        result.duration = time() - started_at
+
+        if result.status == PULLED:
+            result.size = (self.driver.docker().inspect_image(image) or {}).get('Size')
+
+        return result
+
+    @staticmethod
+    def _group_by_image(services: List[ServiceDeclaration]) -> Dict[str, List[str]]:
+        return OrderedDict([(image, [service.get_name() for service in image_services])
+                            for image, image_services in group_services_by_image(services).items()])
+
+    @staticmethod
+    def _is_permanent_error(output: str) -> bool:
+        return any([error in output.lower() for error in PERMANENT_ERRORS])
+
+
+def group_services_by_image(services: List[ServiceDeclaration]) -> Dict[str, List[ServiceDeclaration]]:
+    """Services built locally ("build" section, optionally tagged with "image") are not pulled, as in compose"""
+
+    images = OrderedDict()
+
+    for service in services:
+        if 'image' not in service.get_definition() or 'build' in service.get_definition():
+            continue
+
+        images.setdefault(service.get_image(), []).append(service)
+
+    return images
+
+
+def is_digest_pinned(image: str) -> bool:
+    return '@sha256:' in image
+
+
+def format_size(size: Optional[int]) -> str:
+    if size is None:
+        return '-'
+
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return '%.1f %s' % (size, unit) if unit != 'B' else '%i B' % size
+
+        size /= 1024
+
+    return '%.1f GB' % size
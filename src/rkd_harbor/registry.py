@@ -0,0 +1,63 @@
+"""
+Lazy tasks registration
+
+Task modules (and their dependencies eg. jinja2, ansible vault, rkd_cooperative) are imported only when the task is
+really needed - to be executed, or to be described in the tasks list. Resolving a task by name does not need to
+import any module, as the full name is declared upfront.
+"""
+
+from importlib import import_module
+from typing import Dict
+from typing import List
+from rkd.api.contract import TaskInterface
+from rkd.api.syntax import TaskDeclaration
+from rkd.api.syntax import merge_env
+from rkd.exception import DeclarationException
+
+
+class LazyTaskDeclaration(TaskDeclaration):
+    """TaskDeclaration that creates the task on first access
+
+    Args:
+        full_name: Full name of the task, eg. ":harbor:service:list"
+        class_path: Import path of the task class, eg. "rkd_harbor.tasks.listing.ListDefinedServices"
+    """
+
+    _full_name: str
+    _class_path: str
+
+    def __init__(self, full_name: str, class_path: str, env: Dict[str, str] = {}, args: List[str] = []):
+        self._full_name = full_name
+        self._class_path = class_path
+        self._task = None
+        self._env = merge_env(env)
+        self._args = args
+        self._user_defined_env = list(env.keys())
+
+    def to_full_name(self):
+        return self._full_name
+
+    def is_loaded(self) -> bool:
+        return self._task is not None
+
+    def get_task_to_execute(self) -> TaskInterface:
+        if self._task is None:
+            self._task = self._create_task()
+
+        return self._task
+
+    def _create_task(self) -> TaskInterface:
+        module_name, class_name = self._class_path.rsplit('.', 1)
+        task = getattr(import_module(module_name), class_name)()
+
+        if not isinstance(task, TaskInterface):
+            raise DeclarationException('"%s" is not a TaskInterface' % self._class_path)
+
+        if task.get_full_name() != self._full_name:
+            raise DeclarationException('"%s" was registered as "%s", but it is named "%s"' % (
+                self._class_path, self._full_name, task.get_full_name()))
+
+        return task
+
+    def __str__(self):
+        return 'TaskDeclaration<%s>' % self._full_name
@@ -0,0 +1,266 @@
+"""
+In-process reading of application repositories configuration (apps/repos-enabled/*.sh)
+
+The configuration files are shell scripts, but in practice they only export variables and define hooks. Those are
+read directly, without spawning bash. Files containing any other shell logic are reported by raising an exception,
+so the caller can fall back to sourcing the file in bash.
+"""
+
+import os
+import re
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+from .exception import RepositoryConfigNotStaticException
+
+ASSIGNMENT_PATTERN = re.compile(r'^(?P<export>export\s+)?(?P<name>[_a-zA-Z][_a-zA-Z0-9]*)=(?P<value>.*)$')
+EXPORT_ONLY_PATTERN = re.compile(r'^export(\s+[_a-zA-Z][_a-zA-Z0-9]*)+$')
+FUNCTION_PATTERN = re.compile(
+    r'^(?:function\s+(?P<keyword_name>[_a-zA-Z][_a-zA-Z0-9]*)\s*(?:\(\s*\))?'
+    r'|(?P<name>[_a-zA-Z][_a-zA-Z0-9]*)\s*\(\s*\))\s*(?P<body>{.*)?$'
+)
+VARIABLE_NAME_PATTERN = re.compile(r'[_a-zA-Z][_a-zA-Z0-9]*')
+NOT_STATIC_CHARACTERS = ['`', ';', '&', '|', '<', '>', '(', ')']
+
+_cache: Dict[str, Tuple[int, Union['RepositoryConfig', RepositoryConfigNotStaticException]]] = {}
+
+
+class RepositoryConfig(object):
+    """Variables and hooks (functions) defined in a repository configuration file"""
+
+    path: str
+    assignments: List[Tuple[str, list]]
+    exported: List[str]
+    functions: List[str]
+
+    def __init__(self, path: str, assignments: List[Tuple[str, list]], exported: List[str], functions: List[str]):
+        self.path = path
+        self.assignments = assignments
+        self.exported = exported
+        self.functions = functions
+
+    def resolve(self, environment: Dict[str, str]) -> Dict[str, str]:
+        """Evaluates variables in order, on top of given environment (same as sourcing the file in a shell would do)
+
+        Returned are only environment variables - as in the shell, variables assigned without "export" can be used
+        in next assignments, but are not a part of the environment (unless they were already in the environment)
+        """
+
+        variables = dict(environment)
+
+        for name, parts in self.assignments:
+            variables[name] = ''.join([variables.get(value, '') if is_variable else value
+                                       for is_variable, value in parts])
+
+        return {name: value for name, value in variables.items() if name in environment or name in self.exported}
+
+    def has_function(self, name: str) -> bool:
+        return name in self.functions
+
+
+def load_repository_config(path: str) -> RepositoryConfig:
+    """Parses the configuration file, the result is cached until the file is modified
+
+    Raises:
+        RepositoryConfigNotStaticException: When the file contains logic that needs to be executed by a shell
+    """
+
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+
+    if cached is None or cached[0] != mtime:
+        try:
+            cached = (mtime, _parse(path))
+        except RepositoryConfigNotStaticException as e:
+            cached = (mtime, e)
+
+        _cache[path] = cached
+
+    if isinstance(cached[1], RepositoryConfigNotStaticException):
+        raise cached[1]
+
+    return cached[1]
+
+
+def _parse(path: str) -> RepositoryConfig:
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()
+
+    assignments = []
+    exported = []
+    functions = []
+    line_number = 0
+
+    while line_number < len(lines):
+        line = lines[line_number]
+        stripped = line.strip()
+        line_number += 1
+
+        if not stripped or stripped.startswith('#'):
+            continue
+
+        if EXPORT_ONLY_PATTERN.match(stripped):
+            exported += stripped.split()[1:]
+            continue
+
+        assignment = ASSIGNMENT_PATTERN.match(stripped)
+
+        if assignment:
+            try:
+                assignments.append((assignment.group('name'), _parse_value(assignment.group('value'))))
+            except ValueError:
+                raise RepositoryConfigNotStaticException(path, line_number, line)
+
+            if assignment.group('export'):
+                exported.append(assignment.group('name'))
+
+            continue
+
+        function = FUNCTION_PATTERN.match(stripped)
+
+        if function:
+            functions.append(function.group('name') or function.group('keyword_name'))
+            line_number = _skip_function_body(path, lines, line_number, function.group('body'))
+            continue
+
+        raise RepositoryConfigNotStaticException(path, line_number, line)
+
+    return RepositoryConfig(path, assignments, exported, functions)
+
+
+def _skip_function_body(path: str, lines: List[str], line_number: int, opening: str) -> int:
+    """Returns number of the first line after the function. The body ends with a "}" placed at the beginning of line"""
+
+    if opening is None:
+        if line_number >= len(lines) or lines[line_number].strip() != '{':
+            raise RepositoryConfigNotStaticException(path, line_number, lines[line_number - 1])
+
+        line_number += 1
+
+    # one-liner: name() { echo "Hello"; }
+    elif opening.rstrip().endswith('}') and opening.strip() != '{':
+        return line_number
+
+    while line_number < len(lines):
+        line_number += 1
+
+        if lines[line_number - 1].startswith('}'):
+            return line_number
+
+    raise RepositoryConfigNotStaticException(path, line_number, lines[-1])
+
+
+def _parse_value(value: str) -> list:
+    """Splits a shell word into parts: (False, literal text), (True, variable name)
+
+    Raises:
+        ValueError: When the value uses a syntax that cannot be evaluated statically (eg. command substitution)
+    """
+
+    parts = []
+    position = 0
+    quote = None
+
+    while position < len(value):
+        character = value[position]
+
+        if quote == "'":
+            if character == "'":
+                quote = None
+            else:
+                parts.append((False, character))
+
+            position += 1
+            continue
+
+        if character == '\\':
+            if position + 1 >= len(value):
+                raise ValueError('Line continuation')
+
+            following = value[position + 1]
+
+            if quote == '"' and following not in ['$', '`', '"', '\\']:
+                parts.append((False, character))
+
+            parts.append((False, following))
+            position += 2
+            continue
+
+        if character == '$':
+            position = _parse_expansion(value, position, parts)
+            continue
+
+        if character == '`':
+            raise ValueError('Command substitution')
+
+        if character == '"':
+            quote = None if quote == '"' else '"'
+            position += 1
+            continue
+
+        if quote is None:
+            if character == "'":
+                quote = "'"
+                position += 1
+                continue
+
+            if character.isspace():
+                if value[position:].strip() and not value[position:].strip().startswith('#'):
+                    raise ValueError('Multiple words')
+
+                break
+
+            if character in NOT_STATIC_CHARACTERS:
+                raise ValueError('Shell syntax')
+
+            # in assignments the shell expands "~" at the beginning and after each ":" (eg. PATH=~/bin:~/.local/bin)
+            if character == '~' and (position == 0 or value[position - 1] == ':'):
+                raise ValueError('Tilde expansion')
+
+        parts.append((False, character))
+        position += 1
+
+    if quote:
+        raise ValueError('Multiline value')
+
+    return _join_literals(parts)
+
+
+def _parse_expansion(value: str, position: int, parts: list) -> int:
+    following = value[position + 1:position + 2]
+
+    if following == '{':
+        closing = value.find('}', position)
+        name = value[position + 2:closing] if closing > 0 else ''
+
+        if not VARIABLE_NAME_PATTERN.fullmatch(name):
+            raise ValueError('Parameter expansion')
+
+        parts.append((True, name))
+        return closing + 1
+
+    name = VARIABLE_NAME_PATTERN.match(value, position + 1)
+
+    if name:
+        parts.append((True, name.group(0)))
+        return name.end()
+
+    if following and not following.isspace() and following != '"':
+        raise ValueError('Special parameter or command substitution')
+
+    parts.append((False, '$'))
+    return position + 1
+
+
+def _join_literals(parts: list) -> list:
+    joined = []
+
+    for is_variable, value in parts:
+        if not is_variable and joined and not joined[-1][0]:
+            joined[-1] = (False, joined[-1][1] + value)
+            continue
+
+        joined.append((is_variable, value))
+
+    return joined
@@ -3,22 +3,55 @@
 """
 
 import os
+import re
+import json
+import yaml
+from abc import ABC
+from abc import abstractmethod
+from bisect import bisect_left
+from fnmatch import translate
+from hashlib import sha256
 from typing import List
 from typing import Optional
 from typing import Dict
+from typing import Set
+from typing import Tuple
+from typing import Union
+from types import CodeType
+from types import MappingProxyType
 from traceback import format_exc
 from rkd.api.inputoutput import IO
-from .expressions import safe_eval
+from .expressions import compile_safe_expression
+from .merger import YamlLoader
 from .exception import ProfileNotFoundException
+from .exception import ProfileInvalidException
 from .exception import ServiceNotFoundInYaml
 from .exception import ServiceNotFoundInYamlLookedByCriteria
 
 DEFAULT_SELECTOR = 'service is not None'  # passes all containers
+SELECTOR_VARIABLES = ['service', 'name']
 BOOLEANS = ['true', 'TRUE', 'True', True]
+CONFIG_HASH_LABEL = 'org.riotkit.configHash'
+COMPOSE_PROJECT_LABEL = 'com.docker.compose.project'
+EMPTY_MAPPING = MappingProxyType({})  # shared by all declarations without labels/environment (read-only)
+PROFILE_EXTENSIONS = ['.profile.py', '.profile.yml']
+PROFILE_RULE_KEYS = ['name', 'labels', 'has_labels', 'image']
+UNION = '+'
+DIFFERENCE = '-'
+INTERSECTION = '&'
+PROFILE_OPERATOR_PATTERN = re.compile(r'([+&-])')
+GLOB_PATTERN = re.compile(r'[*?\[]')
 
 
 class ServiceDeclaration(object):
-    """Model of a parsed service declaration from YAML"""
+    """Model of a parsed service declaration from YAML
+
+    The raw definition is kept as-is (not copied), fields are parsed on first access and memoized - listing, sorting
+    and planning ask for the same fields many times.
+    """
+
+    __slots__ = ('_name', '_definition', '_labels', '_environment', '_domains', '_ports', '_replicas', '_priority',
+                 '_config_hash')
 
     _name: str
     _definition: dict
@@ -26,6 +59,13 @@ class ServiceDeclaration(object):
     def __init__(self, name: str, definition: dict):
         self._name = name
         self._definition = definition
+        self._labels = None
+        self._environment = None
+        self._domains = None
+        self._ports = None
+        self._replicas = None
+        self._priority = None
+        self._config_hash = None
 
     def get_name(self) -> str:
         return self._name
@@ -33,68 +73,105 @@ class ServiceDeclaration(object):
     def get_definition(self) -> dict:
         return self._definition
 
+    def get_labels(self) -> Dict[str, str]:
+        """Labels as a dictionary - labels can be declared also as a list of "name=value" in YAML"""
+
+        if self._labels is None:
+            self._labels = to_dict(self._definition.get('labels'))
+
+        return self._labels
+
+    def get_environment(self) -> Dict[str, str]:
+        """Environment as a dictionary - environment can be declared also as a list of "NAME=value" in YAML"""
+
+        if self._environment is None:
+            self._environment = to_dict(self._definition.get('environment'))
+
+        return self._environment
+
     def get_domains(self) -> list:
-        try:
-            return str(self.get_definition()['environment']['VIRTUAL_HOST']).split(',')
-        except KeyError:
-            return []
+        if self._domains is None:
+            virtual_host = self.get_environment().get('VIRTUAL_HOST')
+            self._domains = str(virtual_host).split(',') if virtual_host is not None else []
+
+        return self._domains
 
     def is_using_watchtower(self) -> bool:
-        try:
-            return self.get_definition()['labels']['com.centurylinklabs.watchtower.enable'] in BOOLEANS
-        except KeyError:
-            return False
+        return self.get_labels().get('com.centurylinklabs.watchtower.enable') in BOOLEANS
 
     def is_using_maintenance_mode(self) -> bool:
-        try:
-            return self.get_definition()['labels']['org.riotkit.useMaintenanceMode'] in BOOLEANS
-        except KeyError:
-            return False
+        return self.get_labels().get('org.riotkit.useMaintenanceMode') in BOOLEANS
 
     def get_ports(self) -> list:
-        try:
-            ports = self.get_definition()['ports']
-            as_list_of_strings: List[str] = []
+        if self._ports is None:
+            self._ports = []
 
-            for pair in ports:
+            for pair in self._definition.get('ports') or []:
                 if isinstance(pair, dict):
-                    as_list_of_strings.append(str(pair['published']) + ':' + str(pair['target']))
+                    self._ports.append(str(pair['published']) + ':' + str(pair['target']))
                     continue
 
-                as_list_of_strings.append(pair)
+                self._ports.append(pair)
+
+        return self._ports
+
+    def get_desired_replicas_count(self) -> int:
+        if self._replicas is None:
+            self._replicas = int(self.get_labels().get('org.riotkit.replicas', 1))
+
+        return self._replicas
 
-            return as_list_of_strings
+    def get_rolling_max_surge(self) -> Optional[int]:
+        """How many replicas can be created above the desired replicas count during a rolling update"""
 
+        try:
+            return int(self.get_labels()['org.riotkit.rollingMaxSurge'])
         except KeyError:
-            return []
+            return None
+
+    def get_rolling_batch_size(self) -> Optional[int]:
+        """How many replicas are replaced at once during a rolling update"""
 
-    def get_desired_replicas_count(self) -> int:
         try:
-            return int(self.get_definition()['labels']['org.riotkit.replicas'])
+            return int(self.get_labels()['org.riotkit.rollingBatchSize'])
         except KeyError:
-            return 1
+            return None
+
+    def get_mounted_paths(self) -> List[str]:
+        """Sources of volumes (host paths or volume names)"""
+
+        paths = []
+
+        for volume in self._definition.get('volumes') or []:
+            if isinstance(volume, dict):
+                paths.append(str(volume.get('source', '')))
+                continue
+
+            paths.append(str(volume).split(':')[0])
+
+        return paths
 
     def get_update_strategy(self, default: str = 'compose') -> str:
         try:
-            return str(self.get_definition()['labels']['org.riotkit.updateStrategy'])
+            return str(self.get_labels()['org.riotkit.updateStrategy'])
         except KeyError:
             return default
 
     def get_priority_number(self):
-        try:
-            return int(self.get_definition()['labels']['org.riotkit.priority'])
-        except KeyError:
-            return 1000
+        if self._priority is None:
+            self._priority = int(self.get_labels().get('org.riotkit.priority', 1000))
+
+        return self._priority
 
     def get_image(self):
         try:
-            return str(self.get_definition()['image'])
+            return str(self._definition['image'])
         except KeyError:
             return '_docker_build_local:latest'
 
     def get_declared_version(self):
         try:
-            return str(self.get_definition()['image'].split(':')[1])
+            return str(self._definition['image'].split(':')[1])
         except KeyError:
             return 'latest (build)'
         except IndexError:
@@ -103,42 +180,234 @@ class ServiceDeclaration(object):
     def has_domain(self, domain: str):
         return domain in self.get_domains()
 
+    def get_config_hash(self) -> str:
+        """Checksum of the effective service definition - containers created from same definition have same hash"""
+
+        if self._config_hash is None:
+            definition = dict(self._definition)
 
-class ServiceSelector(object):
-    """Acts as a service filter. Simple reduce() implementation"""
+            if definition.get('labels'):
+                definition['labels'] = {name: value for name, value in self.get_labels().items()
+                                        if name != CONFIG_HASH_LABEL}
+
+            self._config_hash = sha256(json.dumps(definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+        return self._config_hash
+
+
+def to_dict(pairs) -> dict:
+    """Normalizes "labels" or "environment" from YAML, that can be a dictionary or a list of "name=value" """
+
+    if not pairs:
+        return EMPTY_MAPPING
+
+    if isinstance(pairs, dict):
+        return pairs
+
+    as_dict = {}
+
+    for pair in pairs:
+        name, separator, value = str(pair).partition('=')
+        as_dict[name] = value if separator else None
+
+    return as_dict
+
+
+def format_label_value(value) -> str:
+    """Label value as docker-compose writes it - YAML booleans become "true"/"false", not Python's "True" """
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return '' if value is None else str(value)
+
+
+def group_by_priority(services: List[ServiceDeclaration]) -> List[List[ServiceDeclaration]]:
+    """Splits services (sorted by priority) into ordered groups of services sharing the same priority"""
+
+    groups = []
+    previous_priority = None
+
+    for service in services:
+        if not groups or service.get_priority_number() != previous_priority:
+            groups.append([])
+
+        groups[-1].append(service)
+        previous_priority = service.get_priority_number()
+
+    return groups
+
+
+class BaseServiceSelector(ABC):
+    """Picks services - a profile"""
+
+    def find_matching_services(self, services: Union[dict, 'ServiceLocator']) -> List[ServiceDeclaration]:
+        """Find matching services (ordered by priority) in a ServiceLocator, or in a "services" section of YAML"""
+
+        locator = services if isinstance(services, ServiceLocator) else ServiceLocator(services)
+        names = self.select(locator)
+
+        return [service for service in locator.get_all_by_priority() if service.get_name() in names]
+
+    @abstractmethod
+    def select(self, locator: 'ServiceLocator') -> Set[str]:
+        """Names of matching services"""
+
+        pass
+
+
+class ServiceSelector(BaseServiceSelector):
+    """Acts as a service filter. Simple reduce() implementation
+
+    The selector expression is validated and compiled once, then only evaluated for each service.
+    """
 
     _selector: str
     _io: IO
+    _compiled: Optional[CodeType]
 
     def __init__(self, selector: str, io: IO):
         self._selector = selector
         self._io = io
+        self._compiled = None
 
     def is_service_matching(self, definition: dict, name: str) -> bool:
         """Asks the profile filter - is service of a given definition and name matching?"""
 
         try:
-            return safe_eval(self._selector, {'service': definition, 'name': name})
+            return eval(self._get_compiled_selector(), {'service': definition, 'name': name})
         except Exception:
-            self._io.errln(format_exc())
-            self._io.error_msg('Exception raised, while attempting to evaluate --profile selector')
+            self._report_error()
             return False
 
-    def find_matching_services(self, services: dict) -> List[ServiceDeclaration]:
-        """Find names of matching services by current Service Selector"""
-        matched = []
+    def select(self, locator: 'ServiceLocator') -> Set[str]:
+        try:
+            self._get_compiled_selector()
+        except Exception:
+            # invalid expression would fail for each service in the same way, so report it only once
+            self._report_error()
+            return set()
+
+        return {service.get_name() for service in locator.get_all()
+                if self.is_service_matching(service.get_definition(), service.get_name())}
+
+    def _get_compiled_selector(self) -> CodeType:
+        if self._compiled is None:
+            self._compiled = compile_safe_expression(self._selector, SELECTOR_VARIABLES)
+
+        return self._compiled
 
-        for name, definition in services.items():
-            if self.is_service_matching(definition, name):
-                matched.append(ServiceDeclaration(name, definition))
+    def _report_error(self):
+        self._io.errln(format_exc())
+        self._io.error_msg('Exception raised, while attempting to evaluate --profile selector')
 
-        matched.sort(key=lambda declaration: declaration.get_priority_number())
 
-        return matched
+class DeclarativeServiceSelector(BaseServiceSelector):
+    """Profile declared in YAML - answered using ServiceLocator indexes, without evaluating each service
+
+    Example:
+        include:
+            - name: "web_*"
+            - labels: {"org.riotkit.team": "a"}
+              has_labels: ["org.riotkit.replicas"]
+        exclude:
+            - image: "quay.io/riotkit/"
+
+    A service matches a rule when it matches all of its conditions. Services matching any of the "include" rules
+    (all services, when "include" is not defined) and not matching any of the "exclude" rules are selected.
+    """
+
+    _include: Optional[List[dict]]
+    _exclude: List[dict]
+
+    def __init__(self, definition: dict, path: str):
+        if not isinstance(definition, dict) or set(definition.keys()) - {'include', 'exclude'}:
+            raise ProfileInvalidException(path, 'only "include" and "exclude" sections are allowed')
+
+        for section in definition.values():
+            if not isinstance(section, list) or not all([isinstance(rule, dict) for rule in section]):
+                raise ProfileInvalidException(path, '"include" and "exclude" should be lists of rules')
+
+            for rule in section:
+                if not rule or set(rule.keys()) - set(PROFILE_RULE_KEYS):
+                    raise ProfileInvalidException(path, 'rule can contain only %s' % ', '.join(PROFILE_RULE_KEYS))
+
+        self._include = definition.get('include')
+        self._exclude = definition.get('exclude') or []
+
+    def select(self, locator: 'ServiceLocator') -> Set[str]:
+        if self._include is None:
+            included = set(locator.get_names())
+        else:
+            included = set().union(*[self._select_by_rule(locator, rule) for rule in self._include])
+
+        return included.difference(*[self._select_by_rule(locator, rule) for rule in self._exclude])
+
+    @staticmethod
+    def _select_by_rule(locator: 'ServiceLocator', rule: dict) -> Set[str]:
+        found = []
+
+        for label, value in (rule.get('labels') or {}).items():
+            found.append(locator.find_by_label(label, value))
+
+        for label in as_list(rule.get('has_labels')):
+            found.append(locator.find_by_label(label))
+
+        if 'image' in rule:
+            found.append([service for prefix in as_list(rule['image'])
+                          for service in locator.find_by_image_prefix(prefix)])
+
+        names = set.intersection(*[{service.get_name() for service in services} for services in found]) \
+            if found else set(locator.get_names())
+
+        if 'name' in rule:
+            patterns = [str(pattern) for pattern in as_list(rule['name'])]
+
+            # exact names are looked up, globs are compiled into one expression
+            if not any([GLOB_PATTERN.search(pattern) for pattern in patterns]):
+                return names.intersection(patterns)
+
+            matches = re.compile('|'.join([translate(pattern) for pattern in patterns])).match
+            names = {name for name in names if matches(name)}
+
+        return names
+
+
+class CombinedServiceSelector(BaseServiceSelector):
+    """Profiles combined with operators evaluated from left to right: + (union), - (difference), & (intersection)"""
+
+    _first: BaseServiceSelector
+    _operations: List[Tuple[str, BaseServiceSelector]]
+
+    def __init__(self, first: BaseServiceSelector, operations: List[Tuple[str, BaseServiceSelector]]):
+        self._first = first
+        self._operations = operations
+
+    def select(self, locator: 'ServiceLocator') -> Set[str]:
+        names = self._first.select(locator)
+
+        for operator, selector in self._operations:
+            if operator == UNION:
+                names = names | selector.select(locator)
+            elif operator == DIFFERENCE:
+                names = names - selector.select(locator)
+            elif operator == INTERSECTION:
+                names = names & selector.select(locator)
+
+        return names
+
+
+def as_list(value) -> list:
+    if value is None:
+        return []
+
+    return value if isinstance(value, list) else [value]
 
 
 class ProfileLoader(object):
     """Parses profiles from ./apps/profiles
+
+    Profiles can be combined eg. "gateway+databases-backups" (see CombinedServiceSelector)
     """
 
     _io: IO
@@ -148,34 +417,112 @@ class ProfileLoader(object):
         self._io = io
         self._apps_path = apps_path
 
-    def load_profile(self, name: str) -> ServiceSelector:
+    def load_profile(self, name: str) -> BaseServiceSelector:
         if name == '' or name is None:
             return ServiceSelector(DEFAULT_SELECTOR, self._io)
 
-        profile_path = self._apps_path + '/profile/%s.profile.py' % name
+        profile_path = self._find_profile_path(name)
+
+        # a profile named eg. "data-collectors" takes precedence over a combination of "data" and "collectors"
+        if profile_path is None and PROFILE_OPERATOR_PATTERN.search(name):
+            return self._load_combined_profile(name)
 
-        if not os.path.isfile(profile_path):
-            raise ProfileNotFoundException(profile_path)
+        if profile_path is None:
+            raise ProfileNotFoundException(self._apps_path + '/profile/%s.profile.[py|yml]' % name)
 
         return self.load_profile_from_path(profile_path)
 
-    def load_profile_from_path(self, path: str) -> ServiceSelector:
+    def load_profile_from_path(self, path: str) -> BaseServiceSelector:
         with open(path, 'r') as f:
+            if path.endswith('.yml'):
+                return DeclarativeServiceSelector(yaml.load(f, YamlLoader), path)
+
             content = f.read()
 
             return ServiceSelector(content, self._io)
 
+    def _find_profile_path(self, name: str) -> Optional[str]:
+        for extension in PROFILE_EXTENSIONS:
+            path = self._apps_path + '/profile/%s%s' % (name, extension)
+
+            if os.path.isfile(path):
+                return path
+
+        return None
+
+    def _load_combined_profile(self, expression: str) -> CombinedServiceSelector:
+        parts = self._split_combined_profile(expression)
+
+        return CombinedServiceSelector(
+            self.load_profile(parts[0]),
+            [(operator, self.load_profile(name)) for operator, name in zip(parts[1::2], parts[2::2])]
+        )
+
+    def _split_combined_profile(self, expression: str) -> List[str]:
+        """Splits into [name, operator, name, ...]. Names containing "-" are kept, when such profile exists"""
+
+        parts = [part.strip() for part in PROFILE_OPERATOR_PATTERN.split(expression)]
+        split = []
+        start = 0
+
+        if not all(parts[0::2]):
+            raise ProfileInvalidException(expression, 'expected profile names joined with "+", "-" or "&"')
+
+        while start < len(parts):
+            end = start
+
+            # the longest existing name wins eg. "workers-union" over "workers" minus "union"
+            for candidate in range(start + 2, len(parts), 2):
+                if parts[candidate - 1] != DIFFERENCE:
+                    break
+
+                if self._find_profile_path(''.join(parts[start:candidate + 1])):
+                    end = candidate
+
+            split.append(''.join(parts[start:end + 1]))
+
+            if end + 1 < len(parts):
+                split.append(parts[end + 1])
+
+            start = end + 2
+
+        return split
+
 
 class ServiceLocator(object):
-    """Declarations repository"""
+    """Declarations repository
+
+    Indexes (by domain, by label, by priority) are built once, when the locator is created, so the lookups do not
+    need to scan and parse all declarations again.
+    """
 
     _services: Dict[str, ServiceDeclaration]
+    _domains: Dict[str, List[str]]
+    _by_domain: Dict[str, ServiceDeclaration]
+    _by_label: Dict[str, Dict[str, List[ServiceDeclaration]]]
+    _by_priority: List[ServiceDeclaration]
+    _by_image: List[Tuple[str, str]]
 
     def __init__(self, services: dict):
         self._services = {}
+        self._domains = {}
+        self._by_domain = {}
+        self._by_label = {}
 
         for name, yaml_dict in services.items():
-            self._services[name] = ServiceDeclaration(name, yaml_dict)
+            service = ServiceDeclaration(name, yaml_dict)
+            self._services[name] = service
+            self._domains[name] = service.get_domains()
+
+            for domain in self._domains[name]:
+                self._by_domain.setdefault(domain, service)
+
+            for label, value in service.get_labels().items():
+                self._by_label.setdefault(label, {}).setdefault(format_label_value(value), []).append(service)
+
+        self._by_priority = sorted(self._services.values(), key=lambda declaration: declaration.get_priority_number())
+        self._by_image = sorted([(str(service.get_definition()['image']), name)
+                                 for name, service in self._services.items() if service.get_definition().get('image')])
 
     def get_by_name(self, name: str) -> Optional[ServiceDeclaration]:
         try:
@@ -183,9 +530,46 @@ class ServiceLocator(object):
         except KeyError:
             raise ServiceNotFoundInYaml(name)
 
+    def get_all(self) -> List[ServiceDeclaration]:
+        return list(self._services.values())
+
+    def get_names(self) -> List[str]:
+        return list(self._services.keys())
+
     def find_by_domain(self, domain: str) -> Optional[ServiceDeclaration]:
-        for service in self._services.values():
-            if service.has_domain(domain):
-                return service
+        try:
+            return self._by_domain[domain]
+        except KeyError:
+            raise ServiceNotFoundInYamlLookedByCriteria('has domain "%s"' % domain)
+
+    def get_domains_of(self, name: str) -> List[str]:
+        try:
+            return self._domains[name]
+        except KeyError:
+            raise ServiceNotFoundInYaml(name)
+
+    def find_by_label(self, label: str, value: Optional[str] = None) -> List[ServiceDeclaration]:
+        """Services having a label (of given value, when specified)"""
+
+        values = self._by_label.get(label, {})
+
+        if value is not None:
+            return list(values.get(format_label_value(value), []))
+
+        return [service for services in values.values() for service in services]
+
+    def find_by_image_prefix(self, prefix: str) -> List[ServiceDeclaration]:
+        """Services which declared image starts with a prefix eg. "quay.io/riotkit/" (locally built are skipped)"""
+
+        found = []
+
+        for image, name in self._by_image[bisect_left(self._by_image, (prefix, '')):]:
+            if not image.startswith(prefix):
+                break
+
+            found.append(self._services[name])
+
+        return found
 
-        raise ServiceNotFoundInYamlLookedByCriteria('has domain "%s"' % domain)
+    def get_all_by_priority(self) -> List[ServiceDeclaration]:
+        return list(self._by_priority)
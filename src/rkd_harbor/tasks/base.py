@@ -1,24 +1,42 @@
 
 import os
 import yaml
-import pkg_resources
 from contextlib import contextmanager
-from subprocess import check_output
 from argparse import ArgumentParser
 from abc import ABC
 from abc import abstractmethod
 from typing import Dict
 from typing import List
+from typing import Optional
 from enum import Enum
+from dotenv import dotenv_values
 from rkd.api.contract import ExecutionContext
 from ..service import ProfileLoader
 from ..service import ServiceDeclaration
 from ..service import ServiceLocator
 from ..driver import ComposeDriver
+from ..plan import DeploymentPlanner
+from ..plan import PlannedAction
+from ..merger import ComposeMerger
+from ..dispatcher import InProcessDispatcher
 from ..cached_loader import CachedLoader
+from ..cached_loader import PersistentComposeCache
+from ..hooks import HookRunner
+from ..timings import CommandTimings
+from ..timings import Spans
+from ..timings import span
+from ..timings import start_trace
+from ..timings import append_to_trace
+from ..timings import TRACE_FILE_ENV
+from ..timings import timed_check_output
+from ..pull import format_size
+from ..hooks import collect_hook_stages
 from ..interface import HarborTaskInterface
+from ..exception import ComposeMergeNotSupportedException
+from ..exception import HookFailedException
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+COMPOSE_CACHE_PATH = './.rkd/cache/compose-definition.json'
 
 
 class UpdateStrategy(Enum):
@@ -36,12 +54,16 @@ class HarborBaseTask(HarborTaskInterface):
     is_dev_env: bool
     app_user: str
     app_group_id: int
+    _execution_context: Optional[ExecutionContext] = None
 
     #
     # TaskInterface
     #
     def configure_argparse(self, parser: ArgumentParser):
-        pass
+        parser.add_argument('--timings', action='store_true',
+                            help='Print a summary of time spent in executed commands (docker, git, hooks...)')
+        parser.add_argument('--timings-trace', default='',
+                            help='Write executed commands as a Chrome trace-event JSON file')
 
     def get_group_name(self) -> str:
         return ':harbor'
@@ -52,7 +74,12 @@ class HarborBaseTask(HarborTaskInterface):
             'HOOKS_PATH': './hooks.d/',
             'DATA_PATH': './data/',
             'COMPOSE_PROJECT_NAME': None,
-            'DOMAIN_SUFFIX': ''
+            'DOMAIN_SUFFIX': '',
+            'COMPOSE_CONFIG_LOADER': 'native',
+            'DOCKER_BACKEND': 'auto',
+            'DOCKER_HOST': '',
+            'NESTED_TASKS_MODE': 'in-process',
+            'HOOK_TIMEOUT': '0'
         }
 
     #
@@ -97,11 +124,80 @@ class HarborBaseTask(HarborTaskInterface):
         return ctx.get_env('COMPOSE_PROJECT_NAME')
 
     def get_compose_yaml_as_dict(self, ctx: ExecutionContext):
-        """Return's parsed docker-compose file as one big dictionary"""
+        """Return's parsed docker-compose file as one big dictionary
+
+        The result is persisted in .rkd/cache, so the docker-compose is not called again until YAML files change
+        """
+
+        def load() -> dict:
+            with span('compose config load'):
+                return PersistentComposeCache(COMPOSE_CACHE_PATH).load(
+                    files=self.containers(ctx).get_compose_files() + ['./.env'],
+                    extra={
+                        'project_name': self.get_project_name(ctx),
+                        'is_dev_env': self.is_dev_env,
+                        'cwd': os.getcwd(),
+                        'loader': ctx.get_env('COMPOSE_CONFIG_LOADER')
+                    },
+                    loader=lambda: self._load_compose_definition(ctx)
+                )
+
+        return CachedLoader.load_compose_definition(load)
+
+    def _load_compose_definition(self, ctx: ExecutionContext) -> dict:
+        """Merges YAML files using selected loader
+
+        COMPOSE_CONFIG_LOADER:
+            native: Merge YAML files in-process, falls back to docker-compose when unsupported feature is used
+            docker-compose: Always use "docker-compose config"
+            verify: Merge in-process, and compare the result with "docker-compose config"
+        """
+
+        loader_type = ctx.get_env('COMPOSE_CONFIG_LOADER')
+
+        if loader_type == 'docker-compose':
+            return self._load_compose_definition_using_compose(ctx)
+
+        try:
+            definition = self._load_compose_definition_natively(ctx)
+
+        except ComposeMergeNotSupportedException as e:
+            self.io().debug('%s, falling back to docker-compose' % str(e))
+            return self._load_compose_definition_using_compose(ctx)
+
+        if loader_type == 'verify':
+            return self._verify_compose_definition(definition, self._load_compose_definition_using_compose(ctx))
+
+        return definition
+
+    def _load_compose_definition_natively(self, ctx: ExecutionContext) -> dict:
+        variables = dotenv_values('./.env') if os.path.isfile('./.env') else {}
+        variables.update(os.environ)
+        variables.update(ctx.env)
+        variables['IS_DEBUG_ENVIRONMENT'] = str(self.is_dev_env)
+
+        return ComposeMerger(os.getcwd(), variables).merge_files(self.containers(ctx).get_compose_files())
+
+    def _load_compose_definition_using_compose(self, ctx: ExecutionContext) -> dict:
+        return yaml.load(self.containers(ctx).compose(['config'], capture=True), yaml.Loader)
+
+    def _verify_compose_definition(self, native: dict, compose: dict) -> dict:
+        """Reports differences between in-process merged definition and docker-compose output"""
+
+        native_services = native.get('services', {})
+        compose_services = compose.get('services', {})
 
-        return CachedLoader.load_compose_definition(
-            lambda: yaml.load(self.containers(ctx).compose(['config'], capture=True), yaml.Loader)
-        )
+        for name in sorted(set(native_services.keys()) | set(compose_services.keys())):
+            for attribute in ['image', 'labels', 'environment']:
+                native_value = native_services.get(name, {}).get(attribute)
+                compose_value = compose_services.get(name, {}).get(attribute)
+
+                if native_value != compose_value:
+                    self.io().warn('Compose merger difference at "%s.%s": %s != %s (docker-compose)' % (
+                        name, attribute, native_value, compose_value
+                    ))
+
+        return compose
 
     def get_services_as_raw_dict(self, ctx: ExecutionContext):
         """Gets services from YAMLS"""
@@ -119,11 +215,27 @@ class HarborBaseTask(HarborTaskInterface):
         """Harbor's wrapper - adds Harbor specific behavior before each task - initialization of the context
         """
 
-        if not self._validate_env_present():
-            self.io().error_msg('Missing .env file')
-            return False
+        if not Spans.is_in_task() and self._get_optional_arg(context, '--timings-trace'):
+            start_trace(self._get_optional_arg(context, '--timings-trace'))
+
+        try:
+            with Spans.task(self.get_full_name()):
+                return self._execute_initialized(context)
+        finally:
+            if not Spans.is_in_task():
+                self._report_command_timings(context)
+
+    def _execute_initialized(self, context: ExecutionContext) -> bool:
+        with span('.env validation'):
+            if not self._validate_env_present():
+                self.io().error_msg('Missing .env file')
+                return False
+
+        self._execution_context = context
+
+        with span('detect repository owning user and group'):
+            self.app_user, self.app_group_id = self.detect_repository_owning_user_and_group()
 
-        self.app_user, self.app_group_id = self.detect_repository_owning_user_and_group()
         self.is_dev_env = self.detect_dev_env(context)
         project_name = context.get_env('COMPOSE_PROJECT_NAME')
 
@@ -134,7 +246,83 @@ class HarborBaseTask(HarborTaskInterface):
             self.io().error_msg('COMPOSE_PROJECT_NAME environment variable is not defined, cannot proceed')
             return False
 
-        return self.run(context)
+        result = self.run(context)
+
+        if 'containers' in CachedLoader.items:
+            self.io().debug('Containers state snapshot: %s' % CachedLoader.items['containers'].get_snapshot_statistics())
+
+        return result
+
+    def sh(self, cmd: str, capture: bool = False, verbose: bool = False, strict: bool = True,
+           env: dict = None, use_subprocess: bool = False):
+        """Executes a shell command, the execution is recorded (see --timings)"""
+
+        with CommandTimings.measure(cmd) as timing:
+            output = super().sh(cmd, capture=capture, verbose=verbose, strict=strict, env=env,
+                                use_subprocess=use_subprocess)
+            timing.finish(0, output)
+
+            return output
+
+    def _report_command_timings(self, ctx: ExecutionContext):
+        """Prints recorded commands (--timings), moves recorded commands and spans to the trace file (when tracing
+        was started by --timings-trace in this process, or by the parent process)"""
+
+        if self._get_optional_arg(ctx, '--timings'):
+            self.io().outln(self.table(
+                header=['Category', 'Calls', 'Failed', 'Total time', 'Slowest', 'Captured output'],
+                body=[[category, calls, failed, '%.2fs' % total, '%.2fs' % slowest, format_size(captured)]
+                      for category, calls, failed, total, slowest, captured in CommandTimings.summarize()]
+            ))
+
+            self.io().outln(self.table(
+                header=['Slowest commands', 'Category', 'Time', 'Exit code'],
+                body=[[timing.command[0:80], timing.category, '%.2fs' % timing.duration, timing.exit_code]
+                      for timing in CommandTimings.get_slowest(5)]
+            ))
+
+        if os.getenv(TRACE_FILE_ENV):
+            append_to_trace(os.getenv(TRACE_FILE_ENV), self.get_full_name())
+
+            if self._get_optional_arg(ctx, '--timings-trace'):
+                self.io().info('Trace written to "%s"' % os.getenv(TRACE_FILE_ENV))
+
+    @staticmethod
+    def _get_optional_arg(ctx: ExecutionContext, name: str, default=None):
+        try:
+            return ctx.get_arg(name)
+        except KeyError:
+            return default
+
+    def rkd(self, args: list, verbose: bool = False, capture: bool = False) -> str:
+        """Executes other tasks. Harbor tasks are executed in the same process, other tasks in an RKD subprocess
+
+        Nested tasks may change containers state, so the state is fetched again after.
+        Set NESTED_TASKS_MODE=subprocess to always spawn an RKD subprocess.
+        """
+
+        def spawn_subprocess(subprocess_args: list, subprocess_capture: bool):
+            return super(HarborBaseTask, self).rkd(subprocess_args, verbose=verbose, capture=subprocess_capture)
+
+        try:
+            if verbose or not self._execution_context \
+                    or self._execution_context.get_env('NESTED_TASKS_MODE') != 'in-process':
+                return spawn_subprocess(args, capture)
+
+            return InProcessDispatcher(self, self._execution_context).dispatch(args, spawn_subprocess, capture=capture)
+        finally:
+            self._invalidate_containers_state()
+
+    def can_be_dispatched_in_process(self) -> bool:
+        """Can be executed in the same Python process, when called by other task. Tasks requiring isolation
+        (interactive terminal, external tools changing process state) should return False"""
+
+        return True
+
+    @staticmethod
+    def _invalidate_containers_state():
+        if 'containers' in CachedLoader.items:
+            CachedLoader.items['containers'].invalidate_snapshot()
 
     @staticmethod
     def detect_repository_owning_user_and_group() -> tuple:
@@ -153,7 +341,7 @@ class HarborBaseTask(HarborTaskInterface):
             usr = os.getenv('USER')
 
         if not grp:
-            grp = check_output(['id', '-g', usr]).decode('utf-8').strip()
+            grp = timed_check_output(['id', '-g', usr]).decode('utf-8').strip()
 
         return usr, int(grp)
 
@@ -172,6 +360,9 @@ class HarborBaseTask(HarborTaskInterface):
     def execute_hooks(self, ctx: ExecutionContext, hook_name: str):
         """Executes a hooks from directory "hooks.d", when any executed script will fail, then an exception is raised
 
+        Scripts are executed in lexical order, scripts placed in a subdirectory are executed in parallel.
+        Each script is limited to HOOK_TIMEOUT seconds (0 - no limit).
+
         The error handling must be implemented in the scripts itself
         """
 
@@ -183,21 +374,36 @@ class HarborBaseTask(HarborTaskInterface):
 
         self.io().info('Executing hook scripts for action "%s"' % hook_name)
 
-        for script in os.scandir(hooks_dir):
-            script: os.DirEntry
+        def on_stage_start(stage: List[str]):
+            for path in stage:
+                self.io().info('Running hook script "%s"%s' % (path, ' (parallel)' if len(stage) > 1 else ''))
+
+        try:
+            with span('hooks: %s' % hook_name):
+                results = HookRunner(self.io(), timeout=int(ctx.get_env('HOOK_TIMEOUT'))).run(
+                    collect_hook_stages(hooks_dir), on_start=on_stage_start)
+        finally:
+            self._invalidate_containers_state()
+
+        if not results:
+            return
+
+        self.io().outln(self.table(
+            header=['Hook script', 'Result', 'Duration'],
+            body=[[result.path, result.status, '%.1fs' % result.duration] for result in results]
+        ))
 
-            if script.name.split('.')[0] == '':
-                continue
+        failed = [result.path for result in results if not result.is_successful()]
 
-            self.io().info('Running hook script "%s"' % script.path)
+        if failed:
+            for path in failed:
+                self.io().error_msg('Failed executing script: "%s"' % path)
 
-            try:
-                self.sh(script.path)
-            except Exception as e:
-                self.io().error_msg('Failed executing script: "%s"' % script.path)
-                raise e
+            raise HookFailedException(hook_name, failed)
 
     def get_harbor_version(self) -> str:
+        import pkg_resources
+
         try:
             return pkg_resources.get_distribution("harbor").version
         except:
@@ -212,11 +418,15 @@ class HarborBaseTask(HarborTaskInterface):
 
 class BaseProfileSupportingTask(HarborBaseTask, ABC):
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--profile', '-p', help='Services profile', default='')
 
     def get_matching_services(self, ctx: ExecutionContext) -> List[ServiceDeclaration]:
-        service_selector = self.profile_loader(ctx).load_profile(ctx.get_arg('--profile'))
-        matched = service_selector.find_matching_services(self.get_services_as_raw_dict(ctx))
+        locator = self.services(ctx)
+
+        with span('profile selection', profile=ctx.get_arg('--profile')):
+            service_selector = self.profile_loader(ctx).load_profile(ctx.get_arg('--profile'))
+            matched = service_selector.find_matching_services(locator)
 
         return matched
 
@@ -227,3 +437,35 @@ class BaseProfileSupportingTask(HarborBaseTask, ABC):
             service_names.append(service.get_name())
 
         return service_names
+
+    def create_deployment_plan(self, ctx: ExecutionContext) -> List[PlannedAction]:
+        """Plans actions for services matching the profile. Containers of services that are no longer declared
+        are planned to be removed only when the whole project is selected (no --profile)"""
+
+        declared_names = None if ctx.get_arg('--profile') else list(self.get_services_as_raw_dict(ctx).keys())
+
+        return DeploymentPlanner(self.containers(ctx)).create_plan(self.get_matching_services(ctx), declared_names)
+
+    def print_deployment_plan(self, actions: List[PlannedAction]):
+        self.io().outln(self.table(
+            header=['Service', 'Action', 'Reason', 'Replicas', 'Estimated time'],
+            body=[[action.service_name, action.action, action.reason, action.replicas,
+                   '%is' % action.estimated_duration] for action in actions]
+        ))
+        self.io().info('Estimated total time: %is' % sum([action.estimated_duration for action in actions]))
+
+    def _create_service_up_args(self, ctx: ExecutionContext, service: ServiceDeclaration) -> list:
+        """Arguments of :harbor:service:up for a service, passing through switches of the current task"""
+
+        strategy = self._get_optional_arg(ctx, '--strategy')
+
+        args = [
+            '--no-ui',
+            ':harbor:service:up',
+            service.get_name(),
+            '--remove-previous-images' if self._get_optional_arg(ctx, '--remove-previous-images') else '',
+            '--force' if self._get_optional_arg(ctx, '--force') else '',
+            ('--strategy=%s' % strategy) if strategy else ''
+        ]
+
+        return [arg for arg in args if arg]
@@ -49,6 +49,7 @@ class AbstractManageConfigTask(HarborBaseTask):
     git_mv_command = 'git mv'
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--name', '-n', required=True, help='Configuration file name')
 
     def get_group_name(self) -> str:
@@ -7,6 +7,7 @@ from rkd.api.contract import ExecutionContext
 from ..base import HarborBaseTask
 from ...formatting import development_formatting
 from ...exception import MissingDeploymentConfigurationError
+from ...timings import timed_check_output
 from .base import BaseDeploymentTask
 
 HARBOR_ROOT = os.path.dirname(os.path.realpath(__file__)) + '/../../deployment/files'
@@ -54,6 +55,7 @@ Example usage:
         return envs
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--playbook', '-p', help='Playbook name', default='harbor.playbook.yml')
         parser.add_argument('--git-key', '-k', help='Path to private key for a git repository eg. ~/.ssh/id_rsa',
                             default='')
@@ -127,7 +129,7 @@ Example usage:
         return self.sh(command)
 
     def spawn_ssh_agent(self) -> Tuple[str, int]:
-        out = subprocess.check_output('eval $(ssh-agent -s);echo "|${SSH_AUTH_SOCK}|${SSH_AGENT_PID}";', shell=True).decode('utf-8')
+        out = timed_check_output('eval $(ssh-agent -s);echo "|${SSH_AUTH_SOCK}|${SSH_AGENT_PID}";', shell=True).decode('utf-8')
         parts = out.split('|')
         sock = parts[1]
         pid = int(parts[2].strip())
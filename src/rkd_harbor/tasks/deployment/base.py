@@ -12,6 +12,7 @@ from rkd.exception import MissingInputException
 from rkd.api.inputoutput import Wizard
 from ..base import HarborBaseTask
 from ...exception import MissingDeploymentConfigurationError
+from ...timings import timed_check_output
 
 HARBOR_ROOT = os.path.dirname(os.path.realpath(__file__)) + '/../../deployment/files'
 
@@ -21,6 +22,9 @@ class BaseDeploymentTask(HarborBaseTask, ABC):
     _config: dict
     vault_args: list = []
 
+    def can_be_dispatched_in_process(self) -> bool:
+        return False  # Ansible, SSH and Vault operations are interactive and use external processes
+
     def get_config(self) -> dict:
         """Loads and parses deployment.yml file.
 
@@ -248,8 +252,8 @@ class BaseDeploymentTask(HarborBaseTask, ABC):
         variables.update(self.get_config())
 
         if 'git_url' not in variables:
-            variables['git_url'] = subprocess\
-                .check_output(['git', 'config', '--get', 'remote.origin.url']).decode('utf-8')\
+            variables['git_url'] = timed_check_output(['git', 'config', '--get', 'remote.origin.url'])\
+                .decode('utf-8')\
                 .replace('\n', '')\
                 .strip()
 
@@ -20,6 +20,7 @@ class SSHTask(BaseDeploymentTask):
         return development_formatting(name)
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         self._add_ask_pass_arguments_to_argparse(parser)
         self._add_vault_arguments_to_argparse(parser)
 
@@ -2,6 +2,7 @@ import subprocess
 from argparse import ArgumentParser
 from rkd.api.contract import ExecutionContext
 from ...formatting import development_formatting
+from ...timings import timed_check_call
 from .base import BaseDeploymentTask
 
 
@@ -18,13 +19,14 @@ class ManageVagrantTask(BaseDeploymentTask):
         return development_formatting(name)
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--cmd', '-c', required=True, help='Vagrant commandline')
 
     def run(self, context: ExecutionContext) -> bool:
         cmd = context.get_arg('--cmd')
 
         try:
-            subprocess.check_call('cd %s && vagrant %s' % (self.ansible_dir, cmd), shell=True)
+            timed_check_call('cd %s && vagrant %s' % (self.ansible_dir, cmd), shell=True)
 
         except subprocess.CalledProcessError:
             return False
@@ -1,8 +1,8 @@
-import subprocess
 from typing import Dict
 from argparse import ArgumentParser
 from rkd.api.contract import ExecutionContext
 from ...formatting import development_formatting
+from ...timings import timed_check_call
 from .base import BaseDeploymentTask
 
 
@@ -37,6 +37,7 @@ NOTICE: When at least one of vault password files does not exist, then there wil
         return envs
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('filename', help='Filename')
         self._add_vault_arguments_to_argparse(parser)
 
@@ -44,7 +45,7 @@ NOTICE: When at least one of vault password files does not exist, then there wil
         vault_opts = self._get_vault_opts(context)
         filename = context.get_arg('filename')
 
-        subprocess.check_call('ansible-vault edit %s %s' % (vault_opts, filename), shell=True)
+        timed_check_call('ansible-vault edit %s %s' % (vault_opts, filename), shell=True)
 
         return True
 
@@ -69,6 +70,7 @@ See the documentation for :harbor:vault:edit task for general file encryption do
         return envs
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--decrypt', '-d', action='store_true', help='Decrypt instead of encrypting')
         parser.add_argument('filename', help='Filename')
         self._add_vault_arguments_to_argparse(parser)
@@ -106,6 +108,7 @@ required for services to work.
         return envs
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--decrypt', '-d', action='store_true', help='Decrypt instead of encrypting')
         self._add_vault_arguments_to_argparse(parser)
 
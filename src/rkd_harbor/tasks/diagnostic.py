@@ -35,6 +35,7 @@ class ListContainersTask(HarborBaseTask):
         return ':ps'
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--quiet', '-q', help='Only display IDs', action='store_true')
         parser.add_argument('--all', '-a', help='Show all containers, including stopped', action='store_true')
 
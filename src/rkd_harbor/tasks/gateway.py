@@ -4,6 +4,7 @@ from typing import Dict
 from rkd.api.contract import ExecutionContext
 from .base import HarborBaseTask
 from ..formatting import prod_formatting
+from ..timings import span
 
 
 class GatewayBaseTask(HarborBaseTask):
@@ -34,16 +35,19 @@ class ReloadGatewayTask(GatewayBaseTask):
     """Reload gateway, regenerate missing SSL certificates"""
 
     def run(self, ctx: ExecutionContext) -> bool:
-        self.io().h2('Validating NGINX configuration')
-        self.containers(ctx).exec_in_container('gateway', 'nginx -t')
+        with span('gateway: nginx configuration validation'):
+            self.io().h2('Validating NGINX configuration')
+            self.containers(ctx).exec_in_container('gateway', 'nginx -t')
 
-        self.io().h2('Reloading NGINX configuration')
-        self.containers(ctx).exec_in_container('gateway', 'nginx -s reload')
+        with span('gateway: nginx reload'):
+            self.io().h2('Reloading NGINX configuration')
+            self.containers(ctx).exec_in_container('gateway', 'nginx -s reload')
 
         if ctx.get_env('DISABLE_SSL').lower() != 'true':
-            self.io().h2('Reloading SSL configuration')
-            self.make_sure_ssl_service_is_up(ctx)
-            self.containers(ctx).exec_in_container('gateway_letsencrypt', '/app/signal_le_service')
+            with span('gateway: SSL reload'):
+                self.io().h2('Reloading SSL configuration')
+                self.make_sure_ssl_service_is_up(ctx)
+                self.containers(ctx).exec_in_container('gateway_letsencrypt', '/app/signal_le_service')
 
         return True
 
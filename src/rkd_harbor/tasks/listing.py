@@ -29,9 +29,10 @@ class ListDefinedServices(BaseProfileSupportingTask):
         table_body = []
 
         running = self.containers(ctx).get_created_containers(only_running=True)
+        locator = self.services(ctx)
 
         for service in services:
-            domains = service.get_domains()
+            domains = locator.get_domains_of(service.get_name())
 
             # GROUP-BY: list per-domain
             if group_by == 'url':
@@ -14,6 +14,7 @@ class BaseMaintenanceManagementTask(HarborBaseTask):
         return ':harbor:maintenance'
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('--domain', '-d', help='Domain name', default='')
         parser.add_argument('--service', '-s', help='Service name', default='')
         parser.add_argument('--global', '-g', help='Set maintenance for all domains', action='store_true')
@@ -50,7 +51,7 @@ class BaseMaintenanceManagementTask(HarborBaseTask):
 
     def act_for_service(self, directory: str, service: str, ctx: ExecutionContext):
         try:
-            domains = self.services(ctx).get_by_name(service).get_domains()
+            domains = self.services(ctx).get_domains_of(service)
 
         except ServiceNotFoundInYaml:
             self.io().error_msg('Service "%s" was not defined' % service)
@@ -1,13 +1,26 @@
 
 import os
+import re
 import json
+from time import time
 from traceback import format_exc
 from subprocess import CalledProcessError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from typing import Dict
+from typing import List
 from typing import Optional
+from typing import Tuple
 from argparse import ArgumentParser
+from dotenv import dotenv_values
 from rkd.api.contract import ExecutionContext
 from .base import HarborBaseTask
 from ..formatting import prod_formatting
+from ..repository_config import load_repository_config
+from ..exception import RepositoryConfigNotStaticException
+
+SPARSE_CHECKOUT_MIN_GIT_VERSION = (2, 25)  # "git clone --sparse" and "git sparse-checkout set"
 
 
 class BaseRepositoryTask(HarborBaseTask):
@@ -21,6 +34,7 @@ class BaseRepositoryTask(HarborBaseTask):
         return self.get_apps_path(context) + '/repos-enabled/%s.sh' % app_name
 
     def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
         parser.add_argument('name', help='Application name (based on data/repos-enabled/*.sh)')
 
     def contextual_sh(self, path: str, script: str, capture: bool = False):
@@ -49,11 +63,38 @@ class BaseRepositoryTask(HarborBaseTask):
         return project_vars[var_name]
 
     def _load_project_vars(self, path: str):
+        """Reads variables exported by the configuration file, on top of .env and the environment
+
+        Configuration files containing shell logic are sourced in bash.
+        """
+
+        try:
+            variables = dotenv_values('./.env') if os.path.isfile('./.env') else {}
+            variables.update(os.environ)
+
+            return load_repository_config(path).resolve(variables)
+
+        except RepositoryConfigNotStaticException as e:
+            self.io().debug('%s, falling back to bash' % str(e))
+
         return json.loads(
             self.contextual_sh(path, 'python3 -c "import json; import os; print(json.dumps(dict(os.environ)))"',
                                capture=True)
         )
 
+    def run_hook(self, path: str, hook_name: str, project_root_path: str):
+        """Executes a hook (eg. pre_update) defined in the configuration file. Not defined hooks are not executed"""
+
+        try:
+            if not load_repository_config(path).has_function(hook_name):
+                self.io().debug('%s() is not defined in %s' % (hook_name, path))
+                return
+
+        except RepositoryConfigNotStaticException:
+            pass
+
+        self.contextual_sh(path, '%s %s' % (hook_name, project_root_path))
+
     def list_repositories(self, context: ExecutionContext) -> list:
         path = self.get_apps_path(context) + '/repos-enabled'
         names = []
@@ -93,8 +134,13 @@ class FetchRepositoryTask(BaseRepositoryTask):
         project_root_path = self.get_apps_path(context) + '/www-data/' + self._get_var(
             project_vars, path, 'GIT_PROJECT_DIR')
 
+        if project_vars.get('GIT_SPARSE_PATHS') and self._get_git_version() < SPARSE_CHECKOUT_MIN_GIT_VERSION:
+            self.io().warn('GIT_SPARSE_PATHS requires git %s or newer, checking out all paths' %
+                           '.'.join(map(str, SPARSE_CHECKOUT_MIN_GIT_VERSION)))
+            project_vars = {name: value for name, value in project_vars.items() if name != 'GIT_SPARSE_PATHS'}
+
         # 1) run pre_update hook
-        self.contextual_sh(path, 'pre_update %s' % project_root_path)
+        self.run_hook(path, 'pre_update', project_root_path)
 
         # 2a) clone fresh repository
         if not os.path.isdir(project_root_path):
@@ -108,7 +154,7 @@ class FetchRepositoryTask(BaseRepositoryTask):
             self._pull_changes_into_existing_repository(path, project_vars)
 
         # 3) run pre_update hook
-        self.contextual_sh(path, 'post_update %s' % project_root_path)
+        self.run_hook(path, 'post_update', project_root_path)
 
         self.io().print_opt_line()
         self.io().success_msg('Application\'s repository updated.')
@@ -116,28 +162,56 @@ class FetchRepositoryTask(BaseRepositoryTask):
         return True
 
     def _pull_changes_into_existing_repository(self, config_path: str, project_vars):
-        """Updates existing local repository with remote changes"""
+        """Updates existing local repository with remote changes
+
+        Fetches GIT_BRANCH (or remote's default branch) and fast-forwards the working copy. Shallow repositories fetch
+        only GIT_DEPTH commits, in case when the local history does not reach the new commits (no common commit
+        in both histories) then the working copy is moved to the fetched commit, keeping local modifications.
+        Local commits of a diverged branch are never discarded - the update fails instead.
+        """
 
-        # pass variables from Python to early-validate instead of throwing bash undeclared-var errors
-        git_proto = self._get_var(project_vars, config_path, 'GIT_PROTO')
         git_project_dir = self._get_var(project_vars, config_path, 'GIT_PROJECT_DIR')
-        git_user = self._get_var(project_vars, config_path, 'GIT_USER')
-        git_server = self._get_var(project_vars, config_path, 'GIT_SERVER')
-        git_password = self._get_var(project_vars, config_path, 'GIT_PASSWORD')
-        git_org_name = self._get_var(project_vars, config_path, 'GIT_ORG_NAME')
-        git_project_name = self._get_var(project_vars, config_path, 'GIT_PROJECT_NAME')
+        git_branch = project_vars.get('GIT_BRANCH', '')
+        git_depth = project_vars.get('GIT_DEPTH', '')
+        git_sparse_paths = project_vars.get('GIT_SPARSE_PATHS', '')
+        remote_url = self._get_remote_url(config_path, project_vars)
 
+        # "origin" is kept between updates (partial clones are fetching missing objects from it), its URL is updated
+        # only in case, when the configuration was changed
         command = '''
                 set -e
                 cd "./apps/www-data/''' + git_project_dir + '''"
-    
-                echo " >> Setting remote origin"
-                %sudo% git config pull.rebase false
-                %sudo% git remote remove origin 2>/dev/null || true
-                %sudo% git remote add origin ''' + git_proto + '''://''' + git_user + ''':''' + git_password + '''@''' + git_server + '''/''' + git_org_name + '''/''' + git_project_name + '''
-                %sudo% git pull origin master
-                %sudo% git remote remove origin 2>/dev/null || true
 
+                if [[ "$(%sudo% git remote get-url origin 2>/dev/null)" != "''' + remote_url + '''" ]]; then
+                    echo " >> Setting remote origin"
+                    %sudo% git remote remove origin 2>/dev/null || true
+                    %sudo% git remote add origin "''' + remote_url + '''"
+                fi
+
+                echo " >> Fetching ''' + (git_branch or 'default branch') + '''"
+                %sudo% git fetch ''' + self._get_fetch_options(project_vars) + ''' origin ''' + (git_branch or 'HEAD') + '''
+            '''
+
+        if git_sparse_paths:
+            command += '''
+                %sudo% git sparse-checkout set ''' + git_sparse_paths + '''
+            '''
+
+        if git_depth:
+            command += '''
+                if ! %sudo% git merge --ff-only FETCH_HEAD; then
+                    if %sudo% git merge-base HEAD FETCH_HEAD > /dev/null; then
+                        echo " >> Local branch has diverged from the remote branch, resolve it manually"
+                        exit 1
+                    fi
+
+                    echo " >> Shallow history does not reach fetched commits, moving to the fetched commit"
+                    %sudo% git reset --keep FETCH_HEAD
+                fi
+            '''
+        else:
+            command += '''
+                %sudo% git merge --ff-only FETCH_HEAD
             '''
 
         return self.contextual_sh(
@@ -148,20 +222,28 @@ class FetchRepositoryTask(BaseRepositoryTask):
     def _clone_new_repository(self, config_path: str, project_vars: dict):
         """Clones a new repository"""
 
-        # pass variables from Python to early-validate instead of throwing bash undeclared-var errors
-        git_proto = self._get_var(project_vars, config_path, 'GIT_PROTO')
         git_project_dir = self._get_var(project_vars, config_path, 'GIT_PROJECT_DIR')
-        git_user = self._get_var(project_vars, config_path, 'GIT_USER')
-        git_server = self._get_var(project_vars, config_path, 'GIT_SERVER')
-        git_password = self._get_var(project_vars, config_path, 'GIT_PASSWORD')
-        git_org_name = self._get_var(project_vars, config_path, 'GIT_ORG_NAME')
-        git_project_name = self._get_var(project_vars, config_path, 'GIT_PROJECT_NAME')
+        git_sparse_paths = project_vars.get('GIT_SPARSE_PATHS', '')
 
         full_project_dir = os.path.realpath('./apps/www-data') + '/' + git_project_dir
+        options = self._get_fetch_options(project_vars)
+
+        if project_vars.get('GIT_BRANCH'):
+            options += ' --branch ' + project_vars['GIT_BRANCH']
+
+        if git_sparse_paths:
+            options += ' --sparse'
 
         command = '''
-                %sudo% git clone ''' + git_proto + '''://''' + git_user + ''':''' + git_password + '''@''' + git_server + '''/''' + git_org_name + '''/''' + git_project_name + ''' \
-                    ''' + full_project_dir + ''' 
+                set -e
+                %sudo% git clone ''' + options + ' ' + self._get_remote_url(config_path, project_vars) + ''' \
+                    ''' + full_project_dir + '''
+            '''
+
+        if git_sparse_paths:
+            command += '''
+                cd "''' + full_project_dir + '''"
+                %sudo% git sparse-checkout set ''' + git_sparse_paths + '''
             '''
 
         command = command.replace('%sudo%', self._get_permissions_command())
@@ -171,6 +253,37 @@ class FetchRepositoryTask(BaseRepositoryTask):
             command
         )
 
+    def _get_remote_url(self, config_path: str, project_vars: dict) -> str:
+        # pass variables from Python to early-validate instead of throwing bash undeclared-var errors
+        git_proto = self._get_var(project_vars, config_path, 'GIT_PROTO')
+        git_user = self._get_var(project_vars, config_path, 'GIT_USER')
+        git_server = self._get_var(project_vars, config_path, 'GIT_SERVER')
+        git_password = self._get_var(project_vars, config_path, 'GIT_PASSWORD')
+        git_org_name = self._get_var(project_vars, config_path, 'GIT_ORG_NAME')
+        git_project_name = self._get_var(project_vars, config_path, 'GIT_PROJECT_NAME')
+
+        return git_proto + '://' + git_user + ':' + git_password + '@' + git_server + '/' + git_org_name + '/' + \
+            git_project_name
+
+    def _get_git_version(self) -> Tuple[int, ...]:
+        match = re.search(r'([0-9]+)\.([0-9]+)', self.sh('git --version', capture=True))
+
+        return tuple(map(int, match.groups())) if match else (0, 0)
+
+    @staticmethod
+    def _get_fetch_options(project_vars: dict) -> str:
+        """Shallow (GIT_DEPTH) and partial (GIT_FILTER, eg. blob:none) clone options, shared by clone and fetch"""
+
+        options = []
+
+        if project_vars.get('GIT_DEPTH'):
+            options.append('--depth %i' % int(project_vars['GIT_DEPTH']))
+
+        if project_vars.get('GIT_FILTER'):
+            options.append('--filter=%s' % project_vars['GIT_FILTER'])
+
+        return ' '.join(options)
+
 
 class SetPermissionsForWritableDirectoriesTask(BaseRepositoryTask):
     """Make sure that the application would be able to write to allowed directories (eg. upload directories)"""
@@ -208,7 +321,7 @@ class ListRepositoriesTask(BaseRepositoryTask):
     """List GIT repositories"""
 
     def configure_argparse(self, parser: ArgumentParser):
-        pass
+        HarborBaseTask.configure_argparse(self, parser)
 
     def get_name(self) -> str:
         return ':list'
@@ -226,14 +339,19 @@ class ListRepositoriesTask(BaseRepositoryTask):
 
 
 class FetchAllRepositories(BaseRepositoryTask):
-    """List GIT repositories
+    """Fetch all GIT repositories
 
     Ignores intermediate errors. When at least one repository fails to update,
     then overall status would be a failure.
+
+    With --parallel multiple repositories are updated at once, output of each repository is printed as one block
+    after its update finishes.
     """
 
     def configure_argparse(self, parser: ArgumentParser):
-        pass
+        HarborBaseTask.configure_argparse(self, parser)
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='Update up to N repositories at once (default: 1 - one by one)')
 
     def get_name(self) -> str:
         return ':update-all'
@@ -241,18 +359,74 @@ class FetchAllRepositories(BaseRepositoryTask):
     def run(self, context: ExecutionContext) -> bool:
         self.io().info('Fetching all repositories...')
 
-        result = True
+        parallel = int(context.get_arg('--parallel'))
+        names = self.list_repositories(context)
 
         with self.hooks_executed(context, 'repositories-upgrade'):
-            for name in self.list_repositories(context):
-                self.io().info('Updating "%s"' % name)
+            if parallel > 1:
+                summary = self._update_in_parallel(names, parallel)
+            else:
+                summary = self._update_one_by_one(names)
 
-                try:
-                    self.rkd([':harbor:git:apps:update', name])
+        self.io().print_opt_line()
+        self.io().outln(self.table(
+            header=['Repository', 'Result', 'Duration'],
+            body=[[name, 'OK' if succeeded else 'FAILED', '%.1fs' % duration]
+                  for name, (succeeded, duration) in summary.items()]
+        ))
+
+        return all([succeeded for succeeded, duration in summary.values()])
+
+    def _update_one_by_one(self, names: List[str]) -> Dict[str, Tuple[bool, float]]:
+        summary = OrderedDict()
+
+        for name in names:
+            self.io().info('Updating "%s"' % name)
+            started_at = time()
+
+            try:
+                self.rkd([':harbor:git:apps:update', name])
+                succeeded = True
+
+            except CalledProcessError:
+                self.io().err(format_exc())
+                self.io().error_msg('Failed updating "%s"' % name)
+                succeeded = False
+
+            summary[name] = (succeeded, time() - started_at)
+
+        return summary
+
+    def _update_in_parallel(self, names: List[str], parallel: int) -> Dict[str, Tuple[bool, float]]:
+        summary = OrderedDict()
 
-                except CalledProcessError:
-                    self.io().err(format_exc())
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = {executor.submit(self._update_captured, name): name for name in names}
+
+            for future in as_completed(futures):
+                name = futures[future]
+                succeeded, output, duration = future.result()
+
+                self.io().h2('Updating "%s"' % name)
+                self.io().outln(output.strip())
+
+                if not succeeded:
                     self.io().error_msg('Failed updating "%s"' % name)
-                    result = False
 
-        return result
+                summary[name] = (succeeded, duration)
+
+        return OrderedDict([(name, summary[name]) for name in names])
+
+    def _update_captured(self, name: str) -> Tuple[bool, str, float]:
+        """Runs :harbor:git:apps:update, buffering the output, so it is not mixed with output of other repositories"""
+
+        started_at = time()
+
+        try:
+            output = self.rkd(['--no-ui', ':harbor:git:apps:update', name, '2>&1'], capture=True) or ''
+            return True, output, time() - started_at
+
+        except CalledProcessError as e:
+            output = e.output.decode('utf-8', errors='replace') if isinstance(e.output, bytes) else (e.output or '')
+
+            return False, output + str(e), time() - started_at
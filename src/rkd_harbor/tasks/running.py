@@ -1,14 +1,31 @@
 from argparse import ArgumentParser
 from subprocess import CalledProcessError
+from time import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from typing import Optional
+from typing import Tuple
 from rkd.api.contract import ExecutionContext
 from .base import BaseProfileSupportingTask
 from .base import UpdateStrategy
+from ..service import ServiceDeclaration
+from ..service import group_by_priority
+from ..plan import ACTION_REMOVE
+from ..pull import format_size
+from ..pull import group_services_by_image
 
 
 class StartTask(BaseProfileSupportingTask):
     """Create and start containers
+
+    With --parallel services having same priority (org.riotkit.priority label) are started together,
+    the next priority group is started only after all services from the current group started successfully.
+
+    With --from-plan only services listed by :harbor:plan are touched, and containers of services that are no longer
+    declared are removed (only when no --profile is selected).
     """
-    
+
     def configure_argparse(self, parser: ArgumentParser):
         super().configure_argparse(parser)
         parser.add_argument('--strategy', '-s',
@@ -17,42 +34,139 @@ class StartTask(BaseProfileSupportingTask):
                             type=UpdateStrategy, choices=list(UpdateStrategy))
         parser.add_argument('--remove-previous-images', action='store_true',
                             help='Remove previous images if service had changed docker image')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='Start up to N services of same priority at once (default: 1 - one by one)')
+        parser.add_argument('--force', action='store_true',
+                            help='Update services even if they are up-to-date')
+        parser.add_argument('--from-plan', action='store_true',
+                            help='Execute only actions listed by :harbor:plan')
 
     def get_name(self) -> str:
         return ':start'
 
     def run(self, context: ExecutionContext) -> bool:
         services = self.get_matching_services(context)
-        strategy = context.get_arg('--strategy')
-        result = True
+        parallel = int(context.get_arg('--parallel'))
 
         with self.hooks_executed(context, 'start'):
-            for service in services:
-                self.io().h2('Starting "%s" (%i instances)...' % (service.get_name(), service.get_desired_replicas_count()))
+            # removals are a part of the deployment, so the "pre-start" hooks are executed before them
+            if context.get_arg('--from-plan'):
+                services = self._execute_removals_and_filter_planned(context, services)
 
-                try:
-                    self.rkd(
-                        [
-                            '--no-ui',
-                            ':harbor:service:up',
-                            service.get_name(),
-                            '--remove-previous-images' if context.get_arg('--remove-previous-images') else '',
-                            ('--strategy=%s' % strategy) if strategy else ''
-                        ],
-                        capture=not self.io().is_log_level_at_least('info')
-                    )
+                if not services:
+                    self.io().success_msg('Nothing to do, all services are up-to-date')
+                    return True
 
-                    self.io().success_msg('Service "%s" was started' % service.get_name())
+            if parallel > 1:
+                return self._start_in_priority_groups(context, services, parallel)
 
-                except CalledProcessError as e:
-                    self.io().err(str(e))
-                    self.io().error_msg('Cannot start service "%s"' % service.get_name())
-                    result = False
+            return self._start_one_by_one(context, services)
 
-                self.io().print_opt_line()
+    def _execute_removals_and_filter_planned(self, context: ExecutionContext,
+                                             services: List[ServiceDeclaration]) -> List[ServiceDeclaration]:
+        """Removes containers planned to be removed, returns only services that have planned actions"""
+
+        actions = self.create_deployment_plan(context)
+        self.print_deployment_plan(actions)
+
+        for action in actions:
+            if action.action == ACTION_REMOVE:
+                self.io().info('Removing containers of "%s" (%s)' % (action.service_name, action.reason))
+                self.containers(context).rm_undeclared(action.service_name)
+
+        planned_names = [action.service_name for action in actions if action.action != ACTION_REMOVE]
+
+        return [service for service in services if service.get_name() in planned_names]
+
+    def _start_one_by_one(self, context: ExecutionContext, services: List[ServiceDeclaration]) -> bool:
+        """Starts services in order. On failure continues with next services, but the result is a failure"""
+
+        result = True
+
+        for service in services:
+            self.io().h2('Starting "%s" (%i instances)...' % (service.get_name(), service.get_desired_replicas_count()))
+
+            try:
+                self.rkd(
+                    self._create_service_up_args(context, service),
+                    capture=not self.io().is_log_level_at_least('info')
+                )
+
+                self.io().success_msg('Service "%s" was started' % service.get_name())
+
+            except CalledProcessError as e:
+                self.io().err(str(e))
+                self.io().error_msg('Cannot start service "%s"' % service.get_name())
+                result = False
+
+            self.io().print_opt_line()
 
         return result
 
+    def _start_in_priority_groups(self, context: ExecutionContext, services: List[ServiceDeclaration],
+                                  parallel: int) -> bool:
+        """Starts services of same priority concurrently. Stops at first priority group that did not fully start"""
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            for group in group_by_priority(services):
+                self.io().h2('Starting priority %i: %s' % (
+                    group[0].get_priority_number(), ', '.join([service.get_name() for service in group])
+                ))
+
+                results = executor.map(lambda service: self._start_service_captured(context, service), group)
+                group_succeeded = True
+
+                for service, (succeeded, output) in zip(group, results):
+                    for line in output.strip().splitlines():
+                        self.io().outln('[%s] %s' % (service.get_name(), line))
+
+                    if succeeded:
+                        self.io().success_msg('Service "%s" was started' % service.get_name())
+                    else:
+                        self.io().error_msg('Cannot start service "%s"' % service.get_name())
+                        group_succeeded = False
+
+                self.io().print_opt_line()
+
+                if not group_succeeded:
+                    self.io().error_msg('Not starting services of lower priority, as previous group failed to start')
+                    return False
+
+        return True
+
+    def _start_service_captured(self, context: ExecutionContext, service: ServiceDeclaration) -> Tuple[bool, str]:
+        """Runs :harbor:service:up, buffering the output, so it could be printed without mixing with other services"""
+
+        try:
+            return True, self.rkd(self._create_service_up_args(context, service) + ['2>&1'], capture=True) or ''
+
+        except CalledProcessError as e:
+            output = e.output.decode('utf-8', errors='replace') if isinstance(e.output, bytes) else (e.output or '')
+
+            return False, output + str(e)
+
+
+class PlanTask(BaseProfileSupportingTask):
+    """Show what needs to be done to bring services to their declared state
+
+    Compares declared replicas, image and definition of each service with the current state of containers.
+    Execute the plan with ":harbor:start --from-plan"
+    """
+
+    def get_name(self) -> str:
+        return ':plan'
+
+    def run(self, context: ExecutionContext) -> bool:
+        actions = self.create_deployment_plan(context)
+
+        if not actions:
+            self.io().success_msg('All services are up-to-date')
+            return True
+
+        self.print_deployment_plan(actions)
+
+        return True
+
 
 class StopTask(BaseProfileSupportingTask):
     """Stop running containers (preserving the order - the gateway should be turned off first)
@@ -117,15 +231,36 @@ class StopAndRemoveTask(BaseProfileSupportingTask):
 
 class PullTask(BaseProfileSupportingTask):
     """Pull images specified in containers definitions
+
+    Images are pulled concurrently (--parallel), failed pulls are retried (--retries). Images pinned to a digest
+    (eg. nginx@sha256:...) are not pulled again, when already present.
     """
 
     def get_name(self) -> str:
         return ':pull'
 
+    def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
+        parser.add_argument('--parallel', type=int, default=4, help='Images pulled at once (default: 4)')
+        parser.add_argument('--retries', type=int, default=2,
+                            help='Retries of a failed pull, with an increasing delay (default: 2)')
+
     def run(self, ctx: ExecutionContext) -> bool:
-        self.containers(ctx).pull(self.get_matching_service_names(ctx))
+        results = self.containers(ctx).pull_images(self.get_matching_services(ctx),
+                                                   workers=int(ctx.get_arg('--parallel')),
+                                                   retries=int(ctx.get_arg('--retries')))
 
-        return True
+        self.io().outln(self.table(
+            header=['Image', 'Services', 'Result', 'Size', 'Time', 'Attempts'],
+            body=[[result.image, ', '.join(result.services), result.status, format_size(result.size),
+                   '%.1fs' % result.duration, result.attempts] for result in results]
+        ))
+
+        for result in results:
+            if not result.is_successful():
+                self.io().error_msg('Cannot pull "%s": %s' % (result.image, result.reason))
+
+        return all([result.is_successful() for result in results])
 
 
 class UpgradeTask(BaseProfileSupportingTask):
@@ -138,6 +273,10 @@ class UpgradeTask(BaseProfileSupportingTask):
      4. Upgrade services one-by-one
      5. Restart gateway
      6. Call SSL to refresh
+
+    With --pipeline the git repositories are updated while images are pulled (up to --parallel images at once),
+    and each service is started (in priority order) as soon as its image is pulled. Services mounting
+    application repositories (apps/www-data) are started after repositories are updated.
     """
 
     def get_name(self) -> str:
@@ -151,6 +290,11 @@ class UpgradeTask(BaseProfileSupportingTask):
                             type=UpdateStrategy, choices=list(UpdateStrategy))
         parser.add_argument('--remove-previous-images', action='store_true',
                             help='Remove previous images if service had changed docker image')
+        parser.add_argument('--pipeline', action='store_true',
+                            help='Update repositories and pull images concurrently, start services as soon as ' +
+                                 'their images are pulled')
+        parser.add_argument('--parallel', type=int, default=4,
+                            help='Images pulled at once in --pipeline mode (default: 4)')
 
     def run(self, context: ExecutionContext) -> bool:
         profile = context.get_arg('--profile')
@@ -158,6 +302,9 @@ class UpgradeTask(BaseProfileSupportingTask):
         success = True
 
         with self.hooks_executed(context, 'upgrade'):
+            if context.get_arg('--pipeline'):
+                return self._upgrade_in_pipeline(context)
+
             self.rkd([
                 '--no-ui',
                 ':harbor:templates:render',
@@ -171,3 +318,97 @@ class UpgradeTask(BaseProfileSupportingTask):
             ])
 
         return success
+
+    def _upgrade_in_pipeline(self, context: ExecutionContext) -> bool:
+        started_at = time()
+        self.rkd(['--no-ui', ':harbor:templates:render'])
+
+        services = self.get_matching_services(context)
+        success = True
+
+        with ThreadPoolExecutor(max_workers=1) as git_executor, \
+                ThreadPoolExecutor(max_workers=int(context.get_arg('--parallel'))) as pull_executor:
+
+            repositories = git_executor.submit(self._update_repositories)
+            pulls = {}
+            reported = set()
+
+            # each image is pulled once, also when multiple services are using it
+            for image_services in group_services_by_image(services).values():
+                pull = pull_executor.submit(self._pull_image, context, image_services)
+                pulls.update({service.get_name(): pull for service in image_services})
+
+            # services are started one-by-one in priority order, each one as soon as its prerequisites are ready
+            for service in services:
+                if not self._wait_for_prerequisites(service, pulls.get(service.get_name()), repositories, reported):
+                    success = False
+                    continue
+
+                self.io().h2('Starting "%s"' % service.get_name())
+
+                try:
+                    self.rkd(self._create_service_up_args(context, service))
+                    self.io().success_msg('Service "%s" was started' % service.get_name())
+
+                except CalledProcessError as e:
+                    self.io().err(str(e))
+                    self.io().error_msg('Cannot start service "%s"' % service.get_name())
+                    success = False
+
+            if not self._get_reported_result(repositories, reported):
+                success = False
+
+        self.rkd(['--no-ui', ':harbor:gateway:reload'])
+        self.io().info('Upgrade finished in %.1fs' % (time() - started_at))
+
+        return success
+
+    def _wait_for_prerequisites(self, service: ServiceDeclaration, pull: Optional[Future], repositories: Future,
+                                reported: set) -> bool:
+        # services built locally have nothing to pull
+        if pull is not None and not self._get_reported_result(pull, reported):
+            self.io().error_msg('Not starting "%s", as its image was not pulled' % service.get_name())
+            return False
+
+        if self._is_using_application_repositories(service) and not self._get_reported_result(repositories, reported):
+            self.io().error_msg('Not starting "%s", as application repositories were not updated' % service.get_name())
+            return False
+
+        return True
+
+    def _get_reported_result(self, job: Future, reported: set) -> bool:
+        """Waits for a background job. Its output is printed once, by the main thread - not mixed with other output"""
+
+        succeeded, output = job.result()
+
+        if job not in reported:
+            reported.add(job)
+
+            if output.strip():
+                self.io().outln(output.strip())
+
+        return succeeded
+
+    def _update_repositories(self) -> Tuple[bool, str]:
+        """Runs :harbor:git:apps:update-all in background. Returns the output to be printed as one block"""
+
+        try:
+            return True, self.rkd(['--no-ui', ':harbor:git:apps:update-all', '2>&1'], capture=True) or ''
+
+        except CalledProcessError as e:
+            return False, e.output.decode('utf-8', errors='replace') if isinstance(e.output, bytes) else (e.output or '')
+
+    def _pull_image(self, context: ExecutionContext, services: List[ServiceDeclaration]) -> Tuple[bool, str]:
+        """Pulls an image shared by given services"""
+
+        result = self.containers(context).pull_images(services, workers=1)[0]
+        names = ', '.join([service.get_name() for service in services])
+
+        if not result.is_successful():
+            return False, '[%s] %s' % (names, result.reason)
+
+        return True, '[%s] image %s (%.1fs, %s)' % (names, result.status, result.duration, format_size(result.size))
+
+    @staticmethod
+    def _is_using_application_repositories(service: ServiceDeclaration) -> bool:
+        return any(['www-data' in path for path in service.get_mounted_paths()])
@@ -1,7 +1,5 @@
-import subprocess
 import json
 from time import time
-from time import sleep
 from contextlib import contextmanager
 from argparse import ArgumentParser
 from rkd.api.contract import ExecutionContext
@@ -9,6 +7,11 @@ from .base import HarborBaseTask
 from .base import UpdateStrategy
 from ..exception import ServiceNotCreatedException
 from ..service import ServiceDeclaration
+from ..health import HEALTHY
+from ..health import NO_HEALTH_CHECK
+from ..health import DIED
+from ..health import TIMEOUT
+from ..timings import span
 
 
 class BaseHarborServiceTask(HarborBaseTask):
@@ -61,6 +64,9 @@ class ServiceUpTask(BaseHarborServiceTask):
         3) recreate: Removes container and creates a new one, does not affect volumes
 
         3) auto (default): Performs automatic selection basing on label "org.riotkit.updateStrategy", defaults to "compose"
+
+    Services that are already up-to-date (all replicas running, created from current definition and current local image)
+    are skipped. Use --force to update anyway. Explicitly selected "recreate" strategy always recreates the containers.
     """
 
     def get_name(self) -> str:
@@ -76,6 +82,13 @@ class ServiceUpTask(BaseHarborServiceTask):
                             type=UpdateStrategy, choices=list(UpdateStrategy))
         parser.add_argument('--remove-previous-images', action='store_true',
                             help='Remove previous images if service had changed docker image')
+        parser.add_argument('--force', action='store_true',
+                            help='Update the service even if it is up-to-date')
+        parser.add_argument('--rolling-batch-size', type=int, default=None,
+                            help='Replicas replaced at once (rolling). Overrides "org.riotkit.rollingBatchSize" label')
+        parser.add_argument('--rolling-max-surge', type=int, default=None,
+                            help='Replicas that can be created above desired count (rolling). ' +
+                                 'Overrides "org.riotkit.rollingMaxSurge" label')
 
     def run(self, context: ExecutionContext) -> bool:
         service_name = context.get_arg('name')
@@ -89,7 +102,13 @@ class ServiceUpTask(BaseHarborServiceTask):
             'recreate': lambda: self.deploy_recreate(service, context)
         }
 
+        # hooks are executed also for services that are up-to-date
         with self.hooks_executed(context, 'service-start-%s' % service_name):
+            if strategy != 'recreate' and not context.get_arg('--force') \
+                    and self.containers(context).is_service_up_to_date(service):
+                self.io().success_msg('Service "%s" is up-to-date' % service_name)
+                return True
+
             with self._old_images_clean_up(context, service, clear_images=remove_previous_images):
                 if strategy in strategies:
                     return strategies[strategy]()
@@ -133,48 +152,61 @@ class ServiceUpTask(BaseHarborServiceTask):
         """Rolling-update (without a downtime)
 
         1. Stop service discovery (to not add our not-ready-yet container to the load balancing)
-        2. Scale up service one by one
-        3. When health check is OK, then turn off older instance
+        2. Scale up service by a batch of replicas (org.riotkit.rollingBatchSize, limited by org.riotkit.rollingMaxSurge)
+        3. When health check of all new replicas is OK, then turn off same number of older instances
         4. Start service discovery
         5. Repeat until get replaced all of the replicas
         """
 
         self.io().info('Doing a "rolling" deployment for "%s"' % service.get_name())
         desired_replicas = service.get_desired_replicas_count()
+        batch_size = self.get_rolling_batch_size(service, ctx)
         processed = 0
 
-        for replica_num in range(1, desired_replicas + 1):
-            self.io().info('Processing instance #%i/%i' % (replica_num, desired_replicas))
+        while processed < desired_replicas:
+            surge = min(batch_size, desired_replicas - processed)
+            self.io().info('Processing instances #%i-%i/%i' % (processed + 1, processed + surge, desired_replicas))
 
             with self.containers(ctx).service_discovery_stopped():
                 try:
-                    existing_containers = self.containers(ctx).scale_one_up(service)
-
-                    self.rkd([
-                        '--no-ui',
-                        ':harbor:service:wait-for',
-                        service.get_name(),
-                        '--instance=%s' % max(existing_containers.keys())
-                    ])
-
-                    self.containers(ctx).kill_older_replica_than(
-                        service,
-                        self.get_project_name(ctx),
-                        existing_containers,
-                        processed + 1
-                    )
+                    with span('scale_up', service=service.get_name(), surge=surge):
+                        existing_containers = self.containers(ctx).scale_up(service, surge)
+
+                    with span('wait-for', service=service.get_name()):
+                        self.rkd([
+                            '--no-ui',
+                            ':harbor:service:wait-for',
+                            service.get_name(),
+                            '--instance=%s' % ','.join(map(str, list(existing_containers.keys())[-surge:]))
+                        ])
+
+                    with span('kill_older_replicas', service=service.get_name()):
+                        self.containers(ctx).kill_older_replicas(service, existing_containers, processed, surge)
 
                 except Exception as e:
                     self.io().error('Scaling back to declared state as error happened: %s' % str(e))
                     self.containers(ctx).scale_to_desired_state(service)
                     raise e
 
-                processed += 1
+                processed += surge
 
             self.io().print_opt_line()
 
         return True
 
+    @staticmethod
+    def get_rolling_batch_size(service: ServiceDeclaration, ctx: ExecutionContext) -> int:
+        """Replicas replaced at once - commandline switches takes precedence over labels.
+        When only one of batch size and max surge is defined, then both have same value. Defaults to 1"""
+
+        batch_size = ctx.get_arg('--rolling-batch-size') or service.get_rolling_batch_size()
+        max_surge = ctx.get_arg('--rolling-max-surge') or service.get_rolling_max_surge()
+
+        batch_size = int(batch_size or max_surge or 1)
+        max_surge = int(max_surge or batch_size)
+
+        return max(min(batch_size, max_surge), 1)
+
     def deploy_compose_like(self, service: ServiceDeclaration, ctx: ExecutionContext) -> bool:
         """Regular docker-compose up deployment (with downtime)"""
 
@@ -243,6 +275,9 @@ class ServiceStopTask(BaseHarborServiceTask):
 class ExecTask(BaseHarborServiceTask):
     """Execute a command in a container"""
 
+    def can_be_dispatched_in_process(self) -> bool:
+        return False  # needs an interactive terminal
+
     def configure_argparse(self, parser: ArgumentParser):
         super().configure_argparse(parser)
         parser.add_argument('--instance-num', '-i', default=None, help='Instance number. If None, then will pick last.')
@@ -411,62 +446,44 @@ class WaitForServiceTask(BaseHarborServiceTask):
 
     def configure_argparse(self, parser: ArgumentParser):
         super().configure_argparse(parser)
-        parser.add_argument('--instance', '-i', required=False, help='Instance name, full container name')
+        parser.add_argument('--instance', '-i', required=False,
+                            help='Instance number, or multiple comma-separated numbers to wait for all of them')
         parser.add_argument('--timeout', '-t', default='120', help='Timeout in seconds')
 
     def run(self, ctx: ExecutionContext) -> bool:
         service_name = ctx.get_arg('name')
         timeout = int(ctx.get_arg('--timeout'))
-        instance_num = int(ctx.get_arg('--instance')) if ctx.get_arg('--instance') else None
+        instances = [int(num) for num in str(ctx.get_arg('--instance')).split(',') if num.strip()] \
+            if ctx.get_arg('--instance') else [None]
 
         service = self.services(ctx).get_by_name(service_name)
 
         try:
-            container_name = self.containers(ctx).find_container_name(service, instance_num)
-            container = self.containers(ctx).inspect_container(container_name)
+            container_names = [self.containers(ctx).find_container_name(service, num) for num in instances]
         except ServiceNotCreatedException as e:
             self.io().error_msg(str(e))
             return False
 
         started_at = time()
 
-        self.io().info('Checking health of "%s" service - %s' % (service_name, container_name))
-
-        if container.has_health_check():
-            while True:
-                if time() - started_at >= timeout:
-                    self.io().error_msg('Timeout of %is reached.' % timeout)
-                    return False
-
-                health = container.get_health_status()
+        self.io().info('Checking health of "%s" service - %s' % (service_name, ', '.join(container_names)))
+        results = self.containers(ctx).wait_for_health(container_names, timeout)
 
-                # do not wait for result, do check manually in mean time
-                if health == 'starting':
-                    self.io().warn('Docker reports "starting" - performing a manual check, we wont wait for docker')
+        for container_name, result in results.items():
+            if result == NO_HEALTH_CHECK:
+                self.io().warn('Instance has no healthcheck defined! (%s)' % container_name)
 
-                    try:
-                        command = container.get_health_check_command().replace('"', '\\"')
+            elif result == DIED:
+                self.io().error_msg('Container "%s" exited and will not be restarted' % container_name)
 
-                        self.containers(ctx).exec_in_container(
-                            service_name=service_name,
-                            command='/bin/sh -c "%s"' % command,
-                            instance_num=instance_num
-                        )
-
-                        self.io().success_msg('Service healthy after %is' % (time() - started_at))
-                        return True
-
-                    except subprocess.CalledProcessError as e:
-                        self.io().debug(str(e.output)[0:128])
-                        sleep(1)
-                        continue
+        if TIMEOUT in results.values():
+            self.io().error_msg('Timeout of %is reached.' % timeout)
+            return False
 
-                if health == 'healthy' or health == 'running':
-                    self.io().success_msg('Service healthy after %i' % (time() - started_at))
-                    return True
+        if DIED in results.values():
+            return False
 
-                sleep(1)
-        else:
-            self.io().warn('Instance has no healthcheck defined!')
+        if HEALTHY in results.values():
+            self.io().success_msg('Service healthy after %is' % (time() - started_at))
 
         return True
@@ -1,5 +1,4 @@
 import os
-import pkg_resources
 from rkd.api.contract import ExecutionContext
 from rkd.standardlib import CreateStructureTask
 
@@ -40,6 +39,8 @@ class CreateHarborStructureTask(CreateStructureTask):
 
     @staticmethod
     def get_harbor_version_matcher() -> str:
+        import pkg_resources
+
         harbor_version = pkg_resources.get_distribution("rkd-harbor").version
 
         return '==' + harbor_version
@@ -14,6 +14,8 @@ from .tasks.base import HarborBaseTask
 from .service import ServiceDeclaration
 from .driver import ComposeDriver
 from .cached_loader import CachedLoader
+from .timings import CommandTimings
+from .timings import Spans
 
 HARBOR_MODULE_PATH = os.path.dirname(os.path.realpath(__file__))
 ENV_SIMPLE_PATH = os.path.dirname(os.path.realpath(__file__)) + '/../../test/testdata/env_simple'
@@ -52,6 +54,8 @@ class BaseHarborTestClass(FunctionalTestingCase):
         print('')
 
         CachedLoader.clear()   # avoid keeping the state between tests
+        CommandTimings.clear()
+        Spans.clear()
 
         os.chdir(HARBOR_MODULE_PATH)
         self.recreate_structure()
@@ -0,0 +1,333 @@
+"""
+Commands instrumentation and phase spans
+
+Every command Harbor executes (docker-compose, docker, git, ansible, hook scripts...) is recorded with its wall time,
+exit status and size of the captured output. Records are kept per process, so the commands of nested tasks executed
+in-process are included. A nested RKD subprocess is visible as one "rkd" command.
+
+Main phases of a task (eg. compose config load, profile selection, hooks, steps of a rolling deployment) are recorded
+as spans, each executed Harbor task is a span too.
+
+The records can be summarized in a table (--timings), or written as a Chrome trace-event JSON (--timings-trace),
+that can be opened in chrome://tracing or https://ui.perfetto.dev
+
+The trace file path is passed to nested RKD subprocesses in HARBOR_TRACE_FILE environment variable, each process
+appends its events to the same file, so a single task produces one end-to-end timeline.
+"""
+
+import os
+import re
+import json
+import subprocess
+import threading
+from time import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import List
+from typing import Optional
+
+COMPOSE = 'compose'
+DOCKER = 'docker'
+GIT = 'git'
+ANSIBLE = 'ansible'
+HOOK = 'hook'
+RKD = 'rkd'
+OTHER = 'other'
+TASK = 'task'
+PHASE = 'phase'
+
+TRACE_FILE_ENV = 'HARBOR_TRACE_FILE'
+
+# first known program executed by the command decides about the category (commands are often wrapped in shell
+# snippets eg. "cd ... && git pull"), programs are looked up at the beginning of every command in the pipeline/list
+CATEGORIES = OrderedDict([
+    ('docker-compose', COMPOSE),
+    ('docker', DOCKER),
+    ('git', GIT),
+    ('ansible', ANSIBLE),
+    ('ansible-playbook', ANSIBLE),
+    ('ansible-vault', ANSIBLE),
+    ('ansible-galaxy', ANSIBLE),
+    ('%RKD%', RKD),
+    ('rkd', RKD),
+    ('harbor', RKD)
+])
+
+SEPARATOR_PATTERN = re.compile(r'&&|\|\||[;|`(]')
+
+
+class CommandTiming(object):
+    command: str
+    category: str
+    started_at: float
+    duration: float
+    exit_code: Optional[int]
+    captured_bytes: int
+    thread_id: int
+
+    def __init__(self, command: str, category: str):
+        self.command = command
+        self.category = category
+        self.started_at = time()
+        self.duration = 0.0
+        self.exit_code = None
+        self.captured_bytes = 0
+        self.thread_id = threading.get_ident()
+
+    def finish(self, exit_code: int, output=None):
+        self.duration = time() - self.started_at
+        self.exit_code = exit_code
+
+        if output:
+            self.captured_bytes = len(output.encode('utf-8') if isinstance(output, str) else output)
+
+    def __repr__(self):
+        return 'CommandTiming<%s %.3fs exit=%s: %s>' % (self.category, self.duration, self.exit_code,
+                                                        self.command[0:60])
+
+
+class CommandTimings(object):
+    """Process-wide recorder of executed commands (thread-safe)"""
+
+    records: List[CommandTiming] = []
+    _lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def measure(cls, command, category: str = None):
+        """Records a command executed inside the block. CalledProcessError is recorded with its exit code"""
+
+        timing = CommandTiming(format_command(command), category or categorize(command))
+
+        try:
+            yield timing
+
+        except subprocess.CalledProcessError as e:
+            timing.finish(e.returncode, e.output)
+            raise
+
+        except Exception:
+            timing.finish(-1)
+            raise
+
+        finally:
+            if timing.exit_code is None:
+                timing.finish(0)
+
+            cls.add(timing)
+
+    @classmethod
+    def add(cls, timing: CommandTiming):
+        with cls._lock:
+            cls.records.append(timing)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.records = []
+
+    @classmethod
+    def summarize(cls) -> List[list]:
+        """Rows: category, number of calls, failed calls, total time, slowest call, captured bytes"""
+
+        summary = OrderedDict()
+
+        for timing in sorted(cls.records, key=lambda record: record.category):
+            row = summary.setdefault(timing.category, [timing.category, 0, 0, 0.0, 0.0, 0])
+            row[1] += 1
+            row[2] += 1 if timing.exit_code else 0
+            row[3] += timing.duration
+            row[4] = max(row[4], timing.duration)
+            row[5] += timing.captured_bytes
+
+        return sorted(summary.values(), key=lambda row: row[3], reverse=True)
+
+    @classmethod
+    def get_slowest(cls, limit: int = 10) -> List[CommandTiming]:
+        return sorted(cls.records, key=lambda record: record.duration, reverse=True)[0:limit]
+
+
+class Span(object):
+    name: str
+    category: str
+    started_at: float
+    duration: float
+    thread_id: int
+    details: dict
+
+    def __init__(self, name: str, category: str, details: dict):
+        self.name = name
+        self.category = category
+        self.started_at = time()
+        self.duration = 0.0
+        self.thread_id = threading.get_ident()
+        self.details = details
+
+    def __repr__(self):
+        return 'Span<%s %.3fs: %s>' % (self.category, self.duration, self.name)
+
+
+class Spans(object):
+    """Process-wide recorder of task phases (thread-safe)"""
+
+    records: List[Span] = []
+    depth: int = 0  # Harbor tasks being executed at the moment in this process (nested in-process tasks increase it)
+    _lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, category: str = PHASE, **details):
+        span = Span(name, category, details)
+
+        try:
+            yield span
+        finally:
+            span.duration = time() - span.started_at
+
+            with cls._lock:
+                cls.records.append(span)
+
+    @classmethod
+    @contextmanager
+    def task(cls, name: str):
+        """Span of an executed task. Only the outermost task of the process is responsible for reporting"""
+
+        with cls._lock:
+            cls.depth += 1
+
+        try:
+            with cls.span(name, category=TASK):
+                yield
+        finally:
+            with cls._lock:
+                cls.depth -= 1
+
+    @classmethod
+    def is_in_task(cls) -> bool:
+        return cls.depth > 0
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls.records = []
+
+
+def span(name: str, **details):
+    """Records a phase of a task eg. with span('compose config load'): ..."""
+
+    return Spans.span(name, **details)
+
+
+def start_trace(path: str):
+    """Creates an empty trace file, and makes it a trace file also for nested RKD subprocesses"""
+
+    path = os.path.abspath(path)
+
+    with open(path, 'w') as f:
+        f.write('[\n')
+
+    os.environ[TRACE_FILE_ENV] = path
+
+
+def append_to_trace(path: str, process_name: str):
+    """Moves recorded commands and spans to the trace file
+
+    Uses Chrome trace-event "JSON Array Format" which allows to skip the closing bracket, so the events from multiple
+    processes can be appended to the same file. Events of a process are appended with a single write.
+    """
+
+    pid = os.getpid()
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name}}]
+
+    for timing in CommandTimings.records:
+        events.append({
+            'name': timing.command[0:120],
+            'cat': timing.category,
+            'ph': 'X',
+            'ts': int(timing.started_at * 1000000),
+            'dur': int(timing.duration * 1000000),
+            'pid': pid,
+            'tid': timing.thread_id,
+            'args': {
+                'command': timing.command,
+                'exit_code': timing.exit_code,
+                'captured_bytes': timing.captured_bytes
+            }
+        })
+
+    for recorded in Spans.records:
+        events.append({
+            'name': recorded.name,
+            'cat': recorded.category,
+            'ph': 'X',
+            'ts': int(recorded.started_at * 1000000),
+            'dur': int(recorded.duration * 1000000),
+            'pid': pid,
+            'tid': recorded.thread_id,
+            'args': {key: str(value) for key, value in recorded.details.items()}
+        })
+
+    with open(path, 'a') as f:
+        f.write(''.join([json.dumps(event) + ',\n' for event in events]))
+
+    CommandTimings.clear()
+    Spans.clear()
+
+
+def read_trace(path: str) -> List[dict]:
+    """Reads events from a trace file (possibly not closed, as it is written by multiple processes)"""
+
+    with open(path) as f:
+        content = f.read().strip()
+
+    if not content.endswith(']'):
+        content = content.rstrip(',') + ']'
+
+    return json.loads(content)
+
+
+def format_command(command) -> str:
+    return ' '.join(command) if isinstance(command, (list, tuple)) else ' '.join(str(command).split())
+
+
+def categorize(command) -> str:
+    segments = [command[0:1]] if isinstance(command, (list, tuple)) else SEPARATOR_PATTERN.split(str(command))
+
+    for segment in segments:
+        # skip variable assignments eg. "IS_DEBUG=true docker-compose ..."
+        words = [word for word in (segment if isinstance(segment, list) else segment.split()) if '=' not in word]
+
+        if words:
+            category = CATEGORIES.get(os.path.basename(words[0].lstrip('$')))
+
+            if category:
+                return category
+
+    return OTHER
+
+
+def timed_call(args, **kwargs) -> int:
+    """subprocess.call() that is recorded"""
+
+    with CommandTimings.measure(args) as timing:
+        exit_code = subprocess.call(args, **kwargs)
+        timing.finish(exit_code)
+
+        return exit_code
+
+
+def timed_check_call(args, **kwargs) -> int:
+    """subprocess.check_call() that is recorded"""
+
+    with CommandTimings.measure(args):
+        return subprocess.check_call(args, **kwargs)
+
+
+def timed_check_output(args, **kwargs):
+    """subprocess.check_output() that is recorded"""
+
+    with CommandTimings.measure(args) as timing:
+        output = subprocess.check_output(args, **kwargs)
+        timing.finish(0, output)
+
+        return output
@@ -0,0 +1,79 @@
+import os
+import json
+import tempfile
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.benchmark import SyntheticProject
+from rkd_harbor.benchmark import Benchmark
+from rkd_harbor.benchmark import compare_with_baseline
+from rkd_harbor.benchmark import measure_startup
+from rkd_harbor.benchmark import main
+
+BASELINE_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/.rkd/benchmark-baseline.json'
+
+
+def results_of(best: float, calibration: float = None) -> dict:
+    return {'calibration': calibration, 'results': {'100': {'load_services_cold': {'best': best, 'median': best}}}}
+
+
+class BenchmarkTest(BaseHarborTestClass):
+    def test_synthetic_project_contains_services_containers_profiles_and_repositories(self):
+        with tempfile.TemporaryDirectory() as directory:
+            SyntheticProject(directory, 25).create()
+
+            self.assertEqual(3, len(os.listdir(directory + '/apps/conf')))
+            self.assertEqual(3, len(os.listdir(directory + '/apps/repos-enabled')))
+            self.assertIn('frontend.profile.py', os.listdir(directory + '/apps/profile'))
+
+            with open(directory + '/containers.txt') as f:
+                self.assertIn('bench_web_1_2|Up 5 minutes', f.read().splitlines())
+
+    def test_all_measurements_are_made_without_docker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            project = SyntheticProject(directory, 10)
+            project.create()
+
+            results = Benchmark(project, repeats=1).run()
+
+        self.assertEqual(['cli_service_list', 'load_services_cold', 'load_services_cached', 'find_matching_services',
+                          'find_matching_services_declarative', 'describe_services', 'get_created_containers',
+                          'list_services_task'], list(results.keys()))
+        self.assertGreater(results['cli_service_list']['best'], 0)
+
+    def test_startup_is_measured_with_lazy_and_eager_task_imports(self):
+        startup = measure_startup(repeats=1)
+
+        self.assertEqual(['lazy', 'eager'], list(startup.keys()))
+        self.assertGreater(startup['lazy']['best'], 0)
+        self.assertGreater(startup['eager']['best'], 0)
+
+    def test_slower_measurements_than_baseline_are_reported(self):
+        self.assertEqual([], compare_with_baseline(results_of(0.110), results_of(0.100)))
+        self.assertEqual([], compare_with_baseline(results_of(0.003), results_of(0.001)),
+                         msg='Differences smaller than measurement error should not be reported')
+
+        regressions = compare_with_baseline(results_of(0.200), results_of(0.100))
+
+        self.assertEqual(1, len(regressions))
+        self.assertIn('100 services, load_services_cold', regressions[0])
+
+    def test_baseline_is_scaled_to_the_machine_by_calibration(self):
+        self.assertEqual([], compare_with_baseline(results_of(0.200, calibration=0.02),
+                                                   results_of(0.100, calibration=0.01)),
+                         msg='Two times slower machine should not report a regression')
+        self.assertEqual(1, len(compare_with_baseline(results_of(0.200, calibration=0.01),
+                                                      results_of(0.200, calibration=0.02))),
+                         msg='Two times faster machine should expect half of the baseline time')
+
+    def test_stored_baseline_covers_all_sizes(self):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+        self.assertEqual(['10', '100', '1000'], list(baseline['results'].keys()))
+        self.assertGreater(baseline['calibration'], 0)
+
+    def test_results_are_written_as_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(0, main(['--sizes', '10', '--repeats', '1', '--output', directory + '/results.json']))
+
+            with open(directory + '/results.json') as f:
+                self.assertIn('list_services_task', json.load(f)['results']['10'])
@@ -1,5 +1,7 @@
+import os
 
 from rkd_harbor.cached_loader import CachedLoader
+from rkd_harbor.cached_loader import PersistentComposeCache
 from rkd_harbor.test import BaseHarborTestClass
 
 
@@ -16,3 +18,119 @@ class CachedLoaderTest(BaseHarborTestClass):
         test = CachedLoader.cached('test', lambda: loader(test))
 
         self.assertEqual(test, 1)
+
+
+class PersistentComposeCacheTest(BaseHarborTestClass):
+    def _prepare_yaml(self, content: str) -> str:
+        path = self.get_test_env_subdirectory('apps/conf') + '/cached.yml'
+
+        with open(path, 'w') as f:
+            f.write(content)
+
+        return path
+
+    def test_loader_is_called_once_when_files_are_not_changed(self):
+        path = self._prepare_yaml('services: {}')
+        cache = PersistentComposeCache(self.get_test_env_subdirectory('.rkd/cache') + '/compose.json')
+        calls = []
+
+        def loader():
+            calls.append(True)
+            return {'services': {}}
+
+        cache.load([path], {'project_name': 'test'}, loader)
+        result = cache.load([path], {'project_name': 'test'}, loader)
+
+        self.assertEqual({'services': {}}, result)
+        self.assertEqual(1, len(calls))
+
+    def test_cache_is_invalidated_when_file_changes_or_extra_values_changes(self):
+        path = self._prepare_yaml('services: {}')
+        cache = PersistentComposeCache(self.get_test_env_subdirectory('.rkd/cache') + '/compose.json')
+        calls = []
+
+        def loader():
+            calls.append(True)
+            return {}
+
+        cache.load([path], {'project_name': 'test'}, loader)
+        cache.load([path], {'project_name': 'other'}, loader)
+        self._prepare_yaml('services: {web: {image: "nginx:1.19"}}')
+        cache.load([path], {'project_name': 'other'}, loader)
+
+        self.assertEqual(3, len(calls))
+
+    def test_cache_is_invalidated_when_referenced_environment_variable_changes(self):
+        path = self._prepare_yaml('services: {web: {image: "nginx:${NGINX_VERSION}"}}')
+        cache = PersistentComposeCache(self.get_test_env_subdirectory('.rkd/cache') + '/compose.json')
+        calls = []
+
+        def loader():
+            calls.append(True)
+            return {}
+
+        os.environ['NGINX_VERSION'] = '1.19'
+        cache.load([path], {}, loader)
+
+        os.environ['NGINX_VERSION'] = '1.20'
+        cache.load([path], {}, loader)
+        cache.load([path], {}, loader)
+
+        del os.environ['NGINX_VERSION']
+        self.assertEqual(2, len(calls))
+
+    def test_cache_is_invalidated_when_env_file_or_extended_file_changes(self):
+        """Paths in apps/conf/*.yml are relative to the project directory, paths in extended files to their directory"""
+
+        project_dir = os.getcwd()
+        base_path = self.get_test_env_subdirectory('apps/base')
+        path = self._prepare_yaml('services: {web: {env_file: ./web.env, extends: {file: ./apps/base/base.yml, '
+                                  'service: base}}}')
+        cache = PersistentComposeCache(self.get_test_env_subdirectory('.rkd/cache') + '/compose.json', project_dir)
+        calls = []
+
+        def loader():
+            calls.append(True)
+            return {}
+
+        with open(project_dir + '/web.env', 'w') as f:
+            f.write('A=1\n')
+
+        with open(base_path + '/base.yml', 'w') as f:
+            f.write('services: {base: {env_file: ./base.env}}')
+
+        cache.load([path], {}, loader)
+        cache.load([path], {}, loader)
+        self.assertEqual(1, len(calls))
+
+        with open(self.get_test_env_subdirectory('apps/conf') + '/web.env', 'w') as f:
+            f.write('A=12\n')
+
+        cache.load([path], {}, loader)
+        self.assertEqual(1, len(calls), msg='env_file next to the YAML file is not used by docker-compose')
+
+        with open(project_dir + '/web.env', 'w') as f:
+            f.write('A=12\n')
+
+        cache.load([path], {}, loader)
+        self.assertEqual(2, len(calls), msg='env_file was modified')
+
+        with open(base_path + '/base.env', 'w') as f:
+            f.write('B=1\n')
+
+        cache.load([path], {}, loader)
+        self.assertEqual(3, len(calls), msg='env_file of extended file was created')
+
+    def test_definition_is_not_cached_when_env_file_path_contains_variables(self):
+        path = self._prepare_yaml('services: {web: {env_file: "./${ENV_NAME}.env"}}')
+        cache = PersistentComposeCache(self.get_test_env_subdirectory('.rkd/cache') + '/compose.json')
+        calls = []
+
+        def loader():
+            calls.append(True)
+            return {}
+
+        cache.load([path], {}, loader)
+        cache.load([path], {}, loader)
+
+        self.assertEqual(2, len(calls))
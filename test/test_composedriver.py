@@ -1,12 +1,30 @@
 
+import os
+import yaml
+import threading
 import requests
 from time import time
 from io import StringIO
 from rkd.api.inputoutput import IO
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.service import CONFIG_HASH_LABEL
+from rkd_harbor.driver import CONFIG_HASH_OVERRIDE_PATH
 from rkd_harbor.exception import ServiceNotCreatedException
 from rkd_harbor.exception import ServiceNotReadyException
+from rkd_harbor.docker_backend import DockerCliBackend
+
+
+class CountingDockerBackend(DockerCliBackend):
+    def __init__(self, containers: list):
+        super().__init__(None)
+        self.containers = containers
+        self.calls = 0
+
+    def list_containers(self, all_containers: bool, label: str = None):
+        self.calls += 1
+
+        return self.containers
 
 
 class ComposeDriverTest(BaseHarborTestClass):
@@ -222,3 +240,117 @@ class ComposeDriverTest(BaseHarborTestClass):
 
         containers = drv.get_created_containers(only_running=True)
         self.assertEqual([], list(containers['website']))
+
+    def test_containers_state_is_served_from_snapshot_until_containers_are_changed(self):
+        drv = self._get_prepared_compose_driver()
+        drv.scope.sh = lambda *args, **kwargs: ''
+        drv._docker = CountingDockerBackend([
+            ('env_simple_website_1', 'Up 5 minutes'),
+            ('env_simple_website_10', 'Up 1 minute'),
+            ('env_simple_gateway_1', 'Exited (0) 1 minute ago')
+        ])
+
+        self.assertEqual([1, 10], list(drv.get_created_containers(only_running=False)['website'].keys()))
+        self.assertEqual([], list(drv.get_created_containers(only_running=True)['gateway'].keys()))
+        self.assertEqual('env_simple_website_10', drv.find_container_name(ServiceDeclaration('website', {})))
+        self.assertEqual(1, drv._docker.calls)
+
+        drv.compose(['ps'])
+        drv.get_created_containers(only_running=False)
+        self.assertEqual(1, drv._docker.calls, msg='Read-only operations should not invalidate the snapshot')
+
+        drv.stop('website')
+        drv.get_created_containers(only_running=False)
+        self.assertEqual(2, drv._docker.calls)
+        self.assertEqual({'saved_calls': 3, 'docker_calls': 2}, drv.get_snapshot_statistics())
+
+    def test_snapshot_can_be_invalidated_from_other_threads(self):
+        drv = self._get_prepared_compose_driver()
+        drv._docker = CountingDockerBackend([('env_simple_website_1', 'Up 5 minutes')])
+        errors = []
+
+        def read():
+            for _ in range(500):
+                try:
+                    drv.get_created_containers(only_running=False)
+                except Exception as e:
+                    errors.append(e)
+
+        def invalidate():
+            for _ in range(500):
+                drv.invalidate_snapshot()
+
+        threads = [threading.Thread(target=read), threading.Thread(target=read), threading.Thread(target=invalidate)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(1000, sum(drv.get_snapshot_statistics().values()))
+
+    def test_service_is_up_to_date_only_when_definition_and_image_did_not_change(self):
+        drv = self._get_prepared_compose_driver()
+        service = ServiceDeclaration('website', {'image': 'nginx:1.19', 'labels': {'org.riotkit.replicas': '2'}})
+
+        class InspectingDockerBackend(CountingDockerBackend):
+            image_id = 'sha256:current'
+
+            def get_image_id(self, image: str):
+                return self.image_id
+
+            def inspect(self, names: list):
+                return [{'Image': 'sha256:current', 'Config': {'Labels': {CONFIG_HASH_LABEL: service.get_config_hash()}}}
+                        for _ in names]
+
+        drv._docker = InspectingDockerBackend([('env_simple_website_1', 'Up 5 minutes'),
+                                               ('env_simple_website_2', 'Up 5 minutes')])
+
+        self.assertTrue(drv.is_service_up_to_date(service))
+
+        with self.subTest('Definition changed'):
+            self.assertFalse(drv.is_service_up_to_date(ServiceDeclaration('website', {
+                'image': 'nginx:1.19', 'labels': {'org.riotkit.replicas': '2'}, 'environment': {'DEBUG': 'true'}
+            })))
+
+        with self.subTest('Replicas count changed'):
+            self.assertFalse(drv.is_service_up_to_date(ServiceDeclaration('website', {
+                'image': 'nginx:1.19', 'labels': {'org.riotkit.replicas': '3'}
+            })))
+
+        with self.subTest('Newer image was pulled'):
+            drv._docker.image_id = 'sha256:newer'
+            self.assertFalse(drv.is_service_up_to_date(service))
+
+    def test_containers_are_labelled_with_config_hash_by_an_override_file(self):
+        drv = self._get_prepared_compose_driver()
+        commands = []
+        drv.scope.sh = lambda command, **kwargs: commands.append(command)
+
+        stale_path = CONFIG_HASH_OVERRIDE_PATH % 'previous'
+        os.makedirs(os.path.dirname(stale_path), exist_ok=True)
+
+        with open(stale_path, 'w') as f:
+            f.write('services: {}')
+
+        drv.compose(['ps'])
+        drv.up(ServiceDeclaration('website', {}))
+
+        override_path = drv.get_config_hash_override()
+
+        self.assertFalse(os.path.isfile(stale_path), msg='Override of a previous definition should be removed')
+
+        self.assertNotIn('config-hash', commands[0], msg='Only container-creating commands use override')
+        self.assertIn('-f %s' % override_path, commands[1])
+        self.assertEqual(CONFIG_HASH_OVERRIDE_PATH % override_path.split('.')[-3], override_path,
+                         msg='Override file should be named after its content')
+
+        with open(override_path, 'r') as f:
+            override = yaml.safe_load(f)
+
+        website = drv.scope.services(drv.ctx).get_by_name('website')
+
+        self.assertEqual(website.get_config_hash(), override['services']['website']['labels'][CONFIG_HASH_LABEL])
+        self.assertIn('gateway', override['services'])
@@ -0,0 +1,59 @@
+import os
+from subprocess import CalledProcessError
+from rkd.api.contract import ExecutionContext
+from rkd.api.inputoutput import IO
+from rkd.api.syntax import TaskDeclaration
+from rkd.api.temp import TempManager
+from rkd.context import ApplicationContext
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.test import TestTask
+from rkd_harbor.dispatcher import InProcessDispatcher
+
+
+class InProcessDispatcherTest(BaseHarborTestClass):
+    def _create_dispatcher(self) -> InProcessDispatcher:
+        task = TestTask()
+        task.internal_inject_dependencies(IO(), ApplicationContext([], [], ''), None, TempManager())
+
+        return InProcessDispatcher(task, ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ)))
+
+    def test_harbor_task_is_executed_in_process_and_output_is_captured(self):
+        spawned = []
+
+        out = self._create_dispatcher().dispatch(
+            ['--no-ui', ':harbor:diagnostic:dump-compose-args', '', '2>&1'],
+            lambda args, capture: spawned.append(args),
+            capture=True
+        )
+
+        self.assertIn('-p env_simple', out)
+        self.assertEqual([], spawned, msg='Expected that no subprocess will be spawned')
+
+    def test_not_harbor_tasks_are_executed_in_subprocess(self):
+        spawned = []
+
+        self._create_dispatcher().dispatch(
+            ['--no-ui', ':harbor:templates:render', ':harbor:diagnostic:dump-compose-args'],
+            lambda args, capture: spawned.append(args),
+            capture=True
+        )
+
+        self.assertEqual([[':harbor:templates:render']], spawned)
+
+    def test_arguments_requiring_shell_are_executed_in_subprocess(self):
+        spawned = []
+
+        self._create_dispatcher().dispatch(
+            [':harbor:service:logs', '"website"'],
+            lambda args, capture: spawned.append(args)
+        )
+
+        self.assertEqual([[':harbor:service:logs', '"website"']], spawned)
+
+    def test_task_failure_is_reported_same_way_as_failed_subprocess(self):
+        self.assertRaises(
+            CalledProcessError,
+            lambda: self._create_dispatcher().dispatch(
+                [':harbor:service:logs', 'not_existing'], lambda args, capture: None, capture=True
+            )
+        )
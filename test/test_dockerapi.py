@@ -0,0 +1,165 @@
+import os
+import json
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+from socketserver import ThreadingUnixStreamServer
+from http.server import BaseHTTPRequestHandler
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.docker_api import DockerEngineClient
+from rkd_harbor.docker_api import demultiplex_stream
+from rkd_harbor.docker_backend import DockerApiBackend
+from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.exception import DockerApiException
+
+CONTAINERS = [
+    {'Names': ['/env_simple_website_2'], 'Status': 'Up 5 minutes',
+     'Labels': {'com.docker.compose.project': 'env_simple'}},
+    {'Names': ['/env_simple_website_1'], 'Status': 'Up 10 minutes',
+     'Labels': {'com.docker.compose.project': 'env_simple'}},
+    {'Names': ['/env_simple_gateway_1'], 'Status': 'Exited (0) 2 minutes ago',
+     'Labels': {'com.docker.compose.project': 'env_simple'}},
+    {'Names': ['/env_simple_old_website_1'], 'Status': 'Up 1 hour',
+     'Labels': {'com.docker.compose.project': 'env_simple_old'}},
+    {'Names': ['/other_project_website_1'], 'Status': 'Up 1 hour',
+     'Labels': {'com.docker.compose.project': 'other_project'}}
+]
+
+
+def frame(stream_type: int, content: bytes) -> bytes:
+    return struct.pack('>BBBBL', stream_type, 0, 0, 0, len(content)) + content
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+
+        if path == '/containers/json':
+            filters = json.loads(parse_qs(urlparse(self.path).query).get('filters', ['{}'])[0])
+            containers = [container for container in CONTAINERS
+                          if all(self._has_label(container, label) for label in filters.get('label', []))]
+
+            return self._respond(200, json.dumps(containers).encode('utf-8'))
+
+        if path == '/containers/env_simple_website_1/json':
+            return self._respond(200, json.dumps({
+                'Id': 'abc123', 'Config': {'Image': 'nginx:1.19'}, 'State': {'Status': 'running'}
+            }).encode('utf-8'))
+
+        if path.startswith('/images/') and path.endswith('/json'):
+            return self._respond(200, json.dumps({'Id': 'sha256:' + path[len('/images/'):-len('/json')]}).encode())
+
+        if path == '/containers/env_simple_website_1/logs':
+            return self._respond(200, frame(1, b'GET / HTTP/1.1\n') + frame(2, b'error happened\n'))
+
+        self._respond(404, b'{"message": "No such container"}')
+
+    def do_DELETE(self):
+        self.server.removed.append(self.path)
+        self._respond(204, b'')
+
+    @staticmethod
+    def _has_label(container: dict, label: str) -> bool:
+        name, value = label.split('=', 1)
+
+        return container['Labels'].get(name) == value
+
+    def _respond(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDockerServer(ThreadingUnixStreamServer):
+    def __init__(self, path: str):
+        super().__init__(path, FakeDockerHandler)
+        self.removed = []
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class DockerEngineClientTest(BaseHarborTestClass):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.socket_dir = tempfile.TemporaryDirectory()
+        self.server = FakeDockerServer(self.socket_dir.name + '/docker.sock')
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.client = DockerEngineClient(self.socket_dir.name + '/docker.sock', timeout=5)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.socket_dir.cleanup()
+
+        super().tearDown()
+
+    def test_connection_is_reused_between_requests(self):
+        self.client.list_containers()
+        self.client.inspect_container('env_simple_website_1')
+        self.client.get_logs('env_simple_website_1')
+
+        self.assertEqual(3, self.client.requests_count)
+        self.assertEqual(1, self.server.connections)
+
+    def test_client_can_be_shared_between_threads(self):
+        images = ['image%i' % num for num in range(0, 200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            inspected = list(executor.map(self.client.inspect_image, images))
+
+        self.assertEqual(['sha256:' + image for image in images], [image['Id'] for image in inspected],
+                         msg='Each thread should receive a response for its own request')
+        self.assertEqual(200, self.client.requests_count)
+        self.assertEqual(1, self.server.connections)
+
+    def test_logs_are_demultiplexed(self):
+        self.assertEqual('GET / HTTP/1.1\nerror happened\n', self.client.get_logs('env_simple_website_1'))
+
+    def test_not_existing_container_raises_exception_with_status(self):
+        with self.assertRaises(DockerApiException) as exc:
+            self.client.inspect_container('not_existing')
+
+        self.assertEqual(404, exc.exception.status)
+        self.assertIn('No such container', str(exc.exception))
+
+    def test_remove_container_forces_removal(self):
+        self.client.remove_container('env_simple_website_1')
+
+        self.assertEqual(['/containers/env_simple_website_1?force=1'], self.server.removed)
+
+    def test_driver_returns_same_models_when_using_api_backend(self):
+        drv = self._get_prepared_compose_driver()
+        drv._docker = DockerApiBackend(self.client)
+
+        self.assertEqual({'website': {1: True, 2: True}, 'gateway': {1: False}},
+                         {name: dict(instances) for name, instances in drv.get_created_containers(False).items()})
+        self.assertEqual('env_simple_website_2', drv.get_last_container_name_for_service('website'))
+        self.assertEqual('abc123', drv.inspect_container('env_simple_website_1').get_id())
+        self.assertIn('error happened', drv.get_logs(ServiceDeclaration('website', {}), instance_num=1))
+
+    def test_followed_logs_are_read_frame_by_frame(self):
+        stream = self.client.follow_logs('env_simple_website_1', since=1600000000)
+
+        try:
+            self.assertEqual([b'GET / HTTP/1.1\n', b'error happened\n'], list(stream))
+        finally:
+            stream.close()
+
+    def test_demultiplex_stream_returns_none_for_tty_output(self):
+        self.assertIsNone(demultiplex_stream(b'Plain text output from a container with TTY\n'))
+        self.assertEqual(b'', demultiplex_stream(b''))
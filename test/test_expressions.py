@@ -1,4 +1,5 @@
 from rkd_harbor.expressions import safe_eval
+from rkd_harbor.expressions import compile_safe_expression
 from rkd_harbor.test import BaseHarborTestClass
 
 
@@ -59,3 +60,13 @@ class SafeEvalTests(BaseHarborTestClass):
 
     def test_pattern_using_basic_string_functions(self):
         self.assertTrue(safe_eval('"org.riotkit.replicas".startswith("org.riotkit")', {}))
+
+    def test_compiled_expression_is_reused(self):
+        first = compile_safe_expression('name == "web"', ['name', 'service'])
+        second = compile_safe_expression('name == "web"', ['service', 'name'])
+
+        self.assertIs(first, second)
+        self.assertTrue(eval(first, {'name': 'web', 'service': {}}))
+
+    def test_compiled_expression_is_validated(self):
+        self.assertRaises(ValueError, compile_safe_expression, 'other == "web"', ['name'])
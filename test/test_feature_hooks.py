@@ -1,12 +1,12 @@
 import os
+import re
 import subprocess
-from io import StringIO
 from rkd.api.inputoutput import BufferedSystemIO
-from rkd.api.inputoutput import IO
 from rkd.api.contract import ExecutionContext
 from rkd.api.syntax import TaskDeclaration
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.test import TestTask
+from rkd_harbor.exception import HookFailedException
 
 
 class TestHooksFeature(BaseHarborTestClass):
@@ -35,9 +35,6 @@ class TestHooksFeature(BaseHarborTestClass):
 
         self._prepare_test_data()
 
-        buffer = StringIO()
-        hooks_capturing_io = IO()
-
         task = TestTask()
         task._io = BufferedSystemIO()
         ctx = ExecutionContext(
@@ -46,14 +43,13 @@ class TestHooksFeature(BaseHarborTestClass):
             env={}
         )
 
-        with hooks_capturing_io.capture_descriptors(stream=buffer, enable_standard_out=True):
-            with task.hooks_executed(ctx, 'upgrade'):
-                pass
+        with task.hooks_executed(ctx, 'upgrade'):
+            pass
 
-        self.assertIn('>> This is a whoami.sh hook, test:', buffer.getvalue(),
+        self.assertIn('>> This is a whoami.sh hook, test:', task._io.get_value(),
                       msg='Expected pre-upgrade hook to be ran')
 
-        self.assertIn('25 June 1978 the rainbow flag was first flown', buffer.getvalue(),
+        self.assertIn('25 June 1978 the rainbow flag was first flown', task._io.get_value(),
                       msg='Expected post-upgrade hook to be ran')
 
         self.assertIn('pre-upgrade/whoami.sh', task._io.get_value())
@@ -64,9 +60,6 @@ class TestHooksFeature(BaseHarborTestClass):
 
         self._prepare_test_data()
 
-        buffer = StringIO()
-        hooks_capturing_io = IO()
-
         task = TestTask()
         task._io = BufferedSystemIO()
         ctx = ExecutionContext(
@@ -75,10 +68,9 @@ class TestHooksFeature(BaseHarborTestClass):
             env={}
         )
 
-        with hooks_capturing_io.capture_descriptors(stream=buffer, enable_standard_out=True):
-            task.execute_hooks(ctx, 'post-upgrade')
+        task.execute_hooks(ctx, 'post-upgrade')
 
-        self.assertIn('25 June 1978 the rainbow flag was first flown', buffer.getvalue(),
+        self.assertIn('25 June 1978 the rainbow flag was first flown', task._io.get_value(),
                       msg='Expected post-upgrade hook to be ran')
 
     def test_non_existing_dir_is_skipped(self):
@@ -96,3 +88,101 @@ class TestHooksFeature(BaseHarborTestClass):
         task.execute_hooks(ctx, 'non-existing-directory')
         self.assertIn('Hooks dir "./hooks.d//non-existing-directory/" not present, skipping', task._io.get_value())
 
+    def _create_hook(self, path: str, content: str, shebang: str = '#!/bin/bash\n', executable: bool = True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as fw:
+            fw.write(shebang + content + '\n')
+
+        if executable:
+            subprocess.check_call(['chmod', '+x', path])
+
+    def _execute_hooks(self, hook_name: str, env: dict = None) -> tuple:
+        task = TestTask()
+        task._io = BufferedSystemIO()
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=env or {})
+        error = None
+
+        try:
+            task.execute_hooks(ctx, hook_name)
+        except Exception as e:
+            error = e
+
+        return task._io.get_value(), error
+
+    @staticmethod
+    def _get_echoed(output: str) -> list:
+        return re.findall(r'^echoed: (.+)$', output, re.MULTILINE)
+
+    def test_scripts_are_executed_in_lexical_order(self):
+        hooks_dir = self.get_test_env_subdirectory('hooks.d/pre-order-test')
+
+        for name in ['30-third.sh', '10-first.sh', '20-second.sh']:
+            self._create_hook(hooks_dir + '/' + name, 'echo "echoed: %s"' % name)
+
+        output, error = self._execute_hooks('pre-order-test')
+
+        self.assertIsNone(error)
+        self.assertEqual(['10-first.sh', '20-second.sh', '30-third.sh'], self._get_echoed(output))
+
+    def test_scripts_in_subdirectory_are_executed_in_parallel_and_durations_are_reported(self):
+        """Both scripts wait for each other - that could succeed only when they are running at the same time"""
+
+        hooks_dir = self.get_test_env_subdirectory('hooks.d/pre-parallel-test')
+        marker = hooks_dir + '/.marker-'
+
+        self._create_hook(hooks_dir + '/10-before.sh', 'echo "echoed: before"')
+        self._create_hook(hooks_dir + '/20-group/backup.sh',
+                          'touch %sbackup; timeout 5 bash -c "until [[ -f %swarmup ]]; do sleep 0.1; done" && echo "echoed: backup"'
+                          % (marker, marker))
+        self._create_hook(hooks_dir + '/20-group/warmup.sh',
+                          'touch %swarmup; timeout 5 bash -c "until [[ -f %sbackup ]]; do sleep 0.1; done" && echo "echoed: warmup"'
+                          % (marker, marker))
+        self._create_hook(hooks_dir + '/30-after.sh', 'echo "echoed: after"')
+
+        output, error = self._execute_hooks('pre-parallel-test')
+        echoed = self._get_echoed(output)
+
+        self.assertIsNone(error)
+        self.assertEqual('before', echoed[0])
+        self.assertEqual(['backup', 'warmup'], sorted(echoed[1:3]))
+        self.assertEqual('after', echoed[3])
+        self.assertIn('20-group/backup.sh" (parallel)', output)
+        self.assertIn('Duration', output)
+
+    def test_script_exceeding_timeout_is_killed_and_next_scripts_are_not_executed(self):
+        hooks_dir = self.get_test_env_subdirectory('hooks.d/pre-timeout-test')
+
+        self._create_hook(hooks_dir + '/10-slow.sh', 'sleep 30')
+        self._create_hook(hooks_dir + '/20-next.sh', 'echo "echoed: next"')
+
+        output, error = self._execute_hooks('pre-timeout-test', env={'HOOK_TIMEOUT': '1'})
+
+        self.assertIsInstance(error, HookFailedException)
+        self.assertIn('10-slow.sh', str(error))
+        self.assertIn('timed out', output)
+        self.assertEqual([], self._get_echoed(output))
+
+    def test_script_without_shebang_is_executed_with_bash(self):
+        hooks_dir = self.get_test_env_subdirectory('hooks.d/pre-no-shebang-test')
+
+        self._create_hook(hooks_dir + '/10-no-shebang.sh', 'if [[ "bash" == b* ]]; then echo "echoed: bash"; fi',
+                          shebang='')
+
+        output, error = self._execute_hooks('pre-no-shebang-test')
+
+        self.assertIsNone(error)
+        self.assertEqual(['bash'], self._get_echoed(output))
+
+    def test_not_executable_script_is_reported_as_failed(self):
+        hooks_dir = self.get_test_env_subdirectory('hooks.d/pre-not-executable-test')
+
+        self._create_hook(hooks_dir + '/10-not-executable.sh', 'echo "echoed: executed"', executable=False)
+
+        output, error = self._execute_hooks('pre-not-executable-test')
+
+        self.assertIsInstance(error, HookFailedException)
+        self.assertIn('10-not-executable.sh', str(error))
+        self.assertIn('Cannot execute', output)
+        self.assertIn('Duration', output)
+        self.assertEqual([], self._get_echoed(output))
@@ -0,0 +1,108 @@
+from time import time
+from queue import Queue
+from rkd.api.inputoutput import BufferedSystemIO
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.driver import InspectedContainer
+from rkd_harbor.health import HealthWaiter
+
+
+class FakeEventStream(object):
+    def __init__(self, events: list):
+        self.queue = Queue()
+        self.closed = False
+
+        for event in events:
+            self.queue.put(event)
+
+    def __iter__(self):
+        while True:
+            event = self.queue.get()
+
+            if event is None:
+                return
+
+            yield event
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+
+
+class FakeDocker(object):
+    def __init__(self, events: list):
+        self.subscriptions = []
+        self.stream = FakeEventStream(events)
+
+    def events(self, filters: dict):
+        self.subscriptions.append(filters)
+
+        return self.stream
+
+
+def create_inspection(health: str = None, status: str = 'running', restart_policy: str = 'always') -> dict:
+    inspection = {'State': {'Status': status}, 'HostConfig': {'RestartPolicy': {'Name': restart_policy}}}
+
+    if health:
+        inspection['State']['Health'] = {'Status': health}
+
+    return inspection
+
+
+def health_event(name: str, action: str) -> dict:
+    return {'Type': 'container', 'Action': action, 'Actor': {'Attributes': {'name': name}}}
+
+
+class HealthWaiterTest(BaseHarborTestClass):
+    def test_multiple_containers_are_awaited_using_one_events_stream(self):
+        docker = FakeDocker([
+            health_event('web_1', 'health_status: healthy'),
+            health_event('web_2', 'health_status: unhealthy'),
+            health_event('web_2', 'health_status: healthy')
+        ])
+
+        waiter = HealthWaiter(
+            docker,
+            lambda names: [InspectedContainer(name, create_inspection('starting')) for name in names],
+            BufferedSystemIO()
+        )
+
+        started_at = time()
+        results = waiter.wait(['web_1', 'web_2'], timeout=10)
+
+        self.assertEqual({'web_1': 'healthy', 'web_2': 'healthy'}, results)
+        self.assertEqual(1, len(docker.subscriptions))
+        self.assertEqual(['web_1', 'web_2'], docker.subscriptions[0]['container'])
+        self.assertTrue(docker.stream.closed)
+        self.assertLess(time() - started_at, 1, msg='Expected that the readiness is detected from events immediately')
+
+    def test_containers_without_health_check_are_not_awaited(self):
+        waiter = HealthWaiter(FakeDocker([]), lambda names: [InspectedContainer('web_1', create_inspection())],
+                              BufferedSystemIO())
+
+        self.assertEqual({'web_1': 'no-healthcheck'}, waiter.wait(['web_1'], timeout=10))
+
+    def test_timeout_is_reported(self):
+        waiter = HealthWaiter(FakeDocker([]), lambda names: [InspectedContainer('web_1', create_inspection('starting'))],
+                              BufferedSystemIO())
+
+        self.assertEqual({'web_1': 'timeout'}, waiter.wait(['web_1'], timeout=1))
+
+    def test_container_that_died_without_restart_policy_is_reported_immediately(self):
+        states = {'web_1': create_inspection('starting')}
+
+        docker = FakeDocker([health_event('web_1', 'die')])
+        waiter = HealthWaiter(docker, lambda names: [InspectedContainer(name, states[name]) for name in names],
+                              BufferedSystemIO())
+
+        # container will die, after the first inspection
+        original_inspect = waiter.inspect
+
+        def inspect(names):
+            result = original_inspect(names)
+            states['web_1'] = create_inspection('unhealthy', status='exited', restart_policy='no')
+
+            return result
+
+        waiter.inspect = inspect
+
+        self.assertEqual({'web_1': 'died'}, waiter.wait(['web_1'], timeout=10))
@@ -0,0 +1,86 @@
+from time import time
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.logs import LogMatcher
+from rkd_harbor.logs import wait_for_match
+from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.exception import ServiceNotReadyException
+
+
+class FakeLogStream(object):
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.closed:
+                return
+
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeLogsBackend(object):
+    def __init__(self, streams: list):
+        self.streams = streams
+        self.opened = []
+
+    def follow_logs(self, name: str, since=None):
+        self.opened.append((name, since))
+
+        return self.streams.pop(0) if self.streams else FakeLogStream([])
+
+
+class LogMatcherTest(BaseHarborTestClass):
+    def test_text_split_between_chunks_is_found(self):
+        matcher = LogMatcher('Server started')
+
+        self.assertFalse(matcher.feed('Loading...\nServer st'))
+        self.assertTrue(matcher.feed('arted on port 80\n'))
+
+    def test_regular_expression_split_between_chunks_is_found(self):
+        matcher = LogMatcher(r'listening on port \d+', regex=True)
+
+        self.assertFalse(matcher.feed('Loading...\nlistening on '))
+        self.assertTrue(matcher.feed('port 8080\n'))
+
+    def test_only_tail_of_previous_chunk_is_kept(self):
+        matcher = LogMatcher('ready')
+
+        matcher.feed('x' * 10000 + 'rea')
+
+        self.assertEqual('xrea', matcher._tail)
+
+    def test_stream_is_closed_after_match(self):
+        stream = FakeLogStream([b'Starting\n', b'Ready to accept connections\n', b'never read\n'])
+        backend = FakeLogsBackend([stream])
+
+        self.assertTrue(wait_for_match(backend, 'env_simple_redis_1', LogMatcher('Ready'), time() + 5, since=100))
+        self.assertTrue(stream.closed)
+        self.assertEqual([('env_simple_redis_1', 100)], backend.opened)
+
+    def test_multibyte_character_split_between_chunks_is_decoded(self):
+        encoded = 'Zażółć gęślą jaźń'.encode('utf-8')
+        stream = FakeLogStream([encoded[0:3], encoded[3:]])
+
+        self.assertTrue(wait_for_match(FakeLogsBackend([stream]), 'env_simple_redis_1', LogMatcher('żółć'),
+                                       time() + 5))
+
+    def test_driver_follows_again_from_last_moment_when_output_ends(self):
+        drv = self._get_prepared_compose_driver()
+        drv.find_container_name = lambda service, instance_num=None: 'env_simple_redis_1'
+        drv._docker = FakeLogsBackend([FakeLogStream([b'Restarting\n']), FakeLogStream([b'Ready\n'])])
+
+        self.assertTrue(drv.wait_for_log_message('Ready', ServiceDeclaration('redis', {}), timeout=10))
+        self.assertEqual(None, drv._docker.opened[0][1])
+        self.assertIsInstance(drv._docker.opened[1][1], int)
+
+    def test_driver_raises_exception_on_timeout(self):
+        drv = self._get_prepared_compose_driver()
+        drv.find_container_name = lambda service, instance_num=None: 'env_simple_redis_1'
+        drv._docker = FakeLogsBackend([])
+
+        with self.assertRaises(ServiceNotReadyException):
+            drv.wait_for_log_message('Ready', ServiceDeclaration('redis', {}), timeout=1)
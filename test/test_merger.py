@@ -0,0 +1,101 @@
+import os
+import yaml
+from rkd.api.inputoutput import BufferedSystemIO
+from rkd.api.contract import ExecutionContext
+from rkd.api.syntax import TaskDeclaration
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.test import TestTask
+from rkd_harbor.merger import ComposeMerger
+from rkd_harbor.exception import ComposeMergeNotSupportedException
+from rkd_harbor.exception import ComposeInterpolationException
+
+
+class ComposeMergerTest(BaseHarborTestClass):
+    def test_services_are_merged_using_docker_compose_override_rules(self):
+        merger = ComposeMerger('/project', {})
+
+        merged = merger.merge([
+            {
+                'version': '3.4',
+                'services': {
+                    'website': {
+                        'image': 'nginx:1.19',
+                        'environment': ['VIRTUAL_HOST=example.org', 'DEBUG=false'],
+                        'labels': ['org.riotkit.priority=100'],
+                        'volumes': ['./data/website:/var/www', 'logs:/var/log/nginx/'],
+                        'ports': ['8000:80']
+                    }
+                }
+            },
+            {
+                'services': {
+                    'website': {
+                        'image': 'nginx:1.20',
+                        'environment': {'DEBUG': True},
+                        'labels': {'org.riotkit.replicas': 2},
+                        'volumes': ['/srv/website:/var/www'],
+                        'ports': ['8443:443']
+                    }
+                },
+                'volumes': {'logs': None}
+            }
+        ])
+
+        website = merged['services']['website']
+
+        self.assertEqual('nginx:1.20', website['image'])
+        self.assertEqual({'VIRTUAL_HOST': 'example.org', 'DEBUG': 'True'}, website['environment'])
+        self.assertEqual({'org.riotkit.priority': '100', 'org.riotkit.replicas': '2'}, website['labels'])
+        self.assertEqual(['/srv/website:/var/www', 'logs:/var/log/nginx'], website['volumes'])
+        self.assertEqual([{'published': 8000, 'target': 80}, {'published': 8443, 'target': 443}], website['ports'])
+        self.assertEqual({'logs': {}}, merged['volumes'])
+
+    def test_dependencies_networks_and_links_are_merged_by_name(self):
+        merger = ComposeMerger('/project', {})
+
+        merged = merger.merge([
+            {'services': {'website': {'depends_on': ['db'], 'networks': ['default'], 'links': ['db', 'cache:redis']}}},
+            {'services': {'website': {'depends_on': {'queue': {'condition': 'service_healthy'}},
+                                      'networks': ['internal'], 'links': ['db:database', 'new_cache:redis']}}}
+        ])
+
+        website = merged['services']['website']
+
+        self.assertEqual({'db': {'condition': 'service_started'}, 'queue': {'condition': 'service_healthy'}},
+                         website['depends_on'])
+        self.assertEqual(['default', 'internal'], website['networks'])
+        self.assertEqual(['db', 'new_cache:redis', 'db:database'], website['links'])
+
+    def test_variables_are_interpolated(self):
+        merger = ComposeMerger('/project', {'DOMAIN': 'example.org', 'EMPTY': ''})
+
+        self.assertEqual(
+            'example.org example.org $DOMAIN default fallback ',
+            merger.interpolate('${DOMAIN} $DOMAIN $$DOMAIN ${UNDEFINED:-default} ${EMPTY:-fallback} ${EMPTY-x}')
+        )
+
+        self.assertRaises(ComposeInterpolationException, lambda: merger.interpolate('${UNDEFINED:?is required}'))
+
+    def test_extends_is_reported_as_not_supported(self):
+        merger = ComposeMerger('/project', {})
+
+        self.assertRaises(ComposeMergeNotSupportedException, lambda: merger.merge([
+            {'services': {'website': {'extends': {'service': 'base'}}}}
+        ]))
+
+    def test_functional_result_is_same_as_docker_compose_config(self):
+        """Compare labels, environment and images of test environment merged natively and by docker-compose"""
+
+        task = TestTask()
+        task._io = BufferedSystemIO()
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+
+        native = task._load_compose_definition_natively(ctx)['services']
+        compose = yaml.load(task.containers(ctx).compose(['config'], capture=True), yaml.Loader)['services']
+
+        self.assertEqual(sorted(compose.keys()), sorted(native.keys()))
+
+        for name in compose.keys():
+            for attribute in ['image', 'labels', 'environment', 'ports']:
+                self.assertEqual(compose[name].get(attribute), native[name].get(attribute),
+                                 msg='Expected same "%s" of "%s"' % (attribute, name))
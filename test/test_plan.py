@@ -0,0 +1,87 @@
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.plan import DeploymentPlanner
+from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.service import CONFIG_HASH_LABEL
+from rkd_harbor.docker_backend import DockerCliBackend
+
+
+class SnapshotDockerBackend(DockerCliBackend):
+    """Serves a fixed state of containers, counts the docker calls"""
+
+    def __init__(self, containers: list, labels: dict, images: dict):
+        super().__init__(None)
+        self.containers = containers
+        self.labels = labels
+        self.images = images
+        self.calls = []
+
+    def list_containers(self, all_containers: bool, label: str = None):
+        self.calls.append('ps')
+        return self.containers
+
+    def inspect(self, names: list):
+        self.calls.append('inspect')
+        return [{'Image': 'sha256:current', 'Config': {'Labels': {CONFIG_HASH_LABEL: self.labels[name]}}}
+                for name in names]
+
+    def get_image_id(self, image: str):
+        self.calls.append('image')
+        return self.images.get(image)
+
+
+class DeploymentPlannerTest(BaseHarborTestClass):
+    def test_plan_lists_actions_required_to_converge(self):
+        unchanged = ServiceDeclaration('unchanged', {'image': 'nginx:1.19'})
+        changed = ServiceDeclaration('changed', {'image': 'nginx:1.19', 'environment': {'DEBUG': 'true'}})
+        scaled = ServiceDeclaration('scaled', {'image': 'nginx:1.19', 'labels': {'org.riotkit.replicas': '3'}})
+        stopped = ServiceDeclaration('stopped', {'image': 'nginx:1.19'})
+        pulled = ServiceDeclaration('pulled', {'image': 'redis:6'})
+        new = ServiceDeclaration('new', {'image': 'nginx:1.19'})
+        built = ServiceDeclaration('built', {'build': '.'})
+
+        drv = self._get_prepared_compose_driver()
+        drv._docker = SnapshotDockerBackend(
+            containers=[
+                ('env_simple_unchanged_1', 'Up 5 minutes'),
+                ('env_simple_changed_1', 'Up 5 minutes'),
+                ('env_simple_scaled_1', 'Up 5 minutes'),
+                ('env_simple_stopped_1', 'Exited (0) 1 minute ago'),
+                ('env_simple_pulled_1', 'Up 5 minutes'),
+                ('env_simple_removed_1', 'Up 5 minutes'),
+                ('env_simple_built_1', 'Up 5 minutes')
+            ],
+            labels={
+                'env_simple_unchanged_1': unchanged.get_config_hash(),
+                'env_simple_changed_1': ServiceDeclaration('changed', {'image': 'nginx:1.19'}).get_config_hash(),
+                'env_simple_scaled_1': scaled.get_config_hash(),
+                'env_simple_stopped_1': stopped.get_config_hash(),
+                'env_simple_pulled_1': pulled.get_config_hash(),
+                'env_simple_built_1': built.get_config_hash()
+            },
+            images={'nginx:1.19': 'sha256:current', 'redis:6': 'sha256:newer', 'env_simple_built': 'sha256:current'}
+        )
+
+        actions = DeploymentPlanner(drv).create_plan(
+            [unchanged, changed, scaled, stopped, pulled, new, built],
+            declared_names=['unchanged', 'changed', 'scaled', 'stopped', 'pulled', 'new', 'built']
+        )
+
+        self.assertEqual(
+            [('changed', 'recreate', 'definition changed'),
+             ('scaled', 'scale', 'scale from 1 to 3 replicas'),
+             ('stopped', 'start', '1 of 1 replicas not running'),
+             ('pulled', 'recreate', 'image "redis:6" changed'),
+             ('new', 'create', 'not created'),
+             ('removed', 'remove', 'service is no longer declared')],
+            [(action.service_name, action.action, action.reason) for action in actions]
+        )
+
+        self.assertEqual(['ps', 'inspect', 'image', 'image', 'image'], drv._docker.calls,
+                         msg='Expected that the state is collected once: one listing, one inspection, ' +
+                             'one lookup per image')
+
+    def test_containers_are_not_planned_to_be_removed_without_list_of_declared_services(self):
+        drv = self._get_prepared_compose_driver()
+        drv._docker = SnapshotDockerBackend([('env_simple_removed_1', 'Up 5 minutes')], {}, {})
+
+        self.assertEqual([], DeploymentPlanner(drv).create_plan([]))
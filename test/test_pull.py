@@ -0,0 +1,77 @@
+from subprocess import CalledProcessError
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.pull import ImagePullScheduler
+from rkd_harbor.pull import format_size
+from rkd_harbor.pull import PULLED
+from rkd_harbor.pull import SKIPPED
+from rkd_harbor.pull import FAILED
+from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.docker_backend import DockerCliBackend
+
+PINNED = 'nginx@sha256:0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef'
+
+
+class LocalImagesBackend(DockerCliBackend):
+    def __init__(self, images: dict):
+        super().__init__(None)
+        self.images = images
+
+    def inspect_image(self, image: str):
+        return self.images.get(image)
+
+
+class ImagePullSchedulerTest(BaseHarborTestClass):
+    def _create_scheduler(self, failures: dict, images: dict) -> tuple:
+        drv = self._get_prepared_compose_driver()
+        drv._docker = LocalImagesBackend(images)
+        pulled = []
+
+        def sh(command: str, capture: bool = False):
+            image = command.split('"')[1]
+            pulled.append(image)
+
+            if failures.get(image):
+                raise CalledProcessError(1, command, output=failures[image].pop(0).encode('utf-8'))
+
+        drv.scope.sh = sh
+
+        return ImagePullScheduler(drv, workers=2, retries=2, backoff=0), pulled
+
+    def test_images_are_pulled_once_and_digest_pinned_present_images_are_skipped(self):
+        scheduler, pulled = self._create_scheduler({}, {PINNED: {'Id': 'sha256:abc'},
+                                                        'redis:6': {'Id': 'sha256:def', 'Size': 2048}})
+
+        results = scheduler.pull([
+            ServiceDeclaration('website', {'image': PINNED}),
+            ServiceDeclaration('redis', {'image': 'redis:6'}),
+            ServiceDeclaration('cache', {'image': 'redis:6'}),
+            ServiceDeclaration('app', {'build': '.'}),
+            ServiceDeclaration('worker', {'build': '.', 'image': 'private/worker:1.0'})
+        ])
+
+        self.assertEqual(['redis:6'], pulled)
+        self.assertEqual([(PINNED, ['website'], SKIPPED), ('redis:6', ['redis', 'cache'], PULLED)],
+                         [(result.image, result.services, result.status) for result in results])
+        self.assertEqual(2048, results[1].size)
+
+    def test_transient_failures_are_retried_and_permanent_failures_are_not(self):
+        scheduler, pulled = self._create_scheduler({
+            'redis:6': ['net/http: TLS handshake timeout'],
+            'private/app:1.0': ['Error response from daemon: pull access denied for private/app']
+        }, {})
+
+        results = scheduler.pull([
+            ServiceDeclaration('redis', {'image': 'redis:6'}),
+            ServiceDeclaration('app', {'image': 'private/app:1.0'})
+        ])
+
+        self.assertEqual(['redis:6', 'redis:6'], [image for image in pulled if image == 'redis:6'])
+        self.assertEqual((PULLED, 2), (results[0].status, results[0].attempts))
+        self.assertEqual((FAILED, 1), (results[1].status, results[1].attempts))
+        self.assertIn('pull access denied', results[1].reason)
+
+    def test_format_size(self):
+        self.assertEqual('-', format_size(None))
+        self.assertEqual('512 B', format_size(512))
+        self.assertEqual('1.5 MB', format_size(1024 * 1536))
+        self.assertEqual('2.0 GB', format_size(2 * 1024 ** 3))
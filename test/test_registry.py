@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+from rkd.exception import DeclarationException
+from rkd_harbor import imports
+from rkd_harbor.registry import LazyTaskDeclaration
+from rkd_harbor.test import BaseHarborTestClass
+
+RESOLVE_SERVICE_LIST = '''
+from rkd_harbor import imports
+from rkd_harbor.registry import LazyTaskDeclaration
+
+declarations = {declaration.to_full_name(): declaration for declaration in imports()
+                if isinstance(declaration, LazyTaskDeclaration)}
+declarations[':harbor:service:list'].get_task_to_execute()
+'''
+
+
+class LazyTaskDeclarationTest(BaseHarborTestClass):
+    def test_registered_names_match_task_names(self):
+        for declaration in imports():
+            if isinstance(declaration, LazyTaskDeclaration):
+                self.assertEqual(declaration.to_full_name(), declaration.get_task_to_execute().get_full_name())
+
+    def test_task_is_created_on_first_access(self):
+        declaration = LazyTaskDeclaration(':harbor:service:list', 'rkd_harbor.tasks.listing.ListDefinedServices')
+
+        self.assertFalse(declaration.is_loaded())
+        self.assertEqual(':harbor:service:list', declaration.to_full_name())
+        self.assertFalse(declaration.is_loaded())
+
+        self.assertIs(declaration.get_task_to_execute(), declaration.get_task_to_execute())
+        self.assertTrue(declaration.is_loaded())
+
+    def test_name_mismatch_is_reported(self):
+        declaration = LazyTaskDeclaration(':harbor:services', 'rkd_harbor.tasks.listing.ListDefinedServices')
+
+        self.assertRaises(DeclarationException, lambda: declaration.get_task_to_execute())
+
+    def test_task_modules_are_not_imported_until_task_is_resolved(self):
+        loaded = subprocess.check_output(
+            [sys.executable, '-c', 'import sys\n' + RESOLVE_SERVICE_LIST + 'print(" ".join(sys.modules.keys()))'],
+            env=self._get_python_env()
+        ).decode('utf-8').split()
+
+        self.assertIn('rkd_harbor.tasks.listing', loaded)
+        self.assertNotIn('rkd_harbor.tasks.deployment.apply', loaded)
+        self.assertNotIn('rkd_harbor.tasks.repositories', loaded)
+        self.assertNotIn('rkd_cooperative', loaded)
+
+    @staticmethod
+    def _get_python_env() -> dict:
+        return dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
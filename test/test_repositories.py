@@ -1,3 +1,5 @@
+import tempfile
+import subprocess
 from subprocess import CalledProcessError
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.tasks.repositories import FetchRepositoryTask
@@ -63,7 +65,7 @@ class TestRepositories(BaseHarborTestClass):
             collected_args.append(list(args)[0])
 
         task.rkd = mocked_rkd
-        out = self.execute_mocked_task_and_get_output(task, args={})
+        out = self.execute_mocked_task_and_get_output(task, args={'--parallel': 1})
 
         # check logging
         self.assertIn('Updating "example"', out)
@@ -75,3 +77,111 @@ class TestRepositories(BaseHarborTestClass):
             [[':harbor:git:apps:update', 'example'], [':harbor:git:apps:update', 'second']],
             collected_args
         )
+
+    def test_fetch_all_repositories_in_parallel_prints_output_of_each_repository_as_a_block(self):
+        """Check that with --parallel the output is buffered per repository, failures are isolated
+        and a summary table is printed at the end"""
+
+        task = FetchAllRepositories()
+
+        def mocked_rkd(args, capture=False):
+            self.assertTrue(capture)
+
+            if 'example' in args:
+                raise CalledProcessError(returncode=128, cmd='update example', output=b'Authentication failed')
+
+            return 'Already up to date.\n'
+
+        task.rkd = mocked_rkd
+        out = self.execute_mocked_task_and_get_output(task, args={'--parallel': 2})
+
+        self.assertIn('Authentication failed', out)
+        self.assertIn('Failed updating "example"', out)
+        self.assertIn('Already up to date.', out)
+        self.assertRegex(out, r'example\s+FAILED')
+        self.assertRegex(out, r'second\s+OK')
+        self.assertIn('TASK_EXIT_RESULT=False', out)
+
+    def _create_local_remote(self) -> str:
+        """Bare repository with two commits on "stable" branch, and a "work" clone to push next commits from"""
+
+        remote = tempfile.TemporaryDirectory()
+        self.addCleanup(remote.cleanup)
+
+        subprocess.check_call('''
+            set -e
+            git init -q --bare remote.git
+            git -C remote.git symbolic-ref HEAD refs/heads/stable
+            git clone -q remote.git work 2>/dev/null && cd work
+            git -c user.name=test -c user.email=test@localhost commit -q --allow-empty -m "first"
+            git -c user.name=test -c user.email=test@localhost commit -q --allow-empty -m "second"
+            git push -q origin HEAD:stable
+        ''', shell=True, cwd=remote.name)
+
+        return remote.name
+
+    @staticmethod
+    def _commit(path: str, message: str, push: bool = False):
+        subprocess.check_call(
+            'git -c user.name=test -c user.email=test@localhost commit -q --allow-empty -m "%s"' % message +
+            (' && git push -q origin HEAD:stable' if push else ''),
+            shell=True, cwd=path
+        )
+
+    @staticmethod
+    def _create_task(remote: str, project_vars: dict) -> FetchRepositoryTask:
+        task = FetchRepositoryTask()
+        task._get_remote_url = lambda config_path, variables: 'file://' + remote + '/remote.git'
+        task._get_permissions_command = lambda: ''
+        task._load_project_vars = lambda path: dict(project_vars)
+
+        return task
+
+    def test_shallow_repository_is_cloned_then_fast_forwarded_from_local_remote(self):
+        """Check that GIT_DEPTH and GIT_BRANCH are respected by clone and by update, without re-adding the remote"""
+
+        remote = self._create_local_remote()
+        task = self._create_task(remote, {'GIT_PROJECT_DIR': 'shallow', 'GIT_DEPTH': '1', 'GIT_BRANCH': 'stable'})
+
+        out = self.execute_mocked_task_and_get_output(task, args={'name': 'second'})
+        self.assertIn('TASK_EXIT_RESULT=True', out)
+        self.assertEqual(b'1\n', subprocess.check_output('git rev-list --count HEAD', shell=True,
+                                                          cwd='./apps/www-data/shallow'))
+
+        self._commit(remote + '/work', 'third', push=True)
+
+        out = self.execute_mocked_task_and_get_output(task, args={'name': 'second'})
+        self.assertIn('TASK_EXIT_RESULT=True', out)
+        self.assertEqual(b'third\n', subprocess.check_output('git log -1 --format=%s', shell=True,
+                                                              cwd='./apps/www-data/shallow'))
+        self.assertNotIn('Setting remote origin', out)
+
+    def test_local_commits_of_shallow_repository_are_not_discarded_when_branch_diverged(self):
+        remote = self._create_local_remote()
+        task = self._create_task(remote, {'GIT_PROJECT_DIR': 'diverged', 'GIT_DEPTH': '2', 'GIT_BRANCH': 'stable'})
+
+        self.assertIn('TASK_EXIT_RESULT=True', self.execute_mocked_task_and_get_output(task, args={'name': 'second'}))
+
+        self._commit('./apps/www-data/diverged', 'local change')
+        self._commit(remote + '/work', 'third', push=True)
+
+        with self.assertRaises(CalledProcessError):
+            self.execute_mocked_task_and_get_output(task, args={'name': 'second'})
+
+        self.assertEqual(b'local change\n', subprocess.check_output('git log -1 --format=%s', shell=True,
+                                                                     cwd='./apps/www-data/diverged'))
+
+    def test_sparse_checkout_is_skipped_on_git_older_than_2_25(self):
+        remote = self._create_local_remote()
+        task = self._create_task(remote, {'GIT_PROJECT_DIR': 'sparse', 'GIT_SPARSE_PATHS': 'src'})
+        task._get_git_version = lambda: (2, 17)
+        commands = []
+        sh = task.sh
+        task.sh = lambda cmd, **kwargs: commands.append(cmd) or sh(cmd, **kwargs)
+
+        out = self.execute_mocked_task_and_get_output(task, args={'name': 'second'})
+
+        self.assertIn('GIT_SPARSE_PATHS requires git 2.25 or newer', out)
+        self.assertIn('TASK_EXIT_RESULT=True', out)
+        self.assertNotIn('--sparse', ''.join(commands))
+        self.assertNotIn('sparse-checkout', ''.join(commands))
@@ -0,0 +1,86 @@
+import os
+import json
+import tempfile
+import subprocess
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.repository_config import load_repository_config
+from rkd_harbor.exception import RepositoryConfigNotStaticException
+
+CONFIG = '''#!/bin/bash
+# variables here are overriding everything that is in .env file
+export GIT_PROJECT_NAME=riotkit-do
+export GIT_PROJECT_DIR="${GIT_PROJECT_NAME}-$DOMAIN"
+export GIT_ORG_NAME='riotkit-org'  # single quotes are literal: $DOMAIN
+export WRITABLE_DIRS="files\\\\ store cache \\\\$HOME"
+NOT_EXPORTED=value\\ with\\ spaces
+export USES_NOT_EXPORTED="$NOT_EXPORTED"
+EXPORTED_LATER="~not-expanded-in-quotes"
+export EXPORTED_LATER
+export UNDEFINED_REFERENCE="prefix-${NOT_DEFINED_ANYWHERE}-suffix"
+
+post_update () {
+    echo "I'm a post_update hook, i'm in $1 directory"
+}
+
+function pre_update {
+    if [[ -d "$1" ]]; then
+        echo "Exists"
+    fi
+}
+'''
+
+
+class RepositoryConfigTest(BaseHarborTestClass):
+    def _write(self, content: str) -> str:
+        f = tempfile.NamedTemporaryFile('w', suffix='.sh', delete=False)
+        f.write(content)
+        f.close()
+
+        self.addCleanup(os.unlink, f.name)
+
+        return f.name
+
+    def test_variables_are_same_as_when_sourced_in_bash(self):
+        path = self._write(CONFIG)
+        environment = {'DOMAIN': 'example.org', 'GIT_ORG_NAME': 'overridden', 'PATH': os.environ['PATH']}
+
+        sourced = json.loads(subprocess.check_output(
+            ['bash', '-c', 'source %s; python3 -c "import json, os; print(json.dumps(dict(os.environ)))"' % path],
+            env=environment
+        ))
+        resolved = load_repository_config(path).resolve(environment)
+
+        for name in ['GIT_PROJECT_NAME', 'GIT_PROJECT_DIR', 'GIT_ORG_NAME', 'WRITABLE_DIRS', 'UNDEFINED_REFERENCE',
+                     'USES_NOT_EXPORTED', 'EXPORTED_LATER']:
+            self.assertEqual(sourced[name], resolved[name], msg='Expected same value of %s' % name)
+
+        self.assertEqual('riotkit-do-example.org', resolved['GIT_PROJECT_DIR'])
+        self.assertEqual('value with spaces', resolved['USES_NOT_EXPORTED'])
+        self.assertNotIn('NOT_EXPORTED', sourced)
+        self.assertNotIn('NOT_EXPORTED', resolved)
+
+    def test_functions_are_detected(self):
+        config = load_repository_config(self._write(CONFIG))
+
+        self.assertTrue(config.has_function('post_update'))
+        self.assertTrue(config.has_function('pre_update'))
+        self.assertFalse(config.has_function('echo'))
+
+    def test_shell_logic_is_reported_as_not_static(self):
+        for content in ['export GIT_USER=$(whoami)\n', 'export GIT_USER=`whoami`\n', 'source ../common.sh\n',
+                        'if [[ -f x ]]; then export A=1; fi\n', 'export A=${B:-default}\n', 'export A=1 B=2\n',
+                        'export A=~/x\n', 'export A=/bin:~/bin\n']:
+            with self.subTest(content):
+                self.assertRaises(RepositoryConfigNotStaticException,
+                                  lambda: load_repository_config(self._write(content)))
+
+    def test_config_is_parsed_again_after_modification(self):
+        path = self._write('export GIT_SERVER=github.com\n')
+        self.assertEqual('github.com', load_repository_config(path).resolve({})['GIT_SERVER'])
+
+        with open(path, 'w') as f:
+            f.write('export GIT_SERVER=gitlab.com\n')
+
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1000))
+
+        self.assertEqual('gitlab.com', load_repository_config(path).resolve({})['GIT_SERVER'])
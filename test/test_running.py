@@ -1,3 +1,5 @@
+import os
+import threading
 from subprocess import CalledProcessError
 from rkd.api.contract import ExecutionContext
 from rkd.api.syntax import TaskDeclaration
@@ -8,6 +10,12 @@ from rkd_harbor.tasks.running import StopTask
 from rkd_harbor.tasks.running import StartTask
 from rkd_harbor.tasks.running import RestartTask
 from rkd_harbor.exception import ProfileNotFoundException
+from rkd_harbor.service import ServiceDeclaration
+from rkd_harbor.pull import PullResult
+from rkd_harbor.pull import PULLED
+from rkd_harbor.plan import PlannedAction
+from rkd_harbor.plan import ACTION_RECREATE
+from rkd_harbor.plan import ACTION_REMOVE
 
 
 class TestRunning(BaseHarborTestClass):
@@ -23,7 +31,8 @@ class TestRunning(BaseHarborTestClass):
         self.execute_mocked_task_and_get_output(task, args={
             '--profile': 'profile1',
             '--strategy': 'recreate',
-            '--remove-previous-images': False
+            '--remove-previous-images': False,
+            '--pipeline': False
         })
 
         called_tasks_in_order = list(filter(
@@ -43,7 +52,8 @@ class TestRunning(BaseHarborTestClass):
         self.execute_mocked_task_and_get_output(task, args={
             '--profile': 'profile1',
             '--strategy': 'recreate',
-            '--remove-previous-images': False
+            '--remove-previous-images': False,
+            '--pipeline': False
         })
 
         args = ' '.join(recorded_calls[0][0])
@@ -51,6 +61,64 @@ class TestRunning(BaseHarborTestClass):
         self.assertIn(':harbor:pull --profile=profile1', args)
         self.assertIn(':harbor:start --profile=profile1 --strategy=recreate', args)
 
+    def test_upgrade_pipeline_starts_services_as_soon_as_their_prerequisites_are_ready(self):
+        """Service not using application repositories is started while repositories are still being updated"""
+
+        task = UpgradeTask()
+        events = []
+        repositories_updated = threading.Event()
+        redis = ServiceDeclaration('redis', {'image': 'redis:6'})
+        website = ServiceDeclaration('website', {'image': 'nginx', 'volumes': ['./apps/www-data/website:/var/www']})
+        cache = ServiceDeclaration('cache', {'image': 'redis:6'})
+        pulled_images = []
+
+        def rkd_mock(args, **kwargs):
+            if ':harbor:git:apps:update-all' in args:
+                repositories_updated.wait(timeout=10)
+                events.append('repositories updated')
+                return ''
+
+            if ':harbor:service:up' in args:
+                events.append('started %s' % args[2])
+
+                if args[2] == 'redis':
+                    repositories_updated.set()
+
+                return ''
+
+            events.append([arg for arg in args if arg.startswith(':')][0])
+
+        task.rkd = rkd_mock
+        task.get_matching_services = lambda ctx: [redis, website, cache]
+
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+
+        def pull_images(services: list, workers: int):
+            pulled_images.append(services[0].get_image())
+            result = PullResult(services[0].get_image(), [service.get_name() for service in services])
+            result.status = PULLED
+            result.size = 1024 * 1024
+
+            return [result]
+
+        task.containers(ctx).pull_images = pull_images
+
+        out = self.execute_mocked_task_and_get_output(task, args={
+            '--profile': '',
+            '--strategy': 'auto',
+            '--remove-previous-images': False,
+            '--pipeline': True,
+            '--parallel': 2
+        })
+
+        self.assertEqual([':harbor:templates:render', 'started redis', 'repositories updated', 'started website',
+                          'started cache', ':harbor:gateway:reload'], events)
+        self.assertEqual(['redis:6', 'nginx'], sorted(pulled_images, reverse=True),
+                         msg='Image shared by services should be pulled once')
+        self.assertIn('[website] image pulled', out)
+        self.assertEqual(1, out.count('[redis, cache] image pulled'))
+        self.assertIn('TASK_EXIT_RESULT=True', out)
+
     def test_stop_and_remove_task_reports_invalid_profile(self):
         task = StopAndRemoveTask()
         recorded_calls = []
@@ -125,7 +193,10 @@ class TestRunning(BaseHarborTestClass):
         self.execute_mocked_task_and_get_output(task, args={
             '--profile': 'profile1',
             '--strategy': 'rolling',
-            '--remove-previous-images': False
+            '--remove-previous-images': False,
+            '--parallel': 1,
+            '--force': False,
+            '--from-plan': False
         })
 
         args = list(map(lambda call: ' '.join(call[0]).strip(), recorded_calls))
@@ -155,9 +226,101 @@ class TestRunning(BaseHarborTestClass):
         out = self.execute_mocked_task_and_get_output(task, args={
             '--profile': 'profile1',
             '--strategy': 'rolling',
-            '--remove-previous-images': False
+            '--remove-previous-images': False,
+            '--parallel': 1,
+            '--force': False,
+            '--from-plan': False
         })
 
         self.assertIn('Cannot start service "gateway"', out)
         self.assertIn('Service "website" was started', out)
         self.assertIn('TASK_EXIT_RESULT=False', out)
+
+    def test_start_task_in_parallel_starts_priority_groups_in_order(self):
+        """Services of same priority are started together, groups are started in order of priority"""
+
+        task = StartTask()
+        recorded_calls = []
+
+        def rkd_mock(args, **kwargs):
+            recorded_calls.append(args[2])
+            return 'Started %s' % args[2]
+
+        task.rkd = rkd_mock
+
+        out = self.execute_mocked_task_and_get_output(task, args={
+            '--profile': '',
+            '--strategy': 'compose',
+            '--remove-previous-images': False,
+            '--parallel': 4,
+            '--force': False,
+            '--from-plan': False
+        })
+
+        self.assertEqual('gateway_proxy_gen', recorded_calls[0])
+        self.assertEqual('gateway', recorded_calls[1])
+        self.assertEqual('gateway_letsencrypt', recorded_calls[2])
+        self.assertIn('[gateway] Started gateway', out)
+        self.assertIn('TASK_EXIT_RESULT=True', out)
+
+    def test_start_task_in_parallel_does_not_start_next_priority_group_after_failure(self):
+        task = StartTask()
+        recorded_calls = []
+
+        def rkd_mock(args, **kwargs):
+            recorded_calls.append(args[2])
+
+            if args[2] == 'gateway':
+                raise CalledProcessError(1, 'bash', output=b'Port already in use')
+
+            return ''
+
+        task.rkd = rkd_mock
+
+        out = self.execute_mocked_task_and_get_output(task, args={
+            '--profile': '',
+            '--strategy': 'compose',
+            '--remove-previous-images': False,
+            '--parallel': 4,
+            '--force': False,
+            '--from-plan': False
+        })
+
+        self.assertEqual(['gateway_proxy_gen', 'gateway'], recorded_calls)
+        self.assertIn('[gateway] Port already in use', out)
+        self.assertIn('Cannot start service "gateway"', out)
+        self.assertIn('TASK_EXIT_RESULT=False', out)
+
+    def test_start_task_from_plan_starts_only_planned_services(self):
+        task = StartTask()
+        recorded_calls = []
+        removed = []
+
+        task.rkd = lambda args, **kwargs: recorded_calls.append(args[2])
+        task.execute_hooks = lambda ctx, hook_name: recorded_calls.append(hook_name)
+        task.create_deployment_plan = lambda ctx: [
+            PlannedAction('website', ACTION_RECREATE, 'definition changed', 1, 5),
+            PlannedAction('old_service', ACTION_REMOVE, 'service is no longer declared', 1, 1)
+        ]
+
+        def rm_undeclared(service_name: str):
+            removed.append(service_name)
+            recorded_calls.append('rm ' + service_name)
+
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+        task.containers(ctx).rm_undeclared = rm_undeclared
+
+        out = self.execute_mocked_task_and_get_output(task, args={
+            '--profile': '',
+            '--strategy': 'auto',
+            '--remove-previous-images': False,
+            '--parallel': 1,
+            '--force': False,
+            '--from-plan': True
+        })
+
+        self.assertEqual(['pre-start', 'rm old_service', 'website', 'post-start'], recorded_calls,
+                         msg='Containers should be removed after "pre-start" hooks')
+        self.assertEqual(['old_service'], removed)
+        self.assertIn('definition changed', out)
+        self.assertIn('TASK_EXIT_RESULT=True', out)
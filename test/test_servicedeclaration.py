@@ -164,3 +164,32 @@ class ServiceDeclarationTest(BaseHarborTestClass):
 
         service = ServiceDeclaration('iwa_ait', example_service)
         self.assertEqual('latest', service.get_declared_version())
+
+    def test_labels_and_environment_declared_as_list_are_understood(self):
+        example_service = {
+            'image': 'nginx:1.19',
+            'labels': ['org.riotkit.replicas=3', 'org.riotkit.priority=200', 'org.riotkit.useMaintenanceMode=true'],
+            'environment': ['VIRTUAL_HOST=iwa-ait.org,www.iwa-ait.org', 'PASSED_FROM_HOST']
+        }
+
+        service = ServiceDeclaration('iwa_ait', example_service)
+
+        self.assertEqual(3, service.get_desired_replicas_count())
+        self.assertEqual(200, service.get_priority_number())
+        self.assertTrue(service.is_using_maintenance_mode())
+        self.assertEqual(['iwa-ait.org', 'www.iwa-ait.org'], service.get_domains())
+        self.assertEqual({'VIRTUAL_HOST': 'iwa-ait.org,www.iwa-ait.org', 'PASSED_FROM_HOST': None},
+                         service.get_environment())
+
+    def test_config_hash_is_same_for_labels_declared_as_list_and_dict(self):
+        as_list = ServiceDeclaration('iwa_ait', {'labels': ['org.riotkit.replicas=3']})
+        as_dict = ServiceDeclaration('iwa_ait', {'labels': {'org.riotkit.replicas': '3'}})
+
+        self.assertEqual(as_dict.get_config_hash(), as_list.get_config_hash())
+
+    def test_fields_are_parsed_once(self):
+        service = ServiceDeclaration('iwa_ait', {'ports': ['80:80'], 'environment': {'VIRTUAL_HOST': 'iwa-ait.org'}})
+
+        self.assertIs(service.get_domains(), service.get_domains())
+        self.assertIs(service.get_ports(), service.get_ports())
+        self.assertFalse(hasattr(service, '__dict__'), msg='Declarations should be compact (__slots__)')
@@ -1,6 +1,7 @@
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.service import ServiceLocator
 from rkd_harbor.exception import ServiceNotFoundInYaml
+from rkd_harbor.exception import ServiceNotFoundInYamlLookedByCriteria
 
 
 class ServiceLocatorTest(BaseHarborTestClass):
@@ -20,3 +21,46 @@ class ServiceLocatorTest(BaseHarborTestClass):
         })
 
         self.assertRaises(ServiceNotFoundInYaml, lambda: locator.get_by_name('non_existing'))
+
+    def test_services_are_indexed_by_domain(self):
+        locator = ServiceLocator({
+            'web_iwa_ait': {'environment': {'VIRTUAL_HOST': 'iwa-ait.org,www.iwa-ait.org'}},
+            'web_priamaakcia': {'environment': {'VIRTUAL_HOST': 'priamaakcia.sk'}},
+            'db': {}
+        })
+
+        self.assertEqual('web_iwa_ait', locator.find_by_domain('www.iwa-ait.org').get_name())
+        self.assertEqual(['iwa-ait.org', 'www.iwa-ait.org'], locator.get_domains_of('web_iwa_ait'))
+        self.assertEqual([], locator.get_domains_of('db'))
+        self.assertRaises(ServiceNotFoundInYamlLookedByCriteria, lambda: locator.find_by_domain('zsp.net.pl'))
+        self.assertRaises(ServiceNotFoundInYaml, lambda: locator.get_domains_of('non_existing'))
+
+    def test_services_are_indexed_by_labels_declared_as_dict_or_list(self):
+        locator = ServiceLocator({
+            'web_iwa_ait': {'labels': {'org.riotkit.useMaintenanceMode': True, 'org.riotkit.priority': 200}},
+            'web_priamaakcia': {'labels': ['org.riotkit.useMaintenanceMode=true', 'org.riotkit.updateStrategy=rolling']},
+            'db': {'labels': {'org.riotkit.useMaintenanceMode': 'false'}}
+        })
+
+        self.assertEqual(['web_iwa_ait', 'web_priamaakcia'],
+                         [service.get_name() for service in locator.find_by_label('org.riotkit.useMaintenanceMode', 'true')])
+        self.assertEqual(['web_iwa_ait', 'web_priamaakcia'],
+                         [service.get_name() for service in locator.find_by_label('org.riotkit.useMaintenanceMode', True)])
+        self.assertEqual(['db'],
+                         [service.get_name() for service in locator.find_by_label('org.riotkit.useMaintenanceMode', False)])
+        self.assertEqual(['web_iwa_ait'],
+                         [service.get_name() for service in locator.find_by_label('org.riotkit.priority', 200)])
+        self.assertEqual(['web_priamaakcia'],
+                         [service.get_name() for service in locator.find_by_label('org.riotkit.updateStrategy', 'rolling')])
+        self.assertEqual(3, len(locator.find_by_label('org.riotkit.useMaintenanceMode')))
+        self.assertEqual([], locator.find_by_label('org.riotkit.replicas'))
+
+    def test_services_are_indexed_by_priority(self):
+        locator = ServiceLocator({
+            'web_iwa_ait': {'labels': {'org.riotkit.priority': 200}},
+            'web_priamaakcia': {'labels': {'org.riotkit.priority': 200}},
+            'db': {'labels': {'org.riotkit.priority': 100}}
+        })
+
+        self.assertEqual(['db', 'web_iwa_ait', 'web_priamaakcia'],
+                         [service.get_name() for service in locator.get_all_by_priority()])
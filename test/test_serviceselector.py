@@ -1,5 +1,11 @@
+import os
+import tempfile
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.service import ServiceSelector
+from rkd_harbor.service import DeclarativeServiceSelector
+from rkd_harbor.service import ProfileLoader
+from rkd_harbor.exception import ProfileInvalidException
+from rkd_harbor.exception import ProfileNotFoundException
 from rkd.api.inputoutput import BufferedSystemIO
 from rkd.api.inputoutput import IO
 
@@ -96,3 +102,81 @@ class ServiceSelectorTest(BaseHarborTestClass):
         names = list(map(lambda service: service.get_name(), selector.find_matching_services(test_data)))
 
         self.assertEqual(['web_iwa_ait', 'web_phillyabc', 'web_abc_international'], names)
+
+    def test_invalid_selector_is_reported_once_and_matches_nothing(self):
+        io = BufferedSystemIO()
+        selector = ServiceSelector('name.startswith("web") and (', io)
+
+        self.assertEqual([], selector.find_matching_services(self._provide_test_data()))
+        self.assertEqual(1, io.get_value().count('Exception raised, while attempting to evaluate --profile selector'))
+
+    def test_declarative_profile_matches_names_labels_and_images(self):
+        test_data = self._provide_test_data()
+        test_data['gateway'] = {'image': 'quay.io/riotkit/nginx-proxy:0.8'}
+        test_data['gateway_letsencrypt'] = {'image': 'quay.io/riotkit/letsencrypt:1.8'}
+
+        cases = [
+            ({'include': [{'name': 'gateway*'}]}, ['gateway', 'gateway_letsencrypt']),
+            ({'include': [{'labels': {'org.riotkit.type': 'abc'}}]}, ['web_abc_international', 'web_phillyabc']),
+            ({'include': [{'has_labels': 'org.riotkit.country'}]}, ['web_phillyabc']),
+            ({'include': [{'image': 'quay.io/riotkit/'}]}, ['gateway', 'gateway_letsencrypt']),
+            ({'include': [{'image': 'quay.io/riotkit/', 'name': '*letsencrypt'}]}, ['gateway_letsencrypt']),
+            ({'include': [{'name': 'gateway'}, {'labels': {'org.riotkit.type': 'workers-union'}}]},
+             ['web_iwa_ait', 'gateway']),
+            ({'exclude': [{'name': 'web_*'}, {'name': 'gateway'}]}, ['gateway_letsencrypt'])
+        ]
+
+        for definition, expected in cases:
+            with self.subTest(str(definition)):
+                selector = DeclarativeServiceSelector(definition, 'test.profile.yml')
+
+                self.assertEqual(expected, [service.get_name() for service in
+                                            selector.find_matching_services(test_data)])
+
+    def test_declarative_profile_matches_boolean_labels_declared_as_dict_or_list(self):
+        test_data = self._provide_test_data()
+        test_data['web_iwa_ait']['labels']['org.riotkit.useMaintenanceMode'] = True
+        test_data['web_phillyabc']['labels'] = ['org.riotkit.useMaintenanceMode=true']
+        test_data['web_abc_international']['labels']['org.riotkit.useMaintenanceMode'] = 'false'
+
+        with tempfile.TemporaryDirectory() as apps_path:
+            os.mkdir(apps_path + '/profile')
+
+            with open(apps_path + '/profile/maintenance.profile.yml', 'w') as f:
+                f.write('include:\n    - labels: {"org.riotkit.useMaintenanceMode": true}\n')
+
+            selector = ProfileLoader(IO(), apps_path).load_profile('maintenance')
+
+            self.assertEqual(['web_iwa_ait', 'web_phillyabc'],
+                             [service.get_name() for service in selector.find_matching_services(test_data)])
+
+    def test_declarative_profile_with_unknown_rule_is_invalid(self):
+        self.assertRaises(ProfileInvalidException,
+                          lambda: DeclarativeServiceSelector({'include': [{'domain': 'iwa-ait.org'}]}, 'test'))
+        self.assertRaises(ProfileInvalidException, lambda: DeclarativeServiceSelector({'name': 'web_*'}, 'test'))
+
+    def test_profiles_are_combined_with_union_difference_and_intersection(self):
+        with tempfile.TemporaryDirectory() as apps_path:
+            os.mkdir(apps_path + '/profile')
+
+            with open(apps_path + '/profile/abc.profile.yml', 'w') as f:
+                f.write('include:\n    - labels: {"org.riotkit.type": "abc"}\n')
+
+            with open(apps_path + '/profile/usa.profile.py', 'w') as f:
+                f.write('"org.riotkit.country" in service["labels"]')
+
+            with open(apps_path + '/profile/workers-union.profile.yml', 'w') as f:
+                f.write('include:\n    - name: web_iwa_ait\n')
+
+            loader = ProfileLoader(IO(), apps_path)
+
+            def find(profile: str) -> list:
+                return [service.get_name() for service in
+                        loader.load_profile(profile).find_matching_services(self._provide_test_data())]
+
+            self.assertEqual(['web_abc_international', 'web_phillyabc', 'web_iwa_ait'], find('abc+workers-union'))
+            self.assertEqual(['web_abc_international'], find('abc-usa'))
+            self.assertEqual(['web_phillyabc'], find('abc&usa'))
+            self.assertEqual(['web_iwa_ait'], find('workers-union'), msg='Existing profile name takes precedence')
+            self.assertRaises(ProfileNotFoundException, lambda: find('abc+anarchosyndicalists'))
+            self.assertRaises(ProfileInvalidException, lambda: find('abc+'))
@@ -1,3 +1,7 @@
+import os
+from collections import OrderedDict
+from rkd.api.contract import ExecutionContext
+from rkd.api.syntax import TaskDeclaration
 from rkd_harbor.test import BaseHarborTestClass
 from rkd_harbor.tasks.service import ServiceUpTask
 from rkd_harbor.service import ServiceDeclaration
@@ -16,7 +20,8 @@ class ServiceUpTaskTest(BaseHarborTestClass):
                 'name': 'website',
                 '--strategy': 'recreate',
                 '--remove-previous-images': False,
-                '--extra-args': ''
+                '--extra-args': '',
+                '--force': False
             })
 
             self.assertIn('Recreating env_simple_website_1', out)
@@ -35,7 +40,10 @@ class ServiceUpTaskTest(BaseHarborTestClass):
             'name': 'website',
             '--strategy': 'rolling',
             '--remove-previous-images': False,
-            '--extra-args': ''
+            '--extra-args': '',
+            '--rolling-batch-size': None,
+            '--rolling-max-surge': None,
+            '--force': False
         })
 
         self.assertIn('Stopping env_simple_gateway_proxy_gen_1', out,
@@ -62,7 +70,8 @@ class ServiceUpTaskTest(BaseHarborTestClass):
             '--strategy': 'compose',
             '--remove-previous-images': False,
             '--extra-args': '',
-            '--dont-recreate': False
+            '--dont-recreate': False,
+            '--force': True
         })
 
         self.assertIn('env_simple_website_1 is up-to-date', out)
@@ -78,7 +87,8 @@ class ServiceUpTaskTest(BaseHarborTestClass):
             '--strategy': 'auto',
             '--remove-previous-images': False,
             '--extra-args': '',
-            '--dont-recreate': False
+            '--dont-recreate': False,
+            '--force': False
         })
 
         self.assertIn('Performing "compose"', out)
@@ -94,7 +104,111 @@ class ServiceUpTaskTest(BaseHarborTestClass):
             '--strategy': 'invalid-strategy-name',
             '--remove-previous-images': False,
             '--extra-args': '',
-            '--dont-recreate': False
+            '--dont-recreate': False,
+            '--force': False
         })
 
         self.assertIn('Invalid strategy selected: invalid-strategy-name', out)
+
+    def test_rolling_update_replaces_replicas_in_batches(self):
+        """Replicas are created, awaited and killed in batches - one service discovery pause per batch"""
+
+        self.mock_compose({'services': {'batched': {
+            'image': 'nginx:1.19',
+            'labels': {'org.riotkit.replicas': 5, 'org.riotkit.rollingBatchSize': 2}
+        }}})
+
+        task = ServiceUpTask()
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+        drv = task.containers(ctx)
+        compose_calls = []
+        awaited_instances = []
+        killed = []
+        replicas = OrderedDict([(1, True), (2, True), (3, True), (4, True), (5, True)])
+
+        def scale_up(service, surge: int):
+            for num in range(max(replicas.keys()) + 1, max(replicas.keys()) + 1 + surge):
+                replicas[num] = True
+
+            return OrderedDict(replicas)
+
+        class RemovingBackend(object):
+            def remove(self, names: list):
+                for name in names:
+                    killed.append(name)
+                    del replicas[int(name.split('_')[-1])]
+
+        drv.scale_up = scale_up
+        drv.compose = lambda args, capture=False: compose_calls.append(args[0])
+        drv._docker = RemovingBackend()
+        task.rkd = lambda args, **kwargs: awaited_instances.append(args[-1])
+
+        self.execute_mocked_task_and_get_output(task, args={
+            'name': 'batched',
+            '--strategy': 'rolling',
+            '--remove-previous-images': False,
+            '--extra-args': '',
+            '--rolling-batch-size': None,
+            '--rolling-max-surge': None,
+            '--force': True
+        })
+
+        self.assertEqual(['stop', 'up'] * 3, compose_calls, msg='Expected one service discovery pause per batch')
+        self.assertEqual(['--instance=6,7', '--instance=8,9', '--instance=10'], awaited_instances,
+                         msg='Expected that all replicas of a batch are awaited together')
+        self.assertEqual(['env_simple_batched_1', 'env_simple_batched_2', 'env_simple_batched_3',
+                          'env_simple_batched_4', 'env_simple_batched_5'], killed)
+        self.assertEqual([6, 7, 8, 9, 10], list(replicas.keys()))
+
+    def test_rolling_batch_size_is_limited_by_max_surge(self):
+        service = ServiceDeclaration('batched', {'labels': {'org.riotkit.rollingBatchSize': 4,
+                                                            'org.riotkit.rollingMaxSurge': 2}})
+
+        def create_ctx(args: dict):
+            return ExecutionContext(TaskDeclaration(ServiceUpTask()), args=args, env={})
+
+        no_overrides = {'--rolling-batch-size': None, '--rolling-max-surge': None}
+
+        self.assertEqual(2, ServiceUpTask.get_rolling_batch_size(service, create_ctx(no_overrides)))
+        self.assertEqual(1, ServiceUpTask.get_rolling_batch_size(ServiceDeclaration('default', {}),
+                                                                 create_ctx(no_overrides)))
+        self.assertEqual(3, ServiceUpTask.get_rolling_batch_size(
+            ServiceDeclaration('default', {}), create_ctx({'--rolling-batch-size': 3, '--rolling-max-surge': None})
+        ))
+        self.assertEqual(4, ServiceUpTask.get_rolling_batch_size(
+            service, create_ctx({'--rolling-batch-size': None, '--rolling-max-surge': 5})
+        ))
+
+    def test_up_to_date_service_is_skipped_unless_forced(self):
+        task = ServiceUpTask()
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+        drv = task.containers(ctx)
+        deployed = []
+
+        drv.is_service_up_to_date = lambda service: True
+        task.deploy_compose_like = lambda service, context: deployed.append(service.get_name()) or True
+
+        args = {'name': 'website', '--strategy': 'compose', '--remove-previous-images': False, '--extra-args': '',
+                '--dont-recreate': False, '--force': False}
+
+        out = self.execute_mocked_task_and_get_output(task, args=args)
+        self.assertIn('Service "website" is up-to-date', out)
+        self.assertEqual([], deployed)
+
+        self.execute_mocked_task_and_get_output(task, args=dict(args, **{'--force': True}))
+        self.assertEqual(['website'], deployed)
+
+    def test_service_start_hooks_are_executed_for_up_to_date_service(self):
+        task = ServiceUpTask()
+        ctx = ExecutionContext(TaskDeclaration(task), args={}, env=dict(os.environ))
+        executed = []
+
+        task.containers(ctx).is_service_up_to_date = lambda service: True
+        task.execute_hooks = lambda context, hook_name: executed.append(hook_name)
+
+        self.execute_mocked_task_and_get_output(task, args={
+            'name': 'website', '--strategy': 'compose', '--remove-previous-images': False, '--extra-args': '',
+            '--dont-recreate': False, '--force': False
+        })
+
+        self.assertEqual(['pre-service-start-website', 'post-service-start-website'], executed)
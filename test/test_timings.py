@@ -0,0 +1,146 @@
+import os
+import sys
+import tempfile
+import subprocess
+from unittest import mock
+from argparse import ArgumentParser
+from rkd.api.contract import ExecutionContext
+from rkd_harbor.test import BaseHarborTestClass
+from rkd_harbor.tasks.base import HarborBaseTask
+from rkd_harbor.timings import CommandTimings
+from rkd_harbor.timings import Spans
+from rkd_harbor.timings import span
+from rkd_harbor.timings import start_trace
+from rkd_harbor.timings import append_to_trace
+from rkd_harbor.timings import read_trace
+from rkd_harbor.timings import categorize
+from rkd_harbor.timings import timed_check_output
+from rkd_harbor.timings import COMPOSE
+from rkd_harbor.timings import DOCKER
+from rkd_harbor.timings import GIT
+from rkd_harbor.timings import RKD
+from rkd_harbor.timings import OTHER
+from rkd_harbor.timings import TASK
+from rkd_harbor.timings import TRACE_FILE_ENV
+
+NESTED_PROCESS = '''
+import os
+from rkd_harbor.timings import span, append_to_trace, TRACE_FILE_ENV
+
+with span('scale_up'):
+    pass
+
+append_to_trace(os.environ[TRACE_FILE_ENV], ':harbor:service:up')
+'''
+
+
+class ShellTask(HarborBaseTask):
+    def get_name(self) -> str:
+        return ':shell'
+
+    def get_group_name(self) -> str:
+        return ':test'
+
+    def configure_argparse(self, parser: ArgumentParser):
+        super().configure_argparse(parser)
+
+    def run(self, context: ExecutionContext) -> bool:
+        self.sh('echo "Hello"', capture=True)
+
+        return True
+
+
+class CommandTimingsTest(BaseHarborTestClass):
+    def test_commands_are_categorized_by_executed_program(self):
+        self.assertEqual(COMPOSE, categorize('IS_DEBUG_COMMAND=true docker-compose -p test up -d'))
+        self.assertEqual(DOCKER, categorize(['docker', 'exec', '-i', 'test_web_1', 'sh']))
+        self.assertEqual(GIT, categorize('cd ./apps/www-data/app && /usr/bin/git pull'))
+        self.assertEqual(OTHER, categorize('chown -R 1000:1000 ./data'))
+        self.assertEqual(OTHER, categorize('echo "docker-compose"'))
+
+    def test_rkd_subprocess_is_categorized_by_command_passed_to_sh(self):
+        task = ShellTask()
+        executed = []
+
+        with mock.patch('rkd.api.contract.TaskUtilities.sh', side_effect=lambda cmd, **kwargs: executed.append(cmd)):
+            task.rkd([':harbor:service:up'])
+
+        self.assertEqual([' %RKD% --no-ui :harbor:service:up'], executed)
+        self.assertEqual(RKD, CommandTimings.records[-1].category)
+
+    def test_exit_code_and_captured_output_are_recorded(self):
+        self.assertEqual(b'Hello\n', timed_check_output(['echo', 'Hello']))
+        self.assertRaises(subprocess.CalledProcessError, lambda: timed_check_output('exit 3', shell=True))
+
+        succeeded, failed = CommandTimings.records
+
+        self.assertEqual((0, 6), (succeeded.exit_code, succeeded.captured_bytes))
+        self.assertEqual(3, failed.exit_code)
+
+    def test_summary_is_grouped_by_category(self):
+        timed_check_output(['echo', 'git'])
+        timed_check_output(['git', '--version'])
+        timed_check_output(['git', '--version'])
+
+        summary = {row[0]: row for row in CommandTimings.summarize()}
+
+        self.assertEqual(2, summary[GIT][1])
+        self.assertEqual(1, summary[OTHER][1])
+        self.assertEqual(0, summary[GIT][2])
+
+    def test_chrome_trace_contains_complete_events(self):
+        timed_check_output(['echo', 'Hello'])
+
+        with span('profile selection', profile='gateway'):
+            pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            start_trace(directory + '/trace.json')
+            append_to_trace(directory + '/trace.json', ':harbor:test')
+
+            metadata, command, phase = read_trace(directory + '/trace.json')
+
+        self.assertEqual(':harbor:test', metadata['args']['name'])
+        self.assertEqual(('X', 'echo Hello'), (command['ph'], command['args']['command']))
+        self.assertEqual(('profile selection', 'gateway'), (phase['name'], phase['args']['profile']))
+        self.assertEqual([], CommandTimings.records + Spans.records, msg='Events should be moved to the trace file')
+
+    def test_nested_processes_append_to_parent_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            start_trace(directory + '/trace.json')
+
+            subprocess.check_call([sys.executable, '-c', NESTED_PROCESS],
+                                  env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+            with span('gateway reload'):
+                pass
+
+            append_to_trace(directory + '/trace.json', ':harbor:upgrade')
+            events = read_trace(directory + '/trace.json')
+
+        self.assertEqual(['process_name', 'scale_up', 'process_name', 'gateway reload'],
+                         [event['name'] for event in events])
+        self.assertNotEqual(events[0]['pid'], events[2]['pid'])
+
+    def test_task_reports_commands_executed_by_sh(self):
+        out = self.execute_mocked_task_and_get_output(ShellTask(), args={'--timings': True, '--timings-trace': ''})
+
+        self.assertEqual('echo "Hello"', CommandTimings.records[-1].command)
+        self.assertIn('Slowest commands', out)
+        self.assertIn('echo "Hello"', out)
+
+    def test_task_phases_are_written_to_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.execute_mocked_task_and_get_output(ShellTask(), args={
+                '--timings': False, '--timings-trace': directory + '/trace.json'
+            })
+
+            events = {event['name']: event for event in read_trace(directory + '/trace.json')}
+
+        self.assertEqual(TASK, events[':test:shell']['cat'])
+        self.assertIn('.env validation', events)
+        self.assertIn('echo "Hello"', events)
+
+    def tearDown(self) -> None:
+        os.environ.pop(TRACE_FILE_ENV, None)
+        super().tearDown()